@@ -0,0 +1,152 @@
+import argparse
+import datetime
+import os
+
+from sqlalchemy import insert, select, func, literal, text, DateTime
+from sqlalchemy.orm import aliased
+
+import models, versioning, retrieval, jobs, metrics
+from database import SessionLocal
+
+# Hot/cold tiering. Closed and Resolved tickets untouched for ARCHIVE_AFTER_DAYS are
+# moved, with their resolution and history, from tickets/resolutions/ticket_events into
+# ticket_archive and ticket_event_archive (monthly range partitions on Postgres). Every
+# endpoint reads only the live tables unless called with include_archived=true, and
+# retrieval keeps using archived resolutions through per-department archive shards
+# that are only refit after an archival run.
+#
+# Each batch is a handful of INSERT ... SELECT / DELETE statements in one transaction.
+# The first ticket of an incident stays live while any ticket of that incident does.
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+
+ARCHIVABLE_STATUSES = (models.StatusEnum.Resolved, models.StatusEnum.Closed)
+
+def _last_activity():
+    return func.coalesce(models.Ticket.updated_at, models.Ticket.created_date)
+
+def _candidates(db, cutoff, after_id, limit):
+    # Returns (ids scanned, ids to move); keyset paging so pinned rows don't stall the scan
+    scanned = [ticket_id for (ticket_id,) in db.query(models.Ticket.id).filter(
+        models.Ticket.id > after_id,
+        models.Ticket.status.in_(ARCHIVABLE_STATUSES),
+        _last_activity() < cutoff,
+    ).order_by(models.Ticket.id).limit(limit)]
+    if not scanned:
+        return [], []
+    pinned = {incident_id for (incident_id,) in db.query(models.Ticket.incident_id).filter(
+        models.Ticket.incident_id.in_(scanned), models.Ticket.id.notin_(scanned)
+    ).distinct()}
+    return scanned, [ticket_id for ticket_id in scanned if ticket_id not in pinned]
+
+def _ensure_partitions(db, ids):
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    months = db.query(func.date_trunc("month", func.coalesce(models.Ticket.created_date, models.Ticket.updated_at))).filter(
+        models.Ticket.id.in_(ids)
+    ).distinct()
+    for (month,) in months:
+        following = (month + datetime.timedelta(days=32)).replace(day=1)
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {models.TicketArchive.__tablename__}_p{month:%Y%m} "
+            f"PARTITION OF {models.TicketArchive.__tablename__} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+        ))
+
+def _move(db, ids, now):
+    t, r, a = models.Ticket, models.Resolution, models.TicketArchive
+    # Tickets have at most one resolution, but don't let a stray duplicate break the key
+    other = aliased(r)
+    latest_resolution = select(func.max(other.id)).where(other.ticket_id == t.id).correlate(t).scalar_subquery()
+    columns = {
+        a.id: t.id,
+        a.created_date: func.coalesce(t.created_date, t.updated_at),
+        a.user_id: t.user_id,
+        a.description: t.description,
+        a.category: t.category,
+        a.priority: t.priority,
+        a.status: t.status,
+        a.updated_at: t.updated_at,
+        a.incident_id: t.incident_id,
+        a.escalation_count: func.coalesce(t.escalation_count, 0),
+        a.imported: t.imported,
+        a.resolution_id: r.id,
+        a.resolution_text: r.resolution_text,
+        a.resolved_date: r.resolved_date,
+        a.resolution_updated_at: r.updated_at,
+        a.archived_at: literal(now, DateTime),
+    }
+    db.execute(insert(a).from_select(
+        [col.name for col in columns],
+        select(*columns.values()).select_from(t).outerjoin(r, r.id == latest_resolution).where(t.id.in_(ids))
+    ))
+
+    e, ea = models.TicketEvent, models.TicketEventArchive
+    event_columns = ["id", "ticket_id", "type", "actor_id", "payload", "created_at"]
+    db.execute(insert(ea).from_select(
+        event_columns, select(*[getattr(e, name) for name in event_columns]).where(e.ticket_id.in_(ids))
+    ))
+
+    for model, column in ((e, e.ticket_id), (models.TicketCluster, models.TicketCluster.ticket_id), (r, r.ticket_id), (t, t.id)):
+        db.query(model).filter(column.in_(ids)).delete(synchronize_session=False)
+
+def run_archive(db, job=None, days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    if job is not None:
+        jobs.start(db, job)
+    after_id, moved = 0, 0
+    while True:
+        scanned, ids = _candidates(db, cutoff, after_id, batch_size)
+        if not scanned:
+            break
+        after_id = scanned[-1]
+        if ids:
+            user_ids = {uid for (uid,) in db.query(models.Ticket.user_id).filter(models.Ticket.id.in_(ids)).distinct()}
+            _ensure_partitions(db, ids)
+            # Logged while the rows still exist, so each live shard knows they left
+            retrieval.record_changes(db, ids)
+            _move(db, ids, datetime.datetime.utcnow())
+            versioning.bump(db, *user_ids)
+            versioning.bump_scopes(db, [retrieval.ARCHIVE_SCOPE])
+            moved += len(ids)
+        if job is not None:
+            job.processed += len(scanned)
+            job.succeeded += len(ids)
+        db.commit()
+    metrics.inc("archive.tickets_moved", moved)
+    if job is not None:
+        jobs.finish(db, job)
+    return moved
+
+def run_archive_job(job_id, days=ARCHIVE_AFTER_DAYS):
+    # Background-task entry point for the admin trigger endpoint
+    db = SessionLocal()
+    try:
+        job = db.query(models.Job).filter(models.Job.id == job_id).first()
+        try:
+            run_archive(db, job, days=days)
+        except Exception as e:
+            db.rollback()
+            jobs.add_errors(job, [{"error": str(e)}])
+            jobs.finish(db, job, models.JobStatusEnum.Failed)
+            print(f"Archive job {job_id} failed: {e}")
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old Closed/Resolved tickets into the archive tables")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        job = jobs.create(db, "archive")
+        moved = run_archive(db, job, days=args.days, batch_size=args.batch_size)
+        print(f"Archived {moved} tickets ({job.processed - job.succeeded} kept live as incident roots)")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
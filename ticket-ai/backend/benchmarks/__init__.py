@@ -0,0 +1 @@
+# Init file so benchmarks can be run as modules from backend/ (python -m benchmarks.<name>)
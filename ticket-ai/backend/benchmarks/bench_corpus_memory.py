@@ -0,0 +1,95 @@
+import argparse
+import ctypes
+import gc
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_search import sentence
+
+# Resident memory held by one retrieval shard after it is built, for the old layout
+# (a dict per record, a float64 matrix with int64-capable indices, an id -> row dict and
+# the vectorizer's stop_words_ set) against the current one (corpus.CorpusStore plus a
+# float32/int32 matrix). Each measurement runs in a fresh process. "retained" is the
+# RSS growth from just before the rows are generated to after the build, with the
+# loaded rows dropped; "live" is the same after malloc_trim, i.e. what the shard holds.
+
+def rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def legacy_build(records):
+    import numpy as np
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from retrieval import _document
+
+    vectorizer = TfidfVectorizer(stop_words='english', max_features=10000)
+    matrix = vectorizer.fit_transform([_document(r) for r in records])
+    return {
+        "vectorizer": vectorizer, "matrix": matrix, "records": records,
+        "alive": np.ones(len(records), dtype=bool),
+        "row_of": {r["id"]: row for row, r in enumerate(records)},
+    }
+
+def compact_build(records):
+    from retrieval import RetrievalIndex
+
+    return RetrievalIndex().build(records)
+
+def child(layout, rows):
+    import numpy as np, scipy.sparse, sklearn.feature_extraction.text  # noqa: F401 (keep imports out of the measurement)
+    import retrieval  # noqa: F401
+
+    random.seed(42)
+    gc.collect()
+    before = rss_bytes()
+    records = [{"id": i, "description": sentence(12), "resolution_text": sentence(20)} for i in range(1, rows + 1)]
+    loaded = rss_bytes() - before
+
+    start = time.perf_counter()
+    index = (legacy_build if layout == "legacy" else compact_build)(records)
+    build_s = time.perf_counter() - start
+    del records
+    gc.collect()
+
+    retained = rss_bytes() - before
+    # Heap freed by the fit that malloc hasn't handed back to the OS yet; trimming it
+    # leaves what the shard itself keeps alive
+    ctypes.CDLL("libc.so.6").malloc_trim(0)
+
+    matrix = index["matrix"] if layout == "legacy" else index.matrix
+    print(json.dumps({
+        "layout": layout, "rows": rows,
+        "loaded_mb": loaded / 2 ** 20,
+        "retained_mb": retained / 2 ** 20,
+        "live_mb": (rss_bytes() - before) / 2 ** 20,
+        "matrix_mb": (matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) / 2 ** 20,
+        "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10,
+        "build_s": build_s,
+    }))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--child", nargs=2, metavar=("LAYOUT", "ROWS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child[0], int(args.child[1]))
+
+    print(f"{'rows':>9} {'layout':<8} {'retained':>10} {'live':>10} {'matrix':>9} {'peak RSS':>10} {'build':>8}")
+    for rows in args.rows:
+        for layout in ("legacy", "compact"):
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_corpus_memory", "--child", layout, str(rows)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"{rows:>9} {layout:<8} {r['retained_mb']:7.0f} MB {r['live_mb']:7.0f} MB {r['matrix_mb']:6.0f} MB "
+                  f"{r['peak_mb']:7.0f} MB {r['build_s']:6.1f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Import-time report for the API entry point, based on `python -X importtime`. Shows the
+# slowest modules pulled in by `import main` and fails (exit status 1) when a heavy
+# dependency that should only load on first use shows up, or when the total goes over
+# --budget-ms, so cold-start regressions get caught.
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded lazily by retrieval/dedup/clustering/export/nlp_engine; never at API import time
+LAZY_MODULES = ("numpy", "pandas", "scipy", "sklearn", "groq", "pyarrow")
+
+def import_times(module):
+    # One subprocess per run so nothing is already cached in sys.modules
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.repeat)]
+    # The top-level module's cumulative time is the whole import; keep the fastest run
+    rows = min(runs, key=lambda r: next(c for name, _, c in r if name.strip() == args.module))
+    total_ms = next(c for name, _, c in rows if name.strip() == args.module) / 1000
+
+    print(f"import {args.module}: {total_ms:.0f} ms (best of {args.repeat})")
+    print(f"{'cumulative':>12} {'self':>9}  module")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:9.1f} ms {self_us / 1000:6.1f} ms  {name}")
+
+    loaded = sorted({name.strip().split(".")[0] for name, _, _ in rows} & set(LAZY_MODULES))
+    failed = False
+    if loaded:
+        print(f"FAIL: heavy modules imported eagerly: {', '.join(loaded)}")
+        failed = True
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"FAIL: import took {total_ms:.0f} ms, budget is {args.budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import argparse
+import statistics
+
+import prompt_builder
+from retrieval import RetrievalIndex
+from seed_db import historical_data
+
+# Estimated prompt size and requested output budget per suggestion request, before
+# (5 matches pasted verbatim into the old single-message prompt, max_tokens=1024) and
+# after prompt_builder, over seed_db's history with its "(Instance N)" clones.
+
+LEGACY_MAX_TOKENS = 1024
+
+LEGACY_TEMPLATE = """
+You are an expert customer support AI agent. A user has submitted a new support issue.
+Below are some top historical resolutions for similar issues retrieved from our database using TF-IDF similarity.
+
+New User Issue: "{issue}"
+
+Historical Resolutions:
+{context}
+
+Your task is to review these historical resolutions. If the historical resolutions are strongly relevant, synthesize them into 5 actionable steps.
+HOWEVER, if the historical resolutions are missing, or seem completely irrelevant to the User's Issue, YOU MUST completely ignore them and brainstorm exactly 5 highly relevant, dynamic, and unique troubleshooting steps based on your expert IT knowledge. Provide fresh and specific steps!
+
+Return your output STRICTLY as a valid JSON array of 5 plain strings. Do NOT include markdown, metrics, or anything else outside the JSON block.
+
+Example output format only:
+[
+  "First unique troubleshooting step",
+  "Second unique troubleshooting step",
+  ...
+]
+"""
+
+def legacy_prompt(issue, matches):
+    context = "\n".join(
+        f"- Suggestion (Similarity: {score:.4f}): {record['resolution_text']}"
+        for score, record in matches if score >= prompt_builder.MIN_CONTEXT_SCORE
+    ) or "No previous organic resolutions available."
+    return LEGACY_TEMPLATE.format(issue=issue, context=context)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    records = [
+        {"id": i, "description": description, "resolution_text": resolution}
+        for i, (description, _, resolution) in enumerate(historical_data)
+    ]
+    index = RetrievalIndex().build(records)
+    queries = sorted({description.split(" (Instance")[0] for description, _, _ in historical_data})
+
+    before, after, distinct = [], [], []
+    for query in queries:
+        matches = index.search(query, top_k=args.top_k)
+        before.append(prompt_builder.estimate_tokens(legacy_prompt(query, matches)) + prompt_builder.MESSAGE_OVERHEAD)
+        _, stats = prompt_builder.build_messages(query, matches)
+        after.append(stats["prompt_tokens"])
+        distinct.append(stats["resolutions_distinct"])
+
+    print(f"{len(queries)} queries over {len(records)} historical tickets, top {args.top_k} matches")
+    print(f"{'':<28} {'before':>8} {'after':>8}")
+    print(f"{'prompt tokens (mean)':<28} {statistics.mean(before):8.0f} {statistics.mean(after):8.0f}")
+    print(f"{'prompt tokens (max)':<28} {max(before):8d} {max(after):8d}")
+    print(f"{'resolutions in context':<28} {args.top_k:8d} {statistics.mean(distinct):8.1f}")
+    print(f"{'max output tokens':<28} {LEGACY_MAX_TOKENS:8d} {prompt_builder.PROMPT_MAX_OUTPUT_TOKENS:8d}")
+    print(f"system prefix ({prompt_builder.system_tokens()} tokens) is identical on every request")
+
+if __name__ == "__main__":
+    main()
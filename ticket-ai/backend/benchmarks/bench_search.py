@@ -0,0 +1,110 @@
+import argparse
+import datetime
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+import models, search
+from database import Base
+
+# Query latency of the full-text search endpoint's query (search.search_tickets) against
+# a LIKE scan over the same rows. Loads a synthetic corpus into a scratch SQLite file by
+# default; pass --database-url to run against an (empty) Postgres database instead.
+
+# Real ticket text has a long-tailed vocabulary: a few words are everywhere, most are
+# rare. Filler words are drawn Zipf-style from a synthetic vocabulary, and each IT term
+# shows up in roughly 1 in 200 tickets, so queries match a realistic fraction of rows.
+WORDS = ("vpn outlook printer password reset driver network access license sap teams crash "
+         "wifi laptop monitor docking keyboard token expired mailbox sync disk full slow").split()
+SYLLABLES = "ka lo mi ne ru sa ti vo ze pa qu bri dan fel gor hu".split()
+VOCABULARY = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+ZIPF_CUM_WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(VOCABULARY))))
+TERM_RATE = 1 / 200
+
+def sentence(k):
+    words = random.choices(VOCABULARY, cum_weights=ZIPF_CUM_WEIGHTS, k=k)
+    words += [w for w in WORDS if random.random() < TERM_RATE]
+    random.shuffle(words)
+    return " ".join(words)
+
+QUERIES = [
+    ("single term", "printer", ()),
+    ("two terms", "vpn crash", ()),
+    ("prefix", "pass*", ()),
+    ("term + filters", "mailbox sync", (models.Ticket.status == models.StatusEnum.Open,
+                                        models.Ticket.category == models.CategoryEnum.Application)),
+]
+
+def load(engine, n, batch=50_000):
+    now = datetime.datetime.utcnow()
+    user = {"name": "bench", "email": "bench@example.com", "hashed_password": "x", "department": "IT"}
+    with engine.begin() as conn:
+        conn.execute(insert(models.User.__table__), [user])
+    for start in range(0, n, batch):
+        tickets, resolutions = [], []
+        for i in range(start + 1, min(n, start + batch) + 1):
+            tickets.append({
+                "id": i, "user_id": 1,
+                "description": sentence(12),
+                "category": random.choice(list(models.CategoryEnum)).name,
+                "priority": random.choice(list(models.PriorityEnum)).name,
+                "status": random.choice(list(models.StatusEnum)).name,
+                "created_date": now - datetime.timedelta(minutes=i),
+                "escalation_count": 0,
+            })
+            resolutions.append({"ticket_id": i, "resolution_text": sentence(20)})
+        with engine.begin() as conn:
+            conn.execute(insert(models.Ticket.__table__), tickets)
+            conn.execute(insert(models.Resolution.__table__), resolutions)
+
+def like_scan(db, q, criteria, limit=50):
+    # What the dashboard would need without a text index
+    words = [word for word, _ in search.parse_terms(q)]
+    query = db.query(*search.RESULT_COLUMNS).outerjoin(
+        models.Resolution, models.Resolution.ticket_id == models.Ticket.id
+    )
+    for word in words:
+        query = query.filter(models.Ticket.description.ilike(f"%{word}%") | models.Resolution.resolution_text.ilike(f"%{word}%"))
+    return query.filter(*criteria).order_by(models.Ticket.id.desc()).limit(limit).all()
+
+def timed(fn, repeat):
+    fn()  # warm the page cache
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-search-'), 'search.db')}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+
+    random.seed(42)
+    start = time.perf_counter()
+    load(engine, args.tickets)
+    print(f"loaded {args.tickets} tickets (index maintained by triggers/generated columns) in {time.perf_counter() - start:.1f} s")
+
+    db = sessionmaker(bind=engine)()
+    print(f"{'query':<16} {'full-text':>12} {'LIKE scan':>12}")
+    for label, q, criteria in QUERIES:
+        fts_ms = timed(lambda: search.search_tickets(db, q, criteria), args.repeat)
+        like_ms = timed(lambda: like_scan(db, q, criteria), args.repeat if args.tickets <= 200_000 else 1)
+        print(f"{label:<16} {fts_ms:9.1f} ms {like_ms:9.1f} ms")
+    db.close()
+
+if __name__ == "__main__":
+    main()
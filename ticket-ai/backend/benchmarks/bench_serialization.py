@@ -0,0 +1,81 @@
+import argparse
+import datetime
+import gzip
+import json
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+import models, schemas, serialization
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Compares the old list path (Pydantic validation per ORM row + stdlib json) with the
+# validation-free orjson path, and reports bytes on the wire with and without compression.
+
+WORDS = "vpn outlook printer password reset driver network access license sap teams crash wifi".split()
+
+def make_tickets(n):
+    now = datetime.datetime.utcnow()
+    tickets = []
+    for i in range(n):
+        created = now - datetime.timedelta(minutes=i)
+        ticket = models.Ticket(
+            id=i + 1,
+            user_id=random.randint(1, 500),
+            description=" ".join(random.choices(WORDS, k=60)),
+            category=random.choice(list(models.CategoryEnum)),
+            priority=random.choice(list(models.PriorityEnum)),
+            status=random.choice(list(models.StatusEnum)),
+            created_date=created,
+        )
+        ticket.resolution = models.Resolution(
+            id=i + 1,
+            ticket_id=i + 1,
+            resolution_text=json.dumps([" ".join(random.choices(WORDS, k=15)) for _ in range(5)]),
+            resolved_date=created + datetime.timedelta(hours=2),
+        )
+        tickets.append(ticket)
+    return tickets
+
+def before(tickets):
+    validated = [schemas.TicketResponse.model_validate(t) for t in tickets]
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+def after(tickets):
+    return serialization.ORJSONResponse([serialization.ticket_to_dict(t) for t in tickets]).body
+
+def timed(fn, tickets, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn(tickets)
+        best = min(best, time.perf_counter() - start)
+    return best, body
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    random.seed(42)
+    tickets = make_tickets(args.tickets)
+
+    for label, fn in (("pydantic + json", before), ("orjson fast path", after)):
+        seconds, body = timed(fn, tickets, args.repeat)
+        print(f"{label:<18} {seconds * 1000:8.1f} ms  {len(body) / 1024:9.1f} KiB raw")
+
+    _, body = timed(after, tickets, 1)
+    print(f"{'gzip (level 6)':<18} {'':>11}  {len(gzip.compress(body, 6)) / 1024:9.1f} KiB")
+    if brotli is not None:
+        print(f"{'brotli (q 4)':<18} {'':>11}  {len(brotli.compress(body, quality=4)) / 1024:9.1f} KiB")
+    else:
+        print("brotli not installed, skipping")
+
+if __name__ == "__main__":
+    main()
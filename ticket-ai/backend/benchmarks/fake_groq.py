@@ -0,0 +1,116 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from collections import Counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Local stand-in for the Groq chat-completions API, for load tests that shouldn't spend
+# real quota (or be limited by it). Answers POST /openai/v1/chat/completions like Groq
+# does, after a latency drawn from a configurable distribution, and fails a
+# configurable share of requests with 429 / 5xx. Point the API at it with
+#   GROQ_BASE_URL=http://127.0.0.1:9000 GROQ_API_KEY=fake uvicorn main:app
+#
+# Latency specs (milliseconds):
+#   fixed:300              always 300 ms
+#   uniform:200:1200       uniform between 200 and 1200 ms
+#   lognormal:800:0.5      median 800 ms, sigma 0.5 (long right tail, like real LLM calls)
+
+STEPS = [
+    "Restart the affected application and sign in again",
+    "Clear the local cache and temporary files for the application",
+    "Check network connectivity and VPN status",
+    "Verify the account has the required access in the admin portal",
+    "Reinstall or update the client to the latest version",
+]
+
+def parse_latency(spec):
+    kind, *params = spec.split(":")
+    params = [float(p) for p in params]
+    if kind == "fixed" and len(params) == 1:
+        return lambda: params[0] / 1000
+    if kind == "uniform" and len(params) == 2:
+        return lambda: random.uniform(*params) / 1000
+    if kind == "lognormal" and len(params) == 2:
+        return lambda: random.lognormvariate(math.log(params[0]), params[1]) / 1000
+    raise ValueError(f"bad latency spec {spec!r}; use fixed:MS, uniform:MIN:MAX or lognormal:MEDIAN:SIGMA")
+
+def _error(status, message, kind):
+    headers = {"retry-after": "1"} if status == 429 else None
+    return JSONResponse({"error": {"message": message, "type": kind}}, status_code=status, headers=headers)
+
+def create_app(latency="lognormal:800:0.5", error_rate=0.0, rate_limit_rate=0.0, seed=None):
+    sample_latency = parse_latency(latency)
+    rng = random.Random(seed)
+    app = FastAPI(title="Fake Groq")
+    app.state.stats = Counter()
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats = app.state.stats
+        stats["requests"] += 1
+        await asyncio.sleep(sample_latency())
+
+        roll = rng.random()
+        if roll < rate_limit_rate:
+            stats["429"] += 1
+            return _error(429, "Rate limit reached (fake)", "rate_limit_exceeded")
+        if roll < rate_limit_rate + error_rate:
+            status = rng.choice([500, 503])
+            stats[str(status)] += 1
+            return _error(status, "Upstream error (fake)", "server_error")
+
+        stats["200"] += 1
+        steps = rng.sample(STEPS, k=len(STEPS))
+        # JSON mode answers with an object, like the real API
+        json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+        content = json.dumps({"steps": steps} if json_mode else steps)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @app.get("/stats")
+    def stats():
+        return dict(app.state.stats)
+
+    return app
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", default="lognormal:800:0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests failing with 500/503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests failing with 429")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    parse_latency(args.latency)
+
+    app = create_app(args.latency, args.error_rate, args.rate_limit_rate, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+import argparse
+import asyncio
+import base64
+import json
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+
+import httpx
+
+# End-to-end load generator for a running API (uvicorn main:app, any number of workers).
+# Virtual users (VUs) loop over scenarios that issue the same requests as the Streamlit
+# pages, with think time in between. The number of VUs follows a ramp profile: each
+# stage moves linearly from the previous stage's VU count to its own over its duration
+# (k6 style), so "10:30,50:60,50:60" ramps to 10, ramps to 50, then holds 50.
+#
+# Run the API against benchmarks/fake_groq.py so raising tickets exercises the LLM path
+# without real quota:
+#   python -m benchmarks.fake_groq --latency lognormal:800:0.5 --error-rate 0.01 &
+#   GROQ_BASE_URL=http://127.0.0.1:9000 GROQ_API_KEY=fake uvicorn main:app --workers 4 &
+#   python -m benchmarks.load_test --stages 10:30,50:60,100:60 --out load.json
+#
+# Prints a per-stage summary to stderr and writes a JSON report: per-route throughput,
+# latency percentiles, status counts and error rates, overall and per stage. The
+# saturation stage is the first one where adding VUs stopped adding throughput.
+
+DESCRIPTIONS = [
+    "Cannot connect to the corporate VPN from home",
+    "Outlook keeps asking for my password",
+    "Printer on floor 2 shows offline",
+    "SAP transaction times out when posting invoices",
+    "Need access to the finance shared drive",
+    "Teams crashes when sharing my screen",
+    "Laptop does not detect the docking station monitors",
+    "GitHub organization access request for new repo",
+    "Wifi drops every few minutes in meeting rooms",
+    "Password reset link expired before I could use it",
+]
+CATEGORIES = ["Login", "Network", "Application", "Access"]
+PRIORITIES = ["Low", "Medium", "High"]
+DEPARTMENTS = ["IT", "Finance", "Engineering", "HR", "Sales"]
+
+DEFAULT_MIX = "track_page=6,user_session=1,admin_dashboard=2,analytics=1"
+
+# A stage is still scaling while its relative throughput growth is at least this share
+# of its relative VU growth
+SATURATION_GAIN = 0.1
+
+def parse_stages(spec):
+    stages = []
+    for part in spec.split(","):
+        users, seconds = part.split(":")
+        stages.append((int(users), float(seconds)))
+    return stages
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, weight = part.split("=")
+        if name not in SCENARIOS:
+            raise ValueError(f"unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight)
+    return mix
+
+def _percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def _latency_summary(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    return {
+        "p50_ms": round(_percentile(ordered, 0.50) * 1000, 1),
+        "p90_ms": round(_percentile(ordered, 0.90) * 1000, 1),
+        "p95_ms": round(_percentile(ordered, 0.95) * 1000, 1),
+        "p99_ms": round(_percentile(ordered, 0.99) * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+class Recorder:
+    def __init__(self):
+        self.stage = 0
+        self.latencies = defaultdict(list)   # (stage, route) -> seconds
+        self.statuses = defaultdict(Counter)  # (stage, route) -> status -> count
+        self.errors = Counter()               # (stage, route) -> count
+
+    def record(self, route, seconds, status, ok):
+        key = (self.stage, route)
+        self.latencies[key].append(seconds)
+        self.statuses[key][str(status)] += 1
+        if not ok:
+            self.errors[key] += 1
+
+    def _summary(self, keys, seconds):
+        samples = [s for key in keys for s in self.latencies[key]]
+        errors = sum(self.errors[key] for key in keys)
+        statuses = Counter()
+        for key in keys:
+            statuses.update(self.statuses[key])
+        return {
+            "requests": len(samples),
+            "throughput_rps": round(len(samples) / seconds, 2) if seconds else 0.0,
+            "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+            **_latency_summary(samples),
+            "statuses": dict(statuses),
+        }
+
+    def report(self, stages, stage_seconds):
+        total_seconds = sum(stage_seconds)
+        keys = list(self.latencies)
+        routes = sorted({route for _, route in keys})
+        report = {
+            "duration_s": round(total_seconds, 1),
+            "totals": self._summary(keys, total_seconds),
+            "routes": {
+                route: self._summary([k for k in keys if k[1] == route], total_seconds) for route in routes
+            },
+            "stages": [
+                {
+                    "stage": n,
+                    "target_users": users,
+                    "duration_s": round(stage_seconds[n], 1),
+                    **self._summary([k for k in keys if k[0] == n], stage_seconds[n]),
+                    "routes": {
+                        route: self._summary([(n, route)], stage_seconds[n])
+                        for route in routes if (n, route) in self.latencies
+                    },
+                }
+                for n, (users, _) in enumerate(stages)
+            ],
+        }
+        report["saturation_stage"] = saturation_stage(report["stages"])
+        return report
+
+def saturation_stage(stages):
+    # First stage with more VUs than the one before whose throughput grew by less than
+    # SATURATION_GAIN of the VU increase (relative), or whose error rate jumped
+    for prev, cur in zip(stages, stages[1:]):
+        if cur["target_users"] <= prev["target_users"] or not prev["throughput_rps"]:
+            continue
+        user_growth = cur["target_users"] / prev["target_users"] - 1
+        throughput_growth = cur["throughput_rps"] / prev["throughput_rps"] - 1
+        if throughput_growth < SATURATION_GAIN * user_growth or cur["error_rate"] > max(0.05, 2 * prev["error_rate"]):
+            return cur["stage"]
+    return None
+
+def _user_id(token):
+    # The id claim of our own JWT; no need to verify it on the client
+    payload = token.split(".")[1]
+    return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))["id"]
+
+class VirtualUser:
+    def __init__(self, client, recorder, accounts, rng):
+        self.client = client
+        self.recorder = recorder
+        self.accounts = accounts
+        self.rng = rng
+        self.tokens = {}
+        self.etags = {}
+
+    async def request(self, route, method, url, expect=(200,), token=None, **kwargs):
+        headers = kwargs.pop("headers", {})
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        start = time.perf_counter()
+        try:
+            res = await self.client.request(method, url, headers=headers, **kwargs)
+            status = res.status_code
+        except httpx.HTTPError as e:
+            res, status = None, type(e).__name__
+        ok = status in expect
+        self.recorder.record(route, time.perf_counter() - start, status, ok)
+        return res if ok else None
+
+    async def login(self, role, force=False):
+        if role in self.tokens and not force:
+            return self.tokens[role]
+        email, password = self.accounts[role]
+        res = await self.request("POST /login", "POST", "/login", data={"username": email, "password": password})
+        if res is None:
+            return None
+        self.tokens[role] = res.json()["access_token"]
+        return self.tokens[role]
+
+    async def conditional_get(self, route, url, token, **kwargs):
+        # Same If-None-Match polling as the frontend's get_json_cached
+        headers = {"If-None-Match": self.etags[url]} if url in self.etags else {}
+        res = await self.request(route, "GET", url, expect=(200, 304), token=token, headers=headers, **kwargs)
+        if res is not None and res.status_code == 200 and "ETag" in res.headers:
+            self.etags[url] = res.headers["ETag"]
+        return res
+
+    # Scenarios
+
+    async def user_session(self):
+        # Submit Ticket page: log in, raise a ticket, watch it on Track Tickets, then pick a fix
+        token = await self.login("user", force=True)
+        if token is None:
+            return
+        res = await self.request("POST /tickets/", "POST", "/tickets/", token=token, json={
+            "description": self.rng.choice(DESCRIPTIONS),
+            "category": self.rng.choice(CATEGORIES),
+            "priority": self.rng.choice(PRIORITIES),
+        })
+        if res is None:
+            return
+        data = res.json()
+        for _ in range(3):
+            await self.conditional_get("GET /tickets/user/{id}", f"/tickets/user/{_user_id(token)}", token)
+        try:
+            suggestions = json.loads(data["ai_resolution"])
+        except (TypeError, ValueError):
+            suggestions = []
+        ticket_id = data["ticket"]["id"]
+        if suggestions and self.rng.random() < 0.7:
+            await self.request("PUT /tickets/{id}/resolve", "PUT", f"/tickets/{ticket_id}/resolve", token=token,
+                               params={"resolution_text": f"Selected AI Fix: {suggestions[0]}"})
+        elif self.rng.random() < 0.5:
+            await self.request("PUT /tickets/{id}/escalate", "PUT", f"/tickets/{ticket_id}/escalate", token=token)
+
+    async def track_page(self):
+        token = await self.login("user")
+        if token is not None:
+            await self.conditional_get("GET /tickets/user/{id}", f"/tickets/user/{_user_id(token)}", token)
+
+    async def admin_dashboard(self):
+        token = await self.login("admin")
+        if token is None:
+            return
+        await self.conditional_get("GET /admin/tickets", "/admin/tickets?fields=summary", token)
+        await self.request("GET /admin/users", "GET", "/admin/users", token=token)
+        await self.request("GET /admin/incidents", "GET", "/admin/incidents", token=token)
+        await self.request("GET /admin/metrics", "GET", "/admin/metrics", token=token)
+
+    async def analytics(self):
+        token = await self.login("admin")
+        if token is None:
+            return
+        await self.conditional_get("GET /admin/tickets", "/admin/tickets?fields=summary", token)
+        await self.request("GET /admin/analytics", "GET", "/admin/analytics", token=token)
+        await self.request("GET /admin/analytics/clusters", "GET", "/admin/analytics/clusters", token=token)
+
+    async def run(self, mix, think_seconds, stop):
+        names, weights = list(mix), list(mix.values())
+        while not stop.is_set():
+            await getattr(self, self.rng.choices(names, weights)[0])()
+            try:
+                await asyncio.wait_for(stop.wait(), self.rng.expovariate(1 / think_seconds) if think_seconds else 0)
+            except asyncio.TimeoutError:
+                pass
+
+SCENARIOS = ("user_session", "track_page", "admin_dashboard", "analytics")
+
+async def create_accounts(client, n_users, n_admins, password):
+    # Idempotent: "Email already registered" is fine on a second run
+    accounts = []
+    for role, n in (("user", n_users), ("admin", n_admins)):
+        for i in range(n):
+            email = f"loadtest-{role}-{i}@example.com"
+            res = await client.post("/signup", json={
+                "name": f"loadtest {role} {i}", "email": email, "password": password,
+                "role": role, "department": DEPARTMENTS[i % len(DEPARTMENTS)],
+            })
+            if res.status_code not in (200, 400):
+                raise SystemExit(f"signup failed for {email}: {res.status_code} {res.text}")
+            accounts.append((role, email))
+    return accounts
+
+async def run_load(args):
+    stages = parse_stages(args.stages)
+    mix = parse_mix(args.mix)
+    limits = httpx.Limits(max_connections=max(users for users, _ in stages) + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        accounts = await create_accounts(client, args.users, args.admins, args.password)
+        users = [email for role, email in accounts if role == "user"]
+        admins = [email for role, email in accounts if role == "admin"]
+
+        recorder = Recorder()
+        running = []  # (task, stop event)
+        stage_seconds = []
+        previous = 0
+        for n, (target, duration) in enumerate(stages):
+            recorder.stage = n
+            start = time.monotonic()
+            while (elapsed := time.monotonic() - start) < duration:
+                want = round(previous + (target - previous) * min(1.0, elapsed / duration))
+                while len(running) < want:
+                    i = len(running)
+                    rng = random.Random(args.seed * 100_003 + i if args.seed is not None else None)
+                    vu = VirtualUser(client, recorder, {
+                        "user": (users[i % len(users)], args.password),
+                        "admin": (admins[i % len(admins)], args.password),
+                    }, rng)
+                    stop = asyncio.Event()
+                    running.append((asyncio.create_task(vu.run(mix, args.think, stop)), stop))
+                while len(running) > want:
+                    running.pop()[1].set()
+                await asyncio.sleep(0.2)
+            stage_seconds.append(time.monotonic() - start)
+            previous = target
+            summary = recorder._summary([k for k in recorder.latencies if k[0] == n], stage_seconds[-1])
+            print(f"stage {n}: {target:>4} VUs  {summary['throughput_rps']:8.1f} req/s  "
+                  f"p95 {summary.get('p95_ms', 0):8.1f} ms  errors {summary['error_rate']:.2%}", file=sys.stderr)
+
+        for _, stop in running:
+            stop.set()
+        await asyncio.gather(*(task for task, _ in running), return_exceptions=True)
+
+    report = recorder.report(stages, stage_seconds)
+    report["config"] = {
+        "base_url": args.base_url, "stages": args.stages, "mix": mix, "think_s": args.think,
+        "users": args.users, "admins": args.admins,
+    }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--stages", default="10:30,25:30,50:30,100:30", help="USERS:SECONDS,... ramp profile")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario=weight,...")
+    parser.add_argument("--think", type=float, default=1.0, help="mean think time between scenarios (s)")
+    parser.add_argument("--users", type=int, default=50, help="user accounts to create/reuse")
+    parser.add_argument("--admins", type=int, default=5, help="admin accounts to create/reuse")
+    parser.add_argument("--password", default="loadtest123")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", default=None, help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load(args))
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import json
+import threading
+from collections import deque
+
+from fastapi import FastAPI, HTTPException, Request
+
+import tracing
+
+# Local stand-in for a trace collector. The API and the Streamlit frontend POST
+# finished spans to it (TRACE_EXPORT=http://127.0.0.1:4319/spans); it keeps the most
+# recent spans in memory, optionally appends them to a file, and answers
+#   GET /traces?limit=20     slowest traces first, with the self time per span kind
+#   GET /traces/{trace_id}   every span of one trace, in start order
+# It can also summarize a span file written with TRACE_EXPORT=file:...:
+#   python -m benchmarks.trace_collector --summarize traces.jsonl
+
+MAX_SPANS = 200_000
+
+def create_app(out=None, max_spans=MAX_SPANS):
+    app = FastAPI(title="Trace collector stand-in")
+    spans = deque(maxlen=max_spans)
+    lock = threading.Lock()
+
+    @app.post("/spans")
+    async def receive(request: Request):
+        batch = await request.json()
+        with lock:
+            spans.extend(batch)
+            if out:
+                with open(out, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(s) + "\n" for s in batch))
+        return {"accepted": len(batch)}
+
+    @app.get("/traces")
+    def traces(limit: int = 20):
+        with lock:
+            snapshot = list(spans)
+        return tracing.summarize(snapshot)[:limit]
+
+    @app.get("/traces/{trace_id}")
+    def trace(trace_id: str):
+        with lock:
+            members = sorted((s for s in spans if s["trace_id"] == trace_id), key=lambda s: s["start_ns"])
+        if not members:
+            raise HTTPException(status_code=404, detail="Unknown trace")
+        return members
+
+    return app
+
+def print_summary(path, limit):
+    with open(path, encoding="utf-8") as f:
+        spans = [json.loads(line) for line in f if line.strip()]
+    for t in tracing.summarize(spans)[:limit]:
+        top = ", ".join(f"{kind} {ms:.0f} ms" for kind, ms in list(t["self_time_ms"].items())[:5])
+        print(f"{t['duration_ms']:9.1f} ms  {t['root']:<40} {t['trace_id']}  [{top}]")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4319)
+    parser.add_argument("--out", help="also append received spans to this file")
+    parser.add_argument("--summarize", metavar="FILE", help="print the slowest traces in a span file and exit")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.summarize:
+        return print_summary(args.summarize, args.limit)
+
+    import uvicorn
+    uvicorn.run(create_app(args.out), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
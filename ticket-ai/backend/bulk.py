@@ -0,0 +1,153 @@
+import datetime
+import os
+
+from sqlalchemy import update
+
+import models, versioning, retrieval, dedup, events, fixes, pubsub
+
+# Set-based implementation of POST /admin/tickets/bulk. The target rows are read once,
+# then each action is a handful of UPDATE/INSERT statements over all eligible ids in a
+# single transaction, instead of one lookup + commit per ticket.
+
+BULK_MAX_TICKETS = int(os.getenv("BULK_MAX_TICKETS", "5000"))
+
+CLOSED_STATUSES = (models.StatusEnum.Resolved, models.StatusEnum.Closed)
+
+class TooManyTickets(Exception):
+    pass
+
+def filter_criteria(f):
+    criteria = []
+    if f.status is not None:
+        criteria.append(models.Ticket.status == f.status)
+    if f.category is not None:
+        criteria.append(models.Ticket.category == f.category)
+    if f.priority is not None:
+        criteria.append(models.Ticket.priority == f.priority)
+    if f.user_id is not None:
+        criteria.append(models.Ticket.user_id == f.user_id)
+    if f.incident_id is not None:
+        criteria.append((models.Ticket.incident_id == f.incident_id) | (models.Ticket.id == f.incident_id))
+    if f.created_after is not None:
+        criteria.append(models.Ticket.created_date >= f.created_after)
+    if f.created_before is not None:
+        criteria.append(models.Ticket.created_date < f.created_before)
+    return criteria
+
+def _load_targets(db, request):
+    query = db.query(
+        models.Ticket.id, models.Ticket.user_id, models.Ticket.status, models.Ticket.incident_id,
+        models.Ticket.escalation_count, models.Ticket.escalated_at, models.Resolution.resolution_text
+    ).outerjoin(models.Resolution, models.Resolution.ticket_id == models.Ticket.id)
+    if request.ids is not None:
+        query = query.filter(models.Ticket.id.in_(request.ids))
+    else:
+        query = query.filter(*filter_criteria(request.filter))
+    rows = query.order_by(models.Ticket.id).limit(BULK_MAX_TICKETS + 1).all()
+    if len(rows) > BULK_MAX_TICKETS:
+        raise TooManyTickets(f"Bulk operations are limited to {BULK_MAX_TICKETS} tickets")
+    return rows
+
+def _skip_reason(request, row):
+    # Mirrors the checks of the single-ticket endpoints
+    if request.action == "resolve" and row.status == models.StatusEnum.Resolved:
+        return "Ticket already resolved"
+    if request.action == "status" and row.status == request.status:
+        return f"Ticket already {request.status.value}"
+    return None
+
+def _set_status(db, rows, status, actor_id):
+    ids = [r.id for r in rows]
+    values = {models.Ticket.status: status, models.Ticket.updated_at: datetime.datetime.utcnow()}
+    if status in CLOSED_STATUSES:
+        values[models.Ticket.escalated_at] = None
+    db.execute(update(models.Ticket).where(models.Ticket.id.in_(ids)).values(values))
+    events.record_many(db, models.EventTypeEnum.status_changed, actor_id, {
+        r.id: {"from": r.status.value, "to": status.value} for r in rows
+    })
+    if status in CLOSED_STATUSES:
+        retrieval.record_changes(db, [r.id for r in rows if r.escalated_at])
+
+def _resolve(db, rows, resolution_text, actor_id):
+    # Admin bulk closes aren't user confirmations, so they don't count towards proven fixes
+    now = datetime.datetime.utcnow()
+    ids = [r.id for r in rows]
+    db.execute(update(models.Ticket).where(models.Ticket.id.in_(ids)).values({
+        models.Ticket.status: models.StatusEnum.Resolved,
+        models.Ticket.escalated_at: None,
+        models.Ticket.updated_at: now,
+    }))
+    with_resolution = [r.id for r in rows if r.resolution_text is not None]
+    if with_resolution:
+        db.execute(update(models.Resolution).where(models.Resolution.ticket_id.in_(with_resolution)).values({
+            models.Resolution.resolution_text: resolution_text,
+            models.Resolution.updated_at: now,
+        }))
+    missing = [r.id for r in rows if r.resolution_text is None]
+    if missing:
+        db.execute(models.Resolution.__table__.insert(), [
+            {"ticket_id": ticket_id, "resolution_text": resolution_text, "resolved_date": now, "updated_at": now}
+            for ticket_id in missing
+        ])
+    events.record_many(db, models.EventTypeEnum.resolved, actor_id, {r.id: {"text": resolution_text} for r in rows})
+    retrieval.record_changes(db, ids)
+
+def _escalate(db, rows, actor_id):
+    now = datetime.datetime.utcnow()
+    ids = [r.id for r in rows]
+    db.execute(update(models.Ticket).where(models.Ticket.id.in_(ids)).values({
+        models.Ticket.priority: models.PriorityEnum.High,
+        models.Ticket.status: models.StatusEnum.Open,
+        models.Ticket.escalation_count: models.Ticket.escalation_count + 1,
+        models.Ticket.escalated_at: now,
+        models.Ticket.updated_at: now,
+    }))
+    fixes.record_escalations(db, [r.resolution_text for r in rows if r.resolution_text and not r.escalation_count])
+    events.record_many(db, models.EventTypeEnum.escalated, actor_id, {
+        r.id: {"count": (r.escalation_count or 0) + 1} for r in rows
+    })
+    retrieval.record_changes(db, ids)
+
+def run(db, request, actor_id):
+    rows = _load_targets(db, request)
+    found = {r.id for r in rows}
+
+    outcomes, eligible = [], []
+    for row in rows:
+        reason = _skip_reason(request, row)
+        if reason:
+            outcomes.append({"id": row.id, "outcome": "skipped", "detail": reason})
+        else:
+            eligible.append(row)
+            outcomes.append({"id": row.id, "outcome": "would_update" if request.dry_run else "updated"})
+    for ticket_id in sorted(set(request.ids or []) - found):
+        outcomes.append({"id": ticket_id, "outcome": "not_found", "detail": "Ticket not found"})
+
+    result = {
+        "action": request.action,
+        "dry_run": request.dry_run,
+        "matched": len(rows),
+        "updated": 0 if request.dry_run else len(eligible),
+        "outcomes": outcomes,
+    }
+    if request.dry_run or not eligible:
+        return result
+
+    if request.action == "status":
+        _set_status(db, eligible, request.status, actor_id)
+    elif request.action == "resolve":
+        _resolve(db, eligible, request.resolution_text, actor_id)
+    else:
+        _escalate(db, eligible, actor_id)
+    versioning.bump(db, *{r.user_id for r in eligible})
+    db.commit()
+
+    near_dups = dedup.get_index(db)
+    if request.action == "escalate":
+        for incident_id in {r.incident_id or r.id for r in eligible}:
+            near_dups.remove_incident(incident_id)
+    elif request.action == "resolve" or request.status in CLOSED_STATUSES:
+        for r in eligible:
+            near_dups.remove(r.id)
+    pubsub.publish(db, [r.id for r in eligible])
+    return result
@@ -0,0 +1,165 @@
+import argparse
+import datetime
+import math
+import os
+from collections import Counter, defaultdict
+
+import models, jobs
+from database import SessionLocal
+from retrieval import preprocess_text
+
+# Offline clustering of recent ticket descriptions for the trending-issues dashboard.
+# Descriptions are hashed (no vocabulary to hold in memory) and streamed through
+# MiniBatchKMeans chunk by chunk: one pass to fit, one pass to assign, count terms
+# and count tickets per cluster per day. Results go into tables that
+# GET /admin/analytics/clusters reads directly. Run from cron:
+#     python clustering.py --days 30
+
+CLUSTER_COUNT = int(os.getenv("CLUSTER_COUNT", "12"))
+CLUSTER_WINDOW_DAYS = int(os.getenv("CLUSTER_WINDOW_DAYS", "30"))
+CHUNK_SIZE = 1000
+TOP_TERMS = 8
+# Per-cluster term counters are pruned to this many entries to keep memory bounded
+MAX_TERMS_PER_CLUSTER = 2000
+
+def _vectorizer():
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    return HashingVectorizer(
+        n_features=2 ** 16, preprocessor=preprocess_text, stop_words="english",
+        alternate_sign=False, norm="l2"
+    )
+
+def _iter_chunks(db, since):
+    # Keyset pagination rather than one long cursor, so pass 2 can commit between chunks
+    last_id = 0
+    while True:
+        chunk = db.query(models.Ticket.id, models.Ticket.description, models.Ticket.created_date).filter(
+            models.Ticket.created_date >= since, models.Ticket.id > last_id
+        ).order_by(models.Ticket.id).limit(CHUNK_SIZE).all()
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1].id
+
+def _top_terms(term_counts):
+    # Terms frequent in this cluster but not everywhere, roughly a class-based TF-IDF
+    spread = Counter()
+    for counts in term_counts.values():
+        spread.update(counts.keys())
+    n_clusters = max(len(term_counts), 1)
+    return {
+        cluster: [
+            term for term, _ in sorted(
+                counts.items(), key=lambda kv: kv[1] * math.log(1 + n_clusters / spread[kv[0]]), reverse=True
+            )[:TOP_TERMS]
+        ]
+        for cluster, counts in term_counts.items()
+    }
+
+def run_clustering(db, job, days=CLUSTER_WINDOW_DAYS, n_clusters=CLUSTER_COUNT):
+    jobs.start(db, job)
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    total = db.query(models.Ticket).filter(models.Ticket.created_date >= since).count()
+    k = min(n_clusters, total)
+    if k == 0:
+        jobs.finish(db, job)
+        return job
+
+    # scikit-learn is only loaded when the job actually runs, not when the API imports us
+    from sklearn.cluster import MiniBatchKMeans
+
+    vectorizer = _vectorizer()
+    analyzer = vectorizer.build_analyzer()
+    kmeans = MiniBatchKMeans(n_clusters=k, random_state=0, n_init=3, batch_size=CHUNK_SIZE)
+
+    # Pass 1: fit incrementally
+    for chunk in _iter_chunks(db, since):
+        kmeans.partial_fit(vectorizer.transform([row.description for row in chunk]))
+
+    # Pass 2: assign, and accumulate terms and per-day counts
+    sizes = Counter()
+    daily = Counter()
+    term_counts = defaultdict(Counter)
+    for chunk in _iter_chunks(db, since):
+        texts = [row.description for row in chunk]
+        labels = kmeans.predict(vectorizer.transform(texts))
+        assignments = []
+        for row, text, label in zip(chunk, texts, labels):
+            label = int(label)
+            sizes[label] += 1
+            daily[(label, row.created_date.date())] += 1
+            term_counts[label].update(analyzer(text))
+            if len(term_counts[label]) > MAX_TERMS_PER_CLUSTER:
+                term_counts[label] = Counter(dict(term_counts[label].most_common(MAX_TERMS_PER_CLUSTER // 2)))
+            assignments.append({"job_id": job.id, "ticket_id": row.id, "cluster": label})
+        db.execute(models.TicketCluster.__table__.insert(), assignments)
+        job.processed += len(chunk)
+        job.succeeded += len(chunk)
+        db.commit()
+
+    top_terms = _top_terms(term_counts)
+    db.execute(models.ClusterSummary.__table__.insert(), [
+        {"job_id": job.id, "cluster": cluster, "size": size, "top_terms": top_terms.get(cluster, [])}
+        for cluster, size in sizes.items()
+    ])
+    db.execute(models.ClusterDailyCount.__table__.insert(), [
+        {"job_id": job.id, "cluster": cluster, "day": day, "count": count}
+        for (cluster, day), count in daily.items()
+    ])
+    # Only the latest run's per-ticket assignments are kept
+    db.query(models.TicketCluster).filter(models.TicketCluster.job_id != job.id).delete(synchronize_session=False)
+    jobs.finish(db, job)
+    return job
+
+def run_clustering_job(job_id, days=CLUSTER_WINDOW_DAYS):
+    # Background-task entry point for the admin trigger endpoint
+    db = SessionLocal()
+    try:
+        job = db.query(models.Job).filter(models.Job.id == job_id).first()
+        try:
+            run_clustering(db, job, days=days)
+        except Exception as e:
+            db.rollback()
+            jobs.add_errors(job, [{"error": str(e)}])
+            jobs.finish(db, job, models.JobStatusEnum.Failed)
+            print(f"Clustering job {job_id} failed: {e}")
+    finally:
+        db.close()
+
+def latest_report(db):
+    job = db.query(models.Job).filter(
+        models.Job.kind == "clustering", models.Job.status == models.JobStatusEnum.Finished
+    ).order_by(models.Job.id.desc()).first()
+    if not job:
+        return {"clusters": []}
+
+    daily = defaultdict(list)
+    for row in db.query(models.ClusterDailyCount).filter(models.ClusterDailyCount.job_id == job.id).order_by(models.ClusterDailyCount.day):
+        daily[row.cluster].append({"day": row.day, "count": row.count})
+    summaries = db.query(models.ClusterSummary).filter(models.ClusterSummary.job_id == job.id).order_by(models.ClusterSummary.size.desc())
+    return {
+        "job_id": job.id,
+        "computed_at": job.finished_at,
+        "clusters": [
+            {"cluster": s.cluster, "size": s.size, "top_terms": s.top_terms or [], "daily_counts": daily[s.cluster]}
+            for s in summaries
+        ]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster recent ticket descriptions for trending-issue analytics")
+    parser.add_argument("--days", type=int, default=CLUSTER_WINDOW_DAYS)
+    parser.add_argument("--clusters", type=int, default=CLUSTER_COUNT)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        job = jobs.create(db, "clustering")
+        run_clustering(db, job, days=args.days, n_clusters=args.clusters)
+        print(f"Clustered {job.processed} tickets (job {job.id}).")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+import os
+import tempfile
+
+# Point the app at a throwaway SQLite file before any test imports database.py
+_db_dir = tempfile.mkdtemp(prefix="ticket-ai-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+
+# The app no longer creates tables on import; set up the schema the way a deploy would
+import migrate
+migrate.migrate()
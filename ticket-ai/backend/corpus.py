@@ -0,0 +1,109 @@
+import bisect
+
+# Compact storage for a retrieval shard's records. A shard used to keep one dict per
+# resolution (id, description and resolution text as separate Python objects plus the
+# dict itself, ~400 bytes of overhead per row before any text). Here a block of rows is
+# one UTF-8 buffer with int64 offsets and an int64 id array, so the overhead is ~24
+# bytes per row and a million-row shard is a handful of large allocations.
+#
+# Stores are immutable: extend() returns a new store that shares the existing blocks
+# and adds one, which is what RetrievalIndex.with_changes needs for copy-on-write
+# deltas. Blocks are merged once there are more than MAX_BLOCKS of them.
+#
+# Records come back as plain dicts, decoded on access; callers only ever touch the
+# handful a search returns. NULL text is stored as "".
+
+MAX_BLOCKS = 16
+
+class _Block:
+    __slots__ = ("buf", "offsets")
+
+    def __init__(self, records):
+        import numpy as np
+
+        parts = []
+        for r in records:
+            parts.append((r["description"] or "").encode())
+            parts.append((r["resolution_text"] or "").encode())
+        # offsets[2i]..offsets[2i+1] is row i's description, ..offsets[2i+2] its resolution
+        self.offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+        np.cumsum([len(p) for p in parts], out=self.offsets[1:])
+        self.buf = b"".join(parts)
+
+    def __len__(self):
+        return (len(self.offsets) - 1) // 2
+
+    def text(self, row):
+        start, middle, end = self.offsets[2 * row:2 * row + 3].tolist()
+        return self.buf[start:middle].decode(), self.buf[middle:end].decode()
+
+    @property
+    def nbytes(self):
+        return len(self.buf) + self.offsets.nbytes
+
+class CorpusStore:
+    __slots__ = ("ids", "blocks", "starts")
+
+    def __init__(self, ids=None, blocks=()):
+        import numpy as np
+
+        self.ids = np.zeros(0, dtype=np.int64) if ids is None else ids
+        self.blocks = tuple(blocks)
+        # Row number of each block's first row, for bisecting
+        self.starts = []
+        total = 0
+        for block in self.blocks:
+            self.starts.append(total)
+            total += len(block)
+
+    @classmethod
+    def from_records(cls, records):
+        import numpy as np
+
+        records = list(records)
+        if not records:
+            return cls()
+        return cls(np.fromiter((r["id"] for r in records), dtype=np.int64, count=len(records)), [_Block(records)])
+
+    def extend(self, records):
+        import numpy as np
+
+        records = list(records)
+        if not records:
+            return self
+        ids = np.concatenate([self.ids, np.fromiter((r["id"] for r in records), dtype=np.int64, count=len(records))])
+        blocks = self.blocks + (_Block(records),)
+        if len(blocks) > MAX_BLOCKS:
+            blocks = (_Block([self[row] for row in range(len(self))] + records),)
+        return CorpusStore(ids, blocks)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        row = int(row)
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("corpus row out of range")
+        b = bisect.bisect_right(self.starts, row) - 1
+        description, resolution_text = self.blocks[b].text(row - self.starts[b])
+        return {"id": int(self.ids[row]), "description": description, "resolution_text": resolution_text}
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+    def __contains__(self, ticket_id):
+        return bool((self.ids == ticket_id).any())
+
+    def rows_of(self, ticket_ids):
+        # Every row holding one of these ticket ids (vectorized; no id -> row dict to keep)
+        import numpy as np
+
+        return np.flatnonzero(np.isin(self.ids, np.fromiter(ticket_ids, dtype=np.int64)))
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes + sum(block.nbytes for block in self.blocks)
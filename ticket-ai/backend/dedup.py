@@ -0,0 +1,201 @@
+import datetime
+import functools
+import json
+import os
+import threading
+import zlib
+
+from sqlalchemy import or_
+
+import models
+from nlp_engine import FALLBACK_MESSAGE
+from retrieval import preprocess_text
+
+# Near-duplicate detection over recent open tickets with MinHash + LSH. During an
+# outage many users describe the same problem within minutes; a new ticket whose
+# description is close enough to an open one joins that ticket's incident and reuses
+# its stored suggestions instead of going through retrieval and the LLM again.
+# The index lives in process memory and is warmed from the database on first use.
+# Each worker has its own copy, so a match is checked against the database before it
+# is reused (find_open below): another worker may have resolved or escalated it.
+
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.6"))
+DEDUP_WINDOW_HOURS = float(os.getenv("DEDUP_WINDOW_HOURS", "24"))
+
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 4
+_PRIME = (1 << 31) - 1  # keeps a * h + b inside uint64
+
+@functools.lru_cache(maxsize=None)
+def _permutations():
+    # Built on first use so importing this module doesn't pull in numpy
+    import numpy as np
+
+    rng = np.random.RandomState(1)
+    a = rng.randint(1, _PRIME, size=NUM_PERM).astype(np.uint64)
+    b = rng.randint(0, _PRIME, size=NUM_PERM).astype(np.uint64)
+    return a, b
+
+def shingles(text):
+    text = preprocess_text(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+def signature(text):
+    grams = shingles(text)
+    if not grams:
+        return None
+    import numpy as np
+
+    a, b = _permutations()
+    # crc32 rather than hash() so signatures agree across processes
+    hashes = np.array([zlib.crc32(g.encode("utf-8")) % _PRIME for g in grams], dtype=np.uint64)
+    return ((np.outer(hashes, a) + b) % _PRIME).min(axis=0)
+
+def similarity(sig_a, sig_b):
+    return float((sig_a == sig_b).mean())
+
+class Match:
+    def __init__(self, ticket_id, incident_id, suggestions, score):
+        self.ticket_id = ticket_id
+        self.incident_id = incident_id
+        self.suggestions = suggestions
+        self.score = score
+
+class NearDuplicateIndex:
+    def __init__(self, threshold=DEDUP_THRESHOLD, window_hours=DEDUP_WINDOW_HOURS):
+        self.threshold = threshold
+        self.window = datetime.timedelta(hours=window_hours)
+        self.lock = threading.Lock()
+        self.buckets = {}
+        # ticket_id -> (signature, incident_id, suggestions, created_at)
+        self.entries = {}
+
+    def _band_keys(self, sig):
+        return [(band, sig[band * ROWS:(band + 1) * ROWS].tobytes()) for band in range(BANDS)]
+
+    def add(self, ticket_id, description, incident_id, suggestions, created_at=None):
+        sig = signature(description)
+        if sig is None:
+            return
+        with self.lock:
+            self._remove(ticket_id)
+            self.entries[ticket_id] = (sig, incident_id, suggestions, created_at or datetime.datetime.utcnow())
+            for key in self._band_keys(sig):
+                self.buckets.setdefault(key, set()).add(ticket_id)
+
+    def _remove(self, ticket_id):
+        entry = self.entries.pop(ticket_id, None)
+        if entry is None:
+            return
+        for key in self._band_keys(entry[0]):
+            bucket = self.buckets.get(key)
+            if bucket:
+                bucket.discard(ticket_id)
+                if not bucket:
+                    del self.buckets[key]
+
+    def remove(self, ticket_id):
+        with self.lock:
+            self._remove(ticket_id)
+
+    def remove_incident(self, incident_id):
+        with self.lock:
+            for ticket_id in [tid for tid, e in self.entries.items() if e[1] == incident_id]:
+                self._remove(ticket_id)
+
+    def find(self, description):
+        sig = signature(description)
+        if sig is None:
+            return None
+        cutoff = datetime.datetime.utcnow() - self.window
+        with self.lock:
+            candidates = set()
+            for key in self._band_keys(sig):
+                candidates |= self.buckets.get(key, set())
+
+            best = None
+            for ticket_id in candidates:
+                entry_sig, incident_id, suggestions, created_at = self.entries[ticket_id]
+                if created_at < cutoff:
+                    self._remove(ticket_id)
+                    continue
+                score = similarity(sig, entry_sig)
+                if score >= self.threshold and (best is None or score > best.score):
+                    best = Match(ticket_id, incident_id, suggestions, score)
+            return best
+
+    def __len__(self):
+        return len(self.entries)
+
+def is_reusable(suggestions):
+    # Only stored AI suggestion lists are worth handing to another ticket, and never
+    # the outage placeholder
+    try:
+        return isinstance(json.loads(suggestions), list) and FALLBACK_MESSAGE not in suggestions
+    except (TypeError, ValueError):
+        return False
+
+OPEN_STATUSES = [models.StatusEnum.Open, models.StatusEnum.In_Progress]
+
+def _stale(db, match):
+    # None while the matched ticket is open and its incident hasn't been escalated,
+    # else what to drop from this worker's index ("ticket" or "incident")
+    t = models.Ticket
+    ticket = db.query(t.status, t.escalated_at).filter(t.id == match.ticket_id).first()
+    if ticket is None or ticket.status not in OPEN_STATUSES:
+        return "ticket"
+    if ticket.escalated_at is not None:
+        return "incident"
+    escalated = db.query(t.id).filter(
+        or_(t.id == match.incident_id, t.incident_id == match.incident_id), t.escalated_at.isnot(None)
+    ).first()
+    return "incident" if escalated else None
+
+MAX_STALE_MATCHES = 3
+
+def find_open(db, index, description):
+    # index.find(), skipping (and forgetting) matches another worker has closed or escalated
+    for _ in range(MAX_STALE_MATCHES):
+        match = index.find(description)
+        if match is None:
+            return None
+        stale = _stale(db, match)
+        if stale is None:
+            return match
+        if stale == "incident":
+            index.remove_incident(match.incident_id)
+        else:
+            index.remove(match.ticket_id)
+    return None
+
+_index = None
+_warm_lock = threading.Lock()
+
+def get_index(db):
+    global _index
+    if _index is None:
+        with _warm_lock:
+            if _index is None:
+                index = NearDuplicateIndex()
+                cutoff = datetime.datetime.utcnow() - index.window
+                rows = db.query(
+                    models.Ticket.id, models.Ticket.description, models.Ticket.incident_id,
+                    models.Ticket.created_date, models.Resolution.resolution_text
+                ).join(models.Resolution, models.Resolution.ticket_id == models.Ticket.id).filter(
+                    models.Ticket.status.in_(OPEN_STATUSES),
+                    models.Ticket.created_date >= cutoff,
+                    models.Ticket.escalated_at.is_(None)
+                ).all()
+                for row in rows:
+                    if is_reusable(row.resolution_text):
+                        index.add(row.id, row.description, row.incident_id or row.id, row.resolution_text, row.created_date)
+                _index = index
+    return _index
+
+def reset():
+    global _index
+    _index = None
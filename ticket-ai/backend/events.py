@@ -0,0 +1,32 @@
+import datetime
+
+import models
+
+# Append-only ticket history. Writers add one event per action in the same
+# transaction as the state change; the ticket row only keeps the current state.
+
+HISTORY_PAGE_SIZE = 50
+
+def record(db, ticket_id, type, actor_id=None, **payload):
+    event = models.TicketEvent(ticket_id=ticket_id, type=type, actor_id=actor_id, payload=payload)
+    db.add(event)
+    return event
+
+def history(db, ticket_id, limit=HISTORY_PAGE_SIZE, before=None, archived=False):
+    # Newest first; pass the smallest id of the previous page as `before` for the next one.
+    # Archived tickets keep their history in ticket_event_archive.
+    model = models.TicketEventArchive if archived else models.TicketEvent
+    query = db.query(model).filter(model.ticket_id == ticket_id)
+    if before is not None:
+        query = query.filter(model.id < before)
+    return query.order_by(model.id.desc()).limit(limit).all()
+
+def record_many(db, type, actor_id, payloads):
+    # Bulk variant: payloads maps ticket_id -> payload dict, written as one INSERT
+    if not payloads:
+        return
+    now = datetime.datetime.utcnow()
+    db.execute(models.TicketEvent.__table__.insert(), [
+        {"ticket_id": ticket_id, "type": type, "actor_id": actor_id, "payload": payload, "created_at": now}
+        for ticket_id, payload in payloads.items()
+    ])
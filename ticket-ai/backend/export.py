@@ -0,0 +1,176 @@
+import csv
+import io
+
+import orjson
+from sqlalchemy import select
+
+import models
+from database import SessionLocal
+
+def _pyarrow():
+    # pyarrow is optional and slow to import, so it is only loaded for parquet exports
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None, None
+    return pa, pq
+
+def parquet_available():
+    return _pyarrow()[0] is not None
+
+# Streaming bulk export of tickets joined with their resolutions. Rows come off a
+# server-side cursor in fixed-size partitions and each partition is encoded and
+# yielded before the next one is fetched, so memory stays flat with table size.
+
+BATCH_SIZE = 2000
+
+COLUMNS = [
+    ("ticket_id", models.Ticket.id),
+    ("user_id", models.Ticket.user_id),
+    ("description", models.Ticket.description),
+    ("category", models.Ticket.category),
+    ("priority", models.Ticket.priority),
+    ("status", models.Ticket.status),
+    ("created_date", models.Ticket.created_date),
+    ("updated_at", models.Ticket.updated_at),
+    ("resolution_id", models.Resolution.id),
+    ("resolution_text", models.Resolution.resolution_text),
+    ("resolved_date", models.Resolution.resolved_date),
+]
+FIELD_NAMES = [name for name, _ in COLUMNS]
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def _archive_query(start=None, end=None, status=None):
+    a = models.TicketArchive
+    archive_columns = {
+        "ticket_id": a.id, "resolution_id": a.resolution_id, "resolution_text": a.resolution_text,
+        "resolved_date": a.resolved_date,
+    }
+    stmt = select(*[
+        archive_columns.get(name, getattr(a, col.key)).label(name) for name, col in COLUMNS
+    ])
+    if start:
+        stmt = stmt.where(a.created_date >= start)
+    if end:
+        stmt = stmt.where(a.created_date < end)
+    if status:
+        stmt = stmt.where(a.status == status)
+    return stmt
+
+def build_query(start=None, end=None, status=None, include_archived=False):
+    stmt = (
+        select(*[col.label(name) for name, col in COLUMNS])
+        .select_from(models.Ticket)
+        .outerjoin(models.Resolution, models.Resolution.ticket_id == models.Ticket.id)
+    )
+    if start:
+        stmt = stmt.where(models.Ticket.created_date >= start)
+    if end:
+        stmt = stmt.where(models.Ticket.created_date < end)
+    if status:
+        stmt = stmt.where(models.Ticket.status == status)
+    if include_archived:
+        union = stmt.union_all(_archive_query(start, end, status)).subquery()
+        return select(*union.c).order_by(union.c.ticket_id)
+    return stmt.order_by(models.Ticket.id)
+
+def _plain(value):
+    # Enums go out as their values so every format sees the same plain strings
+    return value.value if hasattr(value, "value") else value
+
+def iter_batches(stmt, batch_size=BATCH_SIZE):
+    # Own session: the generator outlives the request's get_db() dependency
+    db = SessionLocal()
+    try:
+        result = db.execute(stmt.execution_options(stream_results=True, yield_per=batch_size))
+        for partition in result.partitions():
+            yield [[_plain(value) for value in row] for row in partition]
+    finally:
+        db.close()
+
+def stream_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELD_NAMES)
+    for rows in batches:
+        for row in rows:
+            writer.writerow([v.isoformat() if hasattr(v, "isoformat") else v for v in row])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+def stream_ndjson(batches):
+    for rows in batches:
+        yield b"".join(orjson.dumps(dict(zip(FIELD_NAMES, row))) + b"\n" for row in rows)
+
+class _ChunkSink:
+    # Write-only file object for ParquetWriter that hands back what has been written
+    # so far, while tell() keeps reporting absolute offsets for the footer metadata
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def _parquet_schema(pa):
+    return pa.schema([
+        ("ticket_id", pa.int64()),
+        ("user_id", pa.int64()),
+        ("description", pa.string()),
+        ("category", pa.string()),
+        ("priority", pa.string()),
+        ("status", pa.string()),
+        ("created_date", pa.timestamp("us")),
+        ("updated_at", pa.timestamp("us")),
+        ("resolution_id", pa.int64()),
+        ("resolution_text", pa.string()),
+        ("resolved_date", pa.timestamp("us")),
+    ])
+
+def stream_parquet(batches):
+    pa, pq = _pyarrow()
+    schema = _parquet_schema(pa)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+    try:
+        for rows in batches:
+            # One row group per fetched batch
+            columns = list(zip(*rows)) if rows else [[] for _ in FIELD_NAMES]
+            writer.write_table(pa.Table.from_arrays([pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+STREAMERS = {
+    "csv": stream_csv,
+    "ndjson": stream_ndjson,
+    "parquet": stream_parquet,
+}
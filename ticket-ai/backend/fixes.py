@@ -0,0 +1,99 @@
+import datetime
+import hashlib
+import json
+import os
+from collections import Counter, defaultdict
+
+import models
+from database import insert_ignore
+from retrieval import preprocess_text
+
+# Confirmed-fix statistics and the retrieval-only fast path. When the closest historical
+# tickets were resolved with a fix users keep confirming, those fixes are returned
+# directly instead of asking the LLM to rephrase them.
+
+SELECTED_PREFIX = "Selected AI Fix: "
+
+FASTPATH_MIN_SCORE = float(os.getenv("FASTPATH_MIN_SCORE", "0.6"))
+FASTPATH_MIN_CONFIRMATION = float(os.getenv("FASTPATH_MIN_CONFIRMATION", "0.8"))
+FASTPATH_MIN_SELECTIONS = int(os.getenv("FASTPATH_MIN_SELECTIONS", "2"))
+
+def fix_key(text):
+    return hashlib.sha1(preprocess_text(text).encode("utf-8")).hexdigest()
+
+def selected_fix(resolution_text):
+    text = str(resolution_text or "")
+    if text.startswith(SELECTED_PREFIX):
+        return text[len(SELECTED_PREFIX):].strip() or None
+    return None
+
+def _increment(db, fix_lists, column):
+    # fix_lists holds the fix texts of each ticket; a fix counts once per ticket
+    texts, counts = {}, Counter()
+    for fix_texts in fix_lists:
+        keys = {fix_key(t): t for t in fix_texts if t and t.strip()}
+        for key, text in keys.items():
+            texts.setdefault(key, text)
+            counts[key] += 1
+    if not counts:
+        return
+    insert_ignore(db, models.ConfirmedFix.__table__, [
+        {"fix_key": key, "fix_text": text, "selected_count": 0, "escalated_count": 0}
+        for key, text in texts.items()
+    ])
+    # One UPDATE per distinct increment, usually a single statement
+    by_amount = defaultdict(list)
+    for key, n in counts.items():
+        by_amount[n].append(key)
+    now = datetime.datetime.utcnow()
+    for n, keys in by_amount.items():
+        db.query(models.ConfirmedFix).filter(models.ConfirmedFix.fix_key.in_(keys)).update(
+            {column: column + n, models.ConfirmedFix.updated_at: now},
+            synchronize_session=False
+        )
+
+def record_selection(db, resolution_text):
+    fix = selected_fix(resolution_text)
+    if fix:
+        _increment(db, [[fix]], models.ConfirmedFix.selected_count)
+
+def _suggestion_list(suggestion_text):
+    try:
+        suggestions = json.loads(suggestion_text)
+    except (TypeError, ValueError):
+        return []
+    return [str(s) for s in suggestions] if isinstance(suggestions, list) else []
+
+def record_escalations(db, suggestion_texts):
+    # Every suggestion shown on an escalated ticket failed to fix it
+    _increment(db, [_suggestion_list(text) for text in suggestion_texts], models.ConfirmedFix.escalated_count)
+
+def record_escalation(db, suggestion_text):
+    record_escalations(db, [suggestion_text])
+
+def confirmation_rate(fix):
+    total = fix.selected_count + fix.escalated_count
+    return fix.selected_count / total if total else 0.0
+
+def proven_fixes(db, matches, limit=5):
+    # matches are (score, record) pairs from the retrieval index, best first
+    candidates = []
+    for score, record in matches:
+        if score < FASTPATH_MIN_SCORE:
+            break
+        fix = selected_fix(record["resolution_text"])
+        if fix and fix_key(fix) not in [fix_key(c) for c in candidates]:
+            candidates.append(fix)
+    if not candidates:
+        return []
+
+    stats = {
+        row.fix_key: row for row in
+        db.query(models.ConfirmedFix).filter(models.ConfirmedFix.fix_key.in_([fix_key(c) for c in candidates]))
+    }
+    proven = []
+    for fix in candidates:
+        row = stats.get(fix_key(fix))
+        if row and row.selected_count >= FASTPATH_MIN_SELECTIONS and confirmation_rate(row) >= FASTPATH_MIN_CONFIRMATION:
+            proven.append(row.fix_text)
+    return proven[:limit]
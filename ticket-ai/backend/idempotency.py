@@ -0,0 +1,133 @@
+import datetime
+import hashlib
+import os
+import time
+import uuid
+
+import orjson
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+
+import models, metrics, tracing
+from database import SessionLocal, insert_ignore
+from singleflight import SINGLEFLIGHT_WAIT_SECONDS
+
+# Idempotency keys for the write endpoints that create tickets or start jobs. A client
+# sends `Idempotency-Key: <uuid>` and reuses it when it retries (timeouts, double
+# submits). The first request with a key claims a row in idempotency_keys, runs, and
+# stores its response there; a retry gets the stored response back without running
+# anything, with an `Idempotent-Replayed: true` header. A duplicate that arrives while
+# the first request still runs polls the row until the response is stored.
+#
+# Keys are scoped to the caller and the route. Reusing a key with a different request
+# body is a 422. Failed requests (exceptions, HTTP errors) release the key, so a retry
+# runs again. Stored responses are kept for IDEMPOTENCY_TTL_SECONDS; expired rows are
+# deleted as new keys are claimed. A claim whose request died without releasing it
+# lapses after IDEMPOTENCY_LOCK_SECONDS and the next retry runs the request.
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# Longer than a ticket submission that waited out another worker's suggestion lease
+# and then computed its own (see singleflight.py)
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", str(2 * SINGLEFLIGHT_WAIT_SECONDS + 10)))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60"))
+POLL_SECONDS = 0.1
+MAX_KEY_LENGTH = 255
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+def fingerprint(payload):
+    # Hash of the request body; dict key order doesn't matter
+    data = orjson.dumps(jsonable_encoder(payload), option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return hashlib.sha256(data).hexdigest()
+
+def record_key(scope, key):
+    return hashlib.sha256(f"{scope}\x1f{key}".encode("utf-8")).hexdigest()
+
+def _lookup(db, key):
+    rec = models.IdempotencyKey
+    row = db.query(rec.owner, rec.request_hash, rec.status_code, rec.response, rec.expires_at).filter(rec.key == key).first()
+    db.rollback()
+    return row
+
+def _claim(db, key, request_hash, owner):
+    # Returns None once this request owns the key, else the stored row to replay
+    rec = models.IdempotencyKey
+    now = datetime.datetime.utcnow()
+    db.query(rec).filter(rec.expires_at < now).delete(synchronize_session=False)
+    db.commit()
+
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        now = datetime.datetime.utcnow()
+        insert_ignore(db, rec.__table__, [{
+            "key": key, "owner": owner, "request_hash": request_hash, "created_at": now,
+            "expires_at": now + datetime.timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+        }])
+        db.commit()
+        row = _lookup(db, key)
+        if row is None:
+            # Released by a failed first request just now; try to claim it again
+            continue
+        if row.owner == owner:
+            return None
+        if row.request_hash != request_hash:
+            metrics.inc("idempotency.mismatched")
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if row.response is not None:
+            return row
+        if row.expires_at < now:
+            # The first request died without storing or releasing its claim
+            db.query(rec).filter(rec.key == key, rec.owner == row.owner).delete(synchronize_session=False)
+            db.commit()
+            continue
+        if time.monotonic() >= deadline:
+            metrics.inc("idempotency.in_progress")
+            raise HTTPException(
+                status_code=409, detail="A request with this Idempotency-Key is still in progress",
+                headers={"Retry-After": "1"}
+            )
+        time.sleep(POLL_SECONDS)
+
+def run(scope, key, payload, handler, status_code=200, response_model=None):
+    # Runs handler() at most once per (scope, key) and returns its JSON response.
+    # Without a key this is just handler(). response_model converts ORM results before
+    # they are stored, as FastAPI would when serializing them.
+    if key is None:
+        return handler()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+
+    rec = models.IdempotencyKey
+    row_key = record_key(scope, key)
+    owner = uuid.uuid4().hex
+    db = SessionLocal()
+    try:
+        with tracing.span("idempotency.claim") as span:
+            stored = _claim(db, row_key, fingerprint(payload), owner)
+            if span:
+                span.set(replayed=stored is not None)
+        if stored is not None:
+            metrics.inc("idempotency.replayed")
+            return Response(
+                content=stored.response, status_code=stored.status_code,
+                media_type="application/json", headers={REPLAYED_HEADER: "true"}
+            )
+
+        try:
+            result = handler()
+        except BaseException:
+            db.query(rec).filter(rec.key == row_key, rec.owner == owner).delete(synchronize_session=False)
+            db.commit()
+            raise
+        if response_model is not None:
+            result = response_model.model_validate(result)
+        body = orjson.dumps(jsonable_encoder(result), option=orjson.OPT_NON_STR_KEYS)
+        db.query(rec).filter(rec.key == row_key, rec.owner == owner).update({
+            rec.status_code: status_code,
+            rec.response: body.decode("utf-8"),
+            rec.expires_at: datetime.datetime.utcnow() + datetime.timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+        }, synchronize_session=False)
+        db.commit()
+        metrics.inc("idempotency.stored")
+        return Response(content=body, status_code=status_code, media_type="application/json")
+    finally:
+        db.close()
@@ -0,0 +1,189 @@
+import argparse
+import csv
+import datetime
+import io
+import json
+import os
+import re
+
+import models, versioning, retrieval, jobs
+from database import SessionLocal
+
+# Bulk import of historical tickets from a previous ticketing system. Rows are parsed
+# and validated one at a time straight off the file and inserted in batches (one
+# transaction each). Each batch bumps the list version and logs its tickets in the
+# index change log in the same transaction, so what's committed is visible and
+# searchable even if a later batch fails; the shards are refit once at the end.
+
+BATCH_SIZE = 500
+
+# Undecodable bytes come through as lone surrogates (errors="surrogateescape"), so a
+# bad line is reported as a rejected row instead of failing the whole import
+_UNDECODABLE = re.compile("[\udc80-\udcff]")
+
+def _undecodable(values):
+    return any(isinstance(v, str) and _UNDECODABLE.search(v) for v in values)
+
+def iter_rows(stream, fmt):
+    # Yields (row_number, raw_row, parse_error) without reading the whole file
+    text = io.TextIOWrapper(stream, encoding="utf-8", errors="surrogateescape", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        while True:
+            line_no = reader.line_num + 1
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                # The reader skips past the bad line and carries on
+                yield line_no, None, f"invalid CSV: {e}"
+                continue
+            if _undecodable(list(row.keys()) + list(row.values())):
+                yield reader.line_num, None, "invalid UTF-8"
+            else:
+                yield reader.line_num, row, None
+
+    for line_no, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        if _undecodable([line]):
+            yield line_no, None, "invalid UTF-8"
+            continue
+        try:
+            yield line_no, json.loads(line), None
+        except ValueError as e:
+            yield line_no, None, f"invalid JSON: {e}"
+
+def _parse_date(value):
+    if not value:
+        return None
+    return datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+
+def parse_record(raw):
+    if not isinstance(raw, dict):
+        raise ValueError("row is not an object")
+
+    description = str(raw.get("description") or "").strip()
+    resolution_text = str(raw.get("resolution_text") or raw.get("resolution") or "").strip()
+    if not description:
+        raise ValueError("missing description")
+    if not resolution_text:
+        raise ValueError("missing resolution_text")
+
+    created_date = _parse_date(raw.get("created_date")) or datetime.datetime.utcnow()
+    return {
+        "description": description,
+        "category": models.CategoryEnum(raw.get("category")),
+        "priority": models.PriorityEnum(raw.get("priority") or "Low"),
+        "status": models.StatusEnum(raw.get("status") or "Resolved"),
+        "created_date": created_date,
+        "resolution_text": resolution_text,
+        "resolved_date": _parse_date(raw.get("resolved_date")) or created_date,
+    }
+
+def _insert_batch(db, records, user_id):
+    tickets = [
+        models.Ticket(
+            user_id=user_id,
+            description=r["description"],
+            category=r["category"],
+            priority=r["priority"],
+            status=r["status"],
+            created_date=r["created_date"],
+            imported=True
+        )
+        for r in records
+    ]
+    db.add_all(tickets)
+    db.flush()  # To get ticket ids
+    db.add_all([
+        models.Resolution(ticket_id=t.id, resolution_text=r["resolution_text"], resolved_date=r["resolved_date"])
+        for t, r in zip(tickets, records)
+    ])
+    return [t.id for t in tickets]
+
+def run_import(db, stream, fmt, job, user_id, batch_size=BATCH_SIZE):
+    jobs.start(db, job)
+    batch, errors = [], []
+
+    def flush():
+        if batch:
+            ticket_ids = _insert_batch(db, batch, user_id)
+            versioning.bump(db, user_id)
+            # One change log insert per batch (a full-rebuild marker above INDEX_MAX_DELTA)
+            retrieval.record_changes(db, ticket_ids)
+            job.succeeded += len(batch)
+        jobs.add_errors(job, errors)
+        db.commit()
+        batch.clear()
+        errors.clear()
+
+    try:
+        for row_no, raw, error in iter_rows(stream, fmt):
+            job.processed += 1
+            if error is None:
+                try:
+                    batch.append(parse_record(raw))
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                job.failed += 1
+                errors.append({"row": row_no, "error": error})
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+        jobs.finish(db, job)
+    except Exception as e:
+        db.rollback()
+        jobs.add_errors(job, [{"row": None, "error": f"import aborted: {e}"}])
+        jobs.finish(db, job, models.JobStatusEnum.Failed)
+        raise
+    # Refit now rather than on the next user's query
+    retrieval.warm(db)
+    return job
+
+def run_import_file(path, fmt, job_id, user_id):
+    # Background-task entry point for the admin upload endpoint
+    db = SessionLocal()
+    try:
+        job = db.query(models.Job).filter(models.Job.id == job_id).first()
+        with open(path, "rb") as stream:
+            run_import(db, stream, fmt, job, user_id)
+    except Exception as e:
+        print(f"Import job {job_id} failed: {e}")
+    finally:
+        db.close()
+        os.remove(path)
+
+def guess_format(filename):
+    return "ndjson" if filename.lower().endswith((".ndjson", ".jsonl")) else "csv"
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import historical tickets and resolutions")
+    parser.add_argument("path", help="CSV or NDJSON file with description, category, resolution_text columns")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="defaults to the file extension")
+    parser.add_argument("--user-id", type=int, help="owner of the imported tickets (defaults to the first admin)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        user_id = args.user_id
+        if user_id is None:
+            admin = db.query(models.User).filter(models.User.role == models.RoleEnum.admin).first()
+            if not admin:
+                parser.error("no admin user found, pass --user-id")
+            user_id = admin.id
+
+        job = jobs.create(db, "import")
+        with open(args.path, "rb") as stream:
+            run_import(db, stream, args.format or guess_format(args.path), job, user_id, args.batch_size)
+        print(f"Imported {job.succeeded} of {job.processed} rows ({job.failed} rejected).")
+        for err in job.errors[:20]:
+            print(f"  row {err['row']}: {err['error']}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import datetime
+
+import models
+
+# Small helpers for the Job progress rows shared by background jobs
+
+MAX_REPORTED_ERRORS = 1000
+
+def create(db, kind):
+    job = models.Job(kind=kind, status=models.JobStatusEnum.Queued, errors=[])
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def start(db, job):
+    job.status = models.JobStatusEnum.Running
+    db.commit()
+
+def add_errors(job, errors):
+    # Keep the report bounded; job.failed still counts every rejected row
+    room = MAX_REPORTED_ERRORS - len(job.errors or [])
+    if errors and room > 0:
+        # Reassign rather than mutate so SQLAlchemy notices the JSON change
+        job.errors = (job.errors or []) + errors[:room]
+
+def finish(db, job, status=models.JobStatusEnum.Finished):
+    job.status = status
+    job.finished_at = datetime.datetime.utcnow()
+    db.commit()
@@ -0,0 +1,133 @@
+import os
+import threading
+from collections import OrderedDict
+
+import metrics
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Server-side cache of serialized ticket lists (the JSON bytes GET /tickets/user/{id}
+# and GET /admin/tickets send). Entries are keyed by list scope, field set and the
+# scope's list version. Every write path that touches a user's tickets bumps that
+# version in its own transaction (versioning.bump), so a write invalidates exactly the
+# lists it changed, in every worker, the moment it commits; nothing is ever served
+# from a version that is no longer current.
+#
+# Tier 1 is an in-process LRU bounded by LIST_CACHE_MAX_BYTES. With
+# LIST_CACHE_REDIS_URL set (and the redis package installed) a shared Redis tier sits
+# behind it, so a list serialized by one worker is reused by the others.
+
+LIST_CACHE_MAX_BYTES = int(os.getenv("LIST_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Bigger lists (typically the full admin list) aren't worth evicting everything else for
+LIST_CACHE_MAX_ENTRY_BYTES = int(os.getenv("LIST_CACHE_MAX_ENTRY_BYTES", str(LIST_CACHE_MAX_BYTES // 8)))
+LIST_CACHE_REDIS_URL = os.getenv("LIST_CACHE_REDIS_URL")
+LIST_CACHE_SHARED_TTL_SECONDS = int(os.getenv("LIST_CACHE_SHARED_TTL_SECONDS", "600"))
+
+class LRUCache:
+    # One slot per (scope, fields): storing a newer version replaces the older one
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, slot, version):
+        with self.lock:
+            entry = self.entries.get(slot)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(slot)
+            return entry[1]
+
+    def put(self, slot, version, body):
+        with self.lock:
+            old = self.entries.get(slot)
+            if old is not None and old[0] > version:
+                # A slower request serialized an older version; keep the newer one
+                return
+            self._drop(slot)
+            if len(body) > min(self.max_bytes, LIST_CACHE_MAX_ENTRY_BYTES):
+                return
+            self.entries[slot] = (version, body)
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                metrics.inc("list_cache.evictions")
+            metrics.set_gauge("list_cache.bytes", self.bytes)
+            metrics.set_gauge("list_cache.entries", len(self.entries))
+
+    def _drop(self, slot):
+        entry = self.entries.pop(slot, None)
+        if entry is not None:
+            self.bytes -= len(entry[1])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+class SharedTier:
+    def __init__(self, url, ttl):
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(slot, version):
+        scope, fields = slot
+        return f"ticket-ai:list:{scope}:{fields}:v{version}"
+
+    def get(self, slot, version):
+        try:
+            return self.client.get(self._key(slot, version))
+        except redis.RedisError:
+            metrics.inc("list_cache.shared_errors")
+            return None
+
+    def put(self, slot, version, body):
+        try:
+            # Old versions are never read again and simply expire
+            self.client.set(self._key(slot, version), body, ex=self.ttl)
+        except redis.RedisError:
+            metrics.inc("list_cache.shared_errors")
+
+local = LRUCache(LIST_CACHE_MAX_BYTES)
+shared = SharedTier(LIST_CACHE_REDIS_URL, LIST_CACHE_SHARED_TTL_SECONDS) if LIST_CACHE_REDIS_URL and redis else None
+
+def get(scope, fields, version):
+    slot = (scope, fields)
+    body = local.get(slot, version)
+    if body is not None:
+        metrics.inc("list_cache.hits")
+        return body
+    if shared is not None:
+        body = shared.get(slot, version)
+        if body is not None:
+            metrics.inc("list_cache.shared_hits")
+            local.put(slot, version, body)
+            return body
+    metrics.inc("list_cache.misses")
+    return None
+
+def put(scope, fields, version, body):
+    slot = (scope, fields)
+    local.put(slot, version, body)
+    if shared is not None:
+        shared.put(slot, version, body)
+
+def report():
+    counters = metrics.snapshot()["counters"]
+    hits = counters.get("list_cache.hits", 0) + counters.get("list_cache.shared_hits", 0)
+    total = hits + counters.get("list_cache.misses", 0)
+    return {
+        "hit_ratio": round(hits / total, 4) if total else 0.0,
+        "hits": counters.get("list_cache.hits", 0),
+        "shared_hits": counters.get("list_cache.shared_hits", 0),
+        "misses": counters.get("list_cache.misses", 0),
+        "bytes": local.bytes,
+        "max_bytes": local.max_bytes,
+        "entries": len(local.entries),
+        "shared_tier": shared is not None,
+    }
@@ -0,0 +1,61 @@
+import orjson
+from fastapi import Response
+from sqlalchemy.orm import selectinload
+
+import models, versioning, serialization, list_cache
+
+# Shared implementation of the ticket list endpoints (GET /tickets/user/{id} and
+# GET /admin/tickets): conditional GET, then the serialized list from list_cache, or
+# either the full rows with their resolutions batch-loaded or a lean column projection
+# for dashboard tables. Archived tickets are only read when the caller passes criteria
+# for them (include_archived=true).
+
+SUMMARY_COLUMNS = (
+    models.Ticket.id,
+    models.Ticket.user_id,
+    models.Ticket.category,
+    models.Ticket.priority,
+    models.Ticket.status,
+    models.Ticket.created_date,
+)
+
+ARCHIVE_SUMMARY_COLUMNS = tuple(getattr(models.TicketArchive, col.key) for col in SUMMARY_COLUMNS)
+
+def _load_archived(db, fields, criteria):
+    if fields == "summary":
+        rows = db.query(*ARCHIVE_SUMMARY_COLUMNS).filter(*criteria).all()
+        return [row._asdict() for row in rows]
+    return [serialization.archived_ticket_to_dict(row) for row in db.query(models.TicketArchive).filter(*criteria)]
+
+def _load(db, fields, criteria):
+    if fields == "summary":
+        rows = db.query(*SUMMARY_COLUMNS).filter(*criteria).order_by(models.Ticket.id).all()
+        return [row._asdict() for row in rows]
+
+    # selectinload fetches every resolution in one extra query instead of one per ticket
+    tickets = (
+        db.query(models.Ticket)
+        .options(selectinload(models.Ticket.resolution))
+        .filter(*criteria)
+        .order_by(models.Ticket.id)
+        .all()
+    )
+    return [serialization.ticket_to_dict(t) for t in tickets]
+
+def ticket_list(db, scope, fields, if_none_match, *criteria, archived_criteria=None):
+    # archived_criteria (a list, possibly empty) selects archived tickets to include;
+    # None keeps the list to the live tier. Archiving bumps the owners' versions too.
+    variant = fields if archived_criteria is None else f"{fields}+archived"
+    version = versioning.current(db, scope)
+    etag = versioning.etag(scope, variant, version)
+    if versioning.etag_matches(if_none_match, etag):
+        return versioning.not_modified(etag)
+
+    body = list_cache.get(scope, variant, version)
+    if body is None:
+        rows = _load(db, fields, criteria)
+        if archived_criteria is not None:
+            rows = sorted(rows + _load_archived(db, fields, archived_criteria), key=lambda row: row["id"])
+        body = orjson.dumps(rows, option=orjson.OPT_NON_STR_KEYS)
+        list_cache.put(scope, variant, version, body)
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
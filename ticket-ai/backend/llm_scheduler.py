@@ -0,0 +1,149 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+
+import metrics
+
+# Admission control for outbound LLM calls. Every Groq request in this worker goes
+# through one scheduler: at most LLM_MAX_CONCURRENCY calls in flight, a token bucket
+# sized to the provider quota, and a queue ordered by ticket priority and wait time.
+# Each priority level counts as LLM_PRIORITY_STEP_SECONDS of extra waiting, so High
+# goes first but a Low ticket that has waited long enough still gets its turn.
+# Work still queued after LLM_QUEUE_TIMEOUT_SECONDS is dropped and the caller falls back.
+# Waiting callers block their thread, and sync handlers run on AnyIO's threadpool (40
+# threads by default), so at most LLM_MAX_QUEUED calls wait; beyond that a call falls
+# back at once instead of tying up threads that login and list requests need. Keep
+# LLM_MAX_CONCURRENCY + LLM_MAX_QUEUED well below the threadpool size.
+# Limits are per worker process: divide the provider quota by the number of workers.
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_RATE_PER_MINUTE = float(os.getenv("LLM_RATE_PER_MINUTE", "30"))
+LLM_BURST = int(os.getenv("LLM_BURST", "5"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "20"))
+LLM_PRIORITY_STEP_SECONDS = float(os.getenv("LLM_PRIORITY_STEP_SECONDS", "10"))
+LLM_MAX_QUEUED = int(os.getenv("LLM_MAX_QUEUED", "16"))
+
+PRIORITY_RANK = {"High": 0, "Medium": 1, "Low": 2}
+
+class DeadlineExceeded(Exception):
+    pass
+
+class QueueFull(DeadlineExceeded):
+    # Rejected without waiting; callers fall back exactly as for a timeout
+    pass
+
+class TokenBucket:
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, now):
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+class _Waiter:
+    __slots__ = ("enqueued_at", "deadline", "granted", "cancelled")
+
+    def __init__(self, enqueued_at, deadline):
+        self.enqueued_at = enqueued_at
+        self.deadline = deadline
+        self.granted = False
+        self.cancelled = False
+
+class LLMScheduler:
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, rate_per_minute=LLM_RATE_PER_MINUTE,
+                 burst=LLM_BURST, priority_step=LLM_PRIORITY_STEP_SECONDS, max_queued=LLM_MAX_QUEUED):
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+        self.priority_step = priority_step
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst)
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._queued = 0
+
+    def _publish(self):
+        metrics.set_gauge("llm.queue_depth", self._queued)
+        metrics.set_gauge("llm.in_flight", self._active)
+
+    def _dispatch(self, now):
+        # Called with the lock held by whichever waiting thread wakes up first
+        granted = False
+        while self._heap and self._active < self.max_concurrency:
+            waiter = self._heap[0][2]
+            if waiter.cancelled or waiter.deadline <= now:
+                # Expired entries are dropped here; their own thread reports the timeout
+                heapq.heappop(self._heap)
+                continue
+            if not self.bucket.take(now):
+                break
+            heapq.heappop(self._heap)
+            waiter.granted = True
+            self._active += 1
+            self._queued -= 1
+            metrics.observe("llm.queue_wait", now - waiter.enqueued_at)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+        self._publish()
+
+    def _acquire(self, priority, timeout):
+        now = time.monotonic()
+        waiter = _Waiter(now, now + timeout)
+        rank = PRIORITY_RANK.get(getattr(priority, "value", priority), PRIORITY_RANK["Medium"])
+
+        with self._cond:
+            if self._queued >= self.max_queued:
+                metrics.inc("llm.queue_full")
+                raise QueueFull(f"LLM queue full ({self._queued} waiting)")
+            heapq.heappush(self._heap, (now + rank * self.priority_step, next(self._seq), waiter))
+            self._queued += 1
+            while True:
+                now = time.monotonic()
+                self._dispatch(now)
+                if waiter.granted:
+                    return
+                if now >= waiter.deadline:
+                    waiter.cancelled = True
+                    self._queued -= 1
+                    self._publish()
+                    metrics.inc("llm.deadline_dropped")
+                    raise DeadlineExceeded(f"LLM call not admitted within {timeout:.0f}s")
+                # Wake for a freed slot (notify), the next bucket token, or our own deadline
+                wake_in = waiter.deadline - now
+                if self._active < self.max_concurrency:
+                    wake_in = min(wake_in, self.bucket.wait_time(now))
+                self._cond.wait(max(wake_in, 0.001))
+
+    def _release(self):
+        with self._cond:
+            self._active -= 1
+            self._dispatch(time.monotonic())
+            self._cond.notify_all()
+
+    def run(self, fn, priority=None, timeout=LLM_QUEUE_TIMEOUT_SECONDS):
+        # Blocks the calling (request) thread until admitted; raises DeadlineExceeded instead
+        self._acquire(priority, timeout)
+        metrics.inc("llm.admitted")
+        try:
+            return fn()
+        finally:
+            self._release()
+
+scheduler = LLMScheduler()
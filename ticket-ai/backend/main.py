@@ -1,12 +1,24 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from database import engine, Base
+from sqlalchemy.orm import Session
+
+import warmup, tracing
+from database import get_db
 from routers import users, tickets, admin
+from serialization import ORJSONResponse, add_compression
 
-# Create tables logic
-Base.metadata.create_all(bind=engine)
+# Tables are created and upgraded by `python migrate.py`, not on import, so starting a
+# worker never does schema work. ML libraries are imported on first use (or by the
+# optional warm-up), see warmup.py.
 
-app = FastAPI(title="IT Ticket Resolution AI")
+@asynccontextmanager
+async def lifespan(app):
+    warmup.start()
+    yield
+
+app = FastAPI(title="IT Ticket Resolution AI", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # Set up CORS middleware to allow Streamlit frontend connections
 app.add_middleware(
@@ -16,6 +28,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+add_compression(app)
+# Outermost, so the request span covers compression too
+app.add_middleware(tracing.TracingMiddleware)
 
 app.include_router(users.router)
 app.include_router(tickets.router)
@@ -24,3 +39,8 @@ app.include_router(admin.router)
 @app.get("/")
 def read_root():
     return {"message": "Welcome to IT Ticket Resolution AI"}
+
+@app.get("/ready")
+def ready(db: Session = Depends(get_db)):
+    checks = warmup.readiness(db)
+    return ORJSONResponse({"ready": all(checks.values()), **checks}, status_code=200 if all(checks.values()) else 503)
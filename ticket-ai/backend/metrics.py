@@ -0,0 +1,50 @@
+import threading
+from collections import defaultdict, deque
+
+# In-process counters, gauges and latency samples, exposed at GET /admin/metrics.
+# Each worker reports its own numbers.
+
+SAMPLE_WINDOW = 1000
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+_samples = defaultdict(lambda: deque(maxlen=SAMPLE_WINDOW))
+
+def inc(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+def set_gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+def observe(name, seconds):
+    with _lock:
+        _samples[name].append(seconds)
+
+def _percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def _summary(samples):
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50_ms": round(_percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(_percentile(ordered, 0.95) * 1000, 2),
+    }
+
+def snapshot():
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": {name: _summary(s) for name, s in _samples.items() if s},
+        }
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _samples.clear()
@@ -0,0 +1,136 @@
+from sqlalchemy import inspect, text, update
+from database import engine, Base, SessionLocal
+import models, retrieval, versioning, search
+
+# create_all only creates tables that are missing entirely, so columns added to
+# existing tables (e.g. tickets.updated_at) have to be patched in separately.
+
+# Escalations used to be prepended to the resolution text, once per escalation
+LEGACY_ESCALATION_MESSAGE = "🚧 [ESCALATED] User issue is not resolved. Send this ticket to Data Engineer."
+LEGACY_NOTES_SEPARATOR = "\n\nPrevious notes: "
+
+def add_missing_columns():
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}"))
+                print(f"Added column {table.name}.{column.name}")
+            # Indexes on columns added above
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+# Live tables whose ids must never be reused, and the archive tables those ids move to
+AUTOINCREMENT_ARCHIVES = {"tickets": "ticket_archive", "ticket_events": "ticket_event_archive"}
+
+def use_sqlite_autoincrement():
+    # SQLite can't add AUTOINCREMENT to an existing table, so tables created before
+    # sqlite_autoincrement was set are rebuilt once. The id sequence starts above the
+    # archived ids too, in case the newest rows were archived before this ran.
+    if engine.dialect.name != "sqlite":
+        return
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        # Keep other tables' foreign keys pointing at the table name, not the renamed copy
+        conn.execute(text("PRAGMA legacy_alter_table = ON"))
+        for name, archive in AUTOINCREMENT_ARCHIVES.items():
+            sql = conn.execute(
+                text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": name}
+            ).scalar()
+            if sql is None or "AUTOINCREMENT" in sql.upper():
+                continue
+            table = Base.metadata.tables[name]
+            columns = ", ".join(col["name"] for col in inspector.get_columns(name))
+            old = f"{name}_old"
+            conn.execute(text(f"ALTER TABLE {name} RENAME TO {old}"))
+            for (index,) in conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :name AND sql IS NOT NULL"
+            ), {"name": old}).all():
+                conn.execute(text(f"DROP INDEX {index}"))
+            table.create(conn)
+            conn.execute(text(f"INSERT INTO {name} ({columns}) SELECT {columns} FROM {old}"))
+            # Also drops the old table's triggers; search.install recreates them
+            conn.execute(text(f"DROP TABLE {old}"))
+            high_water = conn.execute(text(
+                f"SELECT max(id) FROM (SELECT max(id) AS id FROM {name} UNION ALL SELECT max(id) FROM {archive})"
+            )).scalar()
+            if high_water is not None:
+                conn.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"), {"name": name})
+                conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"), {"name": name, "seq": high_water})
+            print(f"Rebuilt {name} with AUTOINCREMENT")
+        conn.execute(text("PRAGMA legacy_alter_table = OFF"))
+
+def split_escalation_blob(resolution_text):
+    # Returns (number of escalations, the notes that were there before the first one)
+    count, rest = 0, resolution_text or ""
+    while rest.startswith(LEGACY_ESCALATION_MESSAGE):
+        count += 1
+        rest = rest[len(LEGACY_ESCALATION_MESSAGE):]
+        if not rest.startswith(LEGACY_NOTES_SEPARATOR):
+            return count, ""
+        rest = rest[len(LEGACY_NOTES_SEPARATOR):]
+    return count, rest
+
+def migrate_escalation_blobs():
+    # Turns each "[ESCALATED] ... Previous notes: ..." blob into escalated events plus
+    # the ticket's structured escalation state, and restores the original notes
+    db = SessionLocal()
+    try:
+        # updated_at is kept as is (no onupdate) so it can date the escalations below
+        db.query(models.Ticket).filter(models.Ticket.escalation_count.is_(None)).update(
+            {models.Ticket.escalation_count: 0, models.Ticket.updated_at: models.Ticket.updated_at},
+            synchronize_session=False
+        )
+        resolutions = db.query(models.Resolution).filter(
+            models.Resolution.resolution_text.like(f"{LEGACY_ESCALATION_MESSAGE}%")
+        ).all()
+        for res in resolutions:
+            count, notes = split_escalation_blob(res.resolution_text)
+            ticket = res.ticket
+            # Legacy rows never recorded when they were escalated. The resolution's dates
+            # are when the suggestion was written; the ticket's last write (or its
+            # creation) is the closest we have.
+            escalated_at = ticket.updated_at or ticket.created_date
+            for n in range(1, count + 1):
+                db.add(models.TicketEvent(
+                    ticket_id=ticket.id, type=models.EventTypeEnum.escalated,
+                    payload={"count": n, "migrated": True}, created_at=escalated_at
+                ))
+            # Core UPDATE with updated_at kept as is: the ORM's onupdate would make every
+            # migrated ticket look modified now (list order, ETags, "last updated")
+            values = {
+                models.Ticket.escalation_count: models.Ticket.escalation_count + count,
+                models.Ticket.updated_at: models.Ticket.updated_at,
+            }
+            if ticket.status not in (models.StatusEnum.Resolved, models.StatusEnum.Closed):
+                values[models.Ticket.escalated_at] = escalated_at
+            db.execute(update(models.Ticket).where(models.Ticket.id == ticket.id).values(values))
+            if notes:
+                res.resolution_text = notes
+            else:
+                # The ticket had no notes before it was first escalated
+                db.delete(res)
+        if resolutions:
+            versioning.bump(db, *{res.ticket.user_id for res in resolutions})
+            retrieval.record_change(db, None)
+            print(f"Migrated {len(resolutions)} escalation blobs")
+        db.commit()
+    finally:
+        db.close()
+
+def migrate():
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    use_sqlite_autoincrement()
+    with engine.begin() as conn:
+        search.install(conn)
+    migrate_escalation_blobs()
+
+if __name__ == "__main__":
+    migrate()
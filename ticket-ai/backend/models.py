@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Enum
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Date, Enum, JSON, Boolean
 from sqlalchemy.orm import relationship
 from database import Base
 import datetime
@@ -25,6 +25,18 @@ class StatusEnum(str, enum.Enum):
     Resolved = "Resolved"
     Closed = "Closed"
 
+class EventTypeEnum(str, enum.Enum):
+    suggested = "suggested"
+    resolved = "resolved"
+    escalated = "escalated"
+    status_changed = "status_changed"
+
+class JobStatusEnum(str, enum.Enum):
+    Queued = "Queued"
+    Running = "Running"
+    Finished = "Finished"
+    Failed = "Failed"
+
 class User(Base):
     __tablename__ = "users"
 
@@ -40,6 +52,9 @@ class User(Base):
 
 class Ticket(Base):
     __tablename__ = "tickets"
+    # Without AUTOINCREMENT SQLite hands out max(id) + 1, so archiving the newest tickets
+    # would free their ids for new tickets (and their archived events)
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -48,6 +63,15 @@ class Ticket(Base):
     priority = Column(Enum(PriorityEnum), default=PriorityEnum.Low)
     status = Column(Enum(StatusEnum), default=StatusEnum.Open)
     created_date = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    # First ticket of the outage this one was detected as a near duplicate of
+    incident_id = Column(Integer, ForeignKey("tickets.id"), nullable=True, index=True)
+    # Current escalation state; the full history lives in ticket_events
+    escalation_count = Column(Integer, nullable=False, default=0)
+    escalated_at = Column(DateTime, nullable=True)
+    # History brought in from a previous system (importer.py, seed_db.py); owned by the
+    # importing admin but searched by every department
+    imported = Column(Boolean, nullable=True, default=False)
 
     user = relationship("User", back_populates="tickets")
     resolution = relationship("Resolution", back_populates="ticket", uselist=False)
@@ -59,5 +83,155 @@ class Resolution(Base):
     ticket_id = Column(Integer, ForeignKey("tickets.id"))
     resolution_text = Column(Text)
     resolved_date = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
     ticket = relationship("Ticket", back_populates="resolution")
+
+class TicketEvent(Base):
+    # Append-only ticket history (AI suggestions, resolutions, escalations, status
+    # changes). Rows are never updated; read newest first with GET /tickets/{id}/events.
+    __tablename__ = "ticket_events"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True, index=True)
+    ticket_id = Column(Integer, ForeignKey("tickets.id"), index=True)
+    type = Column(Enum(EventTypeEnum))
+    actor_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    payload = Column(JSON, default=dict)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class TicketArchive(Base):
+    # Cold tier written by archive.py: old Closed/Resolved tickets with their resolution
+    # inlined, one row per ticket, never updated. On Postgres the table is range
+    # partitioned by month of created_date (the partition key has to be in the key).
+    __tablename__ = "ticket_archive"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_date)"}
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    created_date = Column(DateTime, primary_key=True)
+    user_id = Column(Integer, index=True)
+    description = Column(Text)
+    category = Column(Enum(CategoryEnum))
+    priority = Column(Enum(PriorityEnum))
+    status = Column(Enum(StatusEnum))
+    updated_at = Column(DateTime)
+    incident_id = Column(Integer, nullable=True)
+    escalation_count = Column(Integer, nullable=False, default=0)
+    imported = Column(Boolean, nullable=True, default=False)
+    resolution_id = Column(Integer, nullable=True)
+    resolution_text = Column(Text, nullable=True)
+    resolved_date = Column(DateTime, nullable=True)
+    resolution_updated_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class TicketEventArchive(Base):
+    # History of archived tickets, moved out of ticket_events as is
+    __tablename__ = "ticket_event_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    ticket_id = Column(Integer, index=True)
+    type = Column(Enum(EventTypeEnum))
+    actor_id = Column(Integer, nullable=True)
+    payload = Column(JSON, default=dict)
+    created_at = Column(DateTime)
+
+class ListVersion(Base):
+    # One counter per ticket list ("global" for the admin list, "user:<id>" per user),
+    # bumped on every ticket/resolution write and used to build the list ETags
+    __tablename__ = "list_versions"
+
+    scope = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class IndexChange(Base):
+    # Change log for the retrieval index: one row per corpus-changing write, numbered by
+    # the "retrieval_index" ListVersion counter. ticket_id NULL means "rebuild everything".
+    # shard is the retrieval shard (submitter's department key) the ticket belongs to.
+    __tablename__ = "index_changes"
+
+    version = Column(Integer, primary_key=True)
+    ticket_id = Column(Integer, nullable=True)
+    shard = Column(String, nullable=True, index=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class ConfirmedFix(Base):
+    # How often a suggested fix was picked by the user ("Selected AI Fix: ...") versus
+    # shown on a ticket that was then escalated. Keyed by a hash of the normalized text.
+    __tablename__ = "confirmed_fixes"
+
+    fix_key = Column(String, primary_key=True)
+    fix_text = Column(Text)
+    selected_count = Column(Integer, nullable=False, default=0)
+    escalated_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class SuggestionLease(Base):
+    # Cross-worker single flight for suggestion generation (singleflight.py): the worker
+    # that inserts the row computes, the others poll for its result until expires_at
+    __tablename__ = "suggestion_leases"
+
+    key = Column(String, primary_key=True)
+    owner = Column(String)
+    result = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class IdempotencyKey(Base):
+    # Stored responses for requests sent with an Idempotency-Key header (idempotency.py).
+    # key is a hash of the caller, the route and the client's key; response stays NULL
+    # while the first request is still running.
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)
+    owner = Column(String)
+    request_hash = Column(String)
+    status_code = Column(Integer, nullable=True)
+    response = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class Job(Base):
+    # Progress record for long-running background work (bulk imports etc.), stored in
+    # the database so any worker can answer the status endpoint
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, index=True)
+    status = Column(Enum(JobStatusEnum), default=JobStatusEnum.Queued)
+    processed = Column(Integer, default=0)
+    succeeded = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    errors = Column(JSON, default=list)
+    # Where a resumable job got to (and its parameters), committed with each batch
+    checkpoint = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+# Output of the offline clustering job (clustering.py), one set of rows per Job run
+
+class TicketCluster(Base):
+    __tablename__ = "ticket_clusters"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("jobs.id"), index=True)
+    ticket_id = Column(Integer, ForeignKey("tickets.id"), index=True)
+    cluster = Column(Integer)
+
+class ClusterSummary(Base):
+    __tablename__ = "cluster_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("jobs.id"), index=True)
+    cluster = Column(Integer)
+    size = Column(Integer)
+    top_terms = Column(JSON)
+
+class ClusterDailyCount(Base):
+    __tablename__ = "cluster_daily_counts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("jobs.id"), index=True)
+    cluster = Column(Integer)
+    day = Column(Date)
+    count = Column(Integer)
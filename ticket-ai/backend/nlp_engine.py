@@ -1,133 +1,102 @@
 import json
-import re
-from groq import Groq
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import os
+import threading
+
+from retrieval import RetrievalIndex, preprocess_text
+from llm_scheduler import scheduler, DeadlineExceeded
+import prompt_builder, tracing
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# We initialize the Groq client
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY", "")
-client = Groq(api_key=GROQ_API_KEY)
+# Point at another OpenAI-compatible endpoint, e.g. benchmarks/fake_groq.py for load tests
+GROQ_BASE_URL = os.environ.get("GROQ_BASE_URL") or None
+# Per attempt; the SDK retries failed calls LLM_MAX_RETRIES times with a backoff of up
+# to 8 s, so one admitted call takes at most LLM_MAX_CALL_SECONDS
+LLM_CALL_TIMEOUT_SECONDS = float(os.environ.get("LLM_CALL_TIMEOUT_SECONDS", "20"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+LLM_MAX_CALL_SECONDS = LLM_CALL_TIMEOUT_SECONDS * (LLM_MAX_RETRIES + 1) + 8.0 * LLM_MAX_RETRIES
+
+# The Groq SDK is slow to import, so the client is created on first use rather than when
+# the API starts. `nlp_engine.client` still works as a module attribute (PEP 562).
+_client_lock = threading.Lock()
+
+def get_client():
+    client = globals().get("client")
+    if client is None:
+        with _client_lock:
+            client = globals().get("client")
+            if client is None:
+                from groq import Groq
+                client = globals()["client"] = Groq(
+                    api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL,
+                    timeout=LLM_CALL_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES
+                )
+    return client
+
+def __getattr__(name):
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-def preprocess_text(text):
-    if pd.isna(text):
-        return ""
-    text = str(text).lower()
-    text = re.sub(r'[^\w\s]', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
+FALLBACK_MESSAGE = "Our automated assistant is temporarily unavailable. A support rep will respond shortly."
 
-def generate_ai_resolution(new_ticket_desc: str, historical_tickets: list):
+def generate_ai_resolution(new_ticket_desc: str, historical_tickets: list = None, index: RetrievalIndex = None, matches: list = None, priority=None):
+    # Retrieval runs against a prebuilt index when one is passed (the API's shared
+    # index), otherwise a throwaway index is fitted on the given historical tickets.
+    # Callers that already searched the index can pass its (score, record) matches.
+    # The prompt is built by prompt_builder within its token budget, and the Groq call
+    # itself waits its turn in the LLM scheduler, ordered by ticket priority.
     try:
-        if not historical_tickets:
-            historical_context = "No previous resolutions available."
-        else:
-            # 1. Prepare historical data in Pandas
-            df = pd.DataFrame(historical_tickets)
-            df['combined_text'] = df['description'].fillna('') + " " + df['resolution_text'].fillna('')
-            df['processed_text'] = df['combined_text'].apply(preprocess_text)
-            
-            # 2. Add current unseen ticket
-            new_processed = preprocess_text(new_ticket_desc)
-            
-            # 3. Vectorize and compute TF-IDF
-            vectorizer = TfidfVectorizer(stop_words='english', max_features=10000)
-            
-            try:
-                # Fit on history
-                tfidf_matrix = vectorizer.fit_transform(df['processed_text'])
-                new_vector = vectorizer.transform([new_processed])
-                
-                # similarities
-                cosine_similarities = cosine_similarity(new_vector, tfidf_matrix).flatten()
-                
-                # Get top 5 matches
-                top_k = 5
-                top_indices = cosine_similarities.argsort()[-top_k:][::-1]
-                
-                context_parts = []
-                for idx in top_indices:
-                    score = cosine_similarities[idx]
-                    match = df.iloc[idx]
-                    res_text = match['resolution_text']
-                    
-                    # Force ignore if there is ZERO match similarity (stops irrelevant VPN fixes showing up for Printer issues)
-                    if score < 0.05:
-                        continue
-                        
-                    # Skip if the text is clearly a JSON array (AI generated list) to prevent recursive feedback loops
-                    if str(res_text).startswith('[') and str(res_text).endswith(']'):
-                        continue
-                        
-                    context_parts.append(
-                        f"- Suggestion (Similarity: {score:.4f}): {res_text}"
-                    )
-                
-                historical_context = "\n".join(context_parts)
-                if not historical_context:
-                    historical_context = "No previous organic resolutions available."
-                    
-            except Exception as e:
-                # Fallback if TFIDF fails (e.g. empty vocab)
-                historical_context = ""
-                for t in historical_tickets[-20:]:  # Check last 20 to find 5 good ones
-                    if not str(t['resolution_text']).startswith('['):
-                        historical_context += f"- Fix: {t['resolution_text']}\n"
-                        if historical_context.count("- Fix") >= 5:
-                            break
-    
-        prompt = f"""
-You are an expert customer support AI agent. A user has submitted a new support issue.
-Below are some top historical resolutions for similar issues retrieved from our database using TF-IDF similarity.
+        if matches is None and index is None and not historical_tickets:
+            matches = []
+        elif matches is None:
+            with tracing.span("nlp.retrieval", fitted=index is None):
+                try:
+                    if index is None:
+                        index = RetrievalIndex().build(historical_tickets)
+                    matches = index.search(new_ticket_desc, top_k=5)
+                except Exception as e:
+                    # Fallback if TFIDF fails (e.g. empty vocab): the most recent fixes, unranked
+                    recent = list(reversed(historical_tickets[-20:])) if historical_tickets else index.latest(20)
+                    matches = [(None, t) for t in recent]
 
-New User Issue: "{new_ticket_desc}"
+        with tracing.span("nlp.prompt") as span:
+            messages, stats = prompt_builder.build_messages(new_ticket_desc, matches)
+            if span:
+                span.set(prompt_tokens=stats["prompt_tokens"], resolutions_sent=stats["resolutions_sent"])
 
-Historical Resolutions:
-{historical_context}
+        def call_groq():
+            with tracing.span("llm.groq", model="llama-3.1-8b-instant") as span:
+                completion = get_client().chat.completions.create(
+                    model="llama-3.1-8b-instant",
+                    messages=messages,
+                    temperature=0.6,
+                    max_tokens=prompt_builder.PROMPT_MAX_OUTPUT_TOKENS,
+                    response_format=prompt_builder.RESPONSE_FORMAT,
+                    stream=False,
+                    stop=None,
+                )
+                usage = getattr(completion, "usage", None)
+                if span and isinstance(getattr(usage, "completion_tokens", None), int):
+                    span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+                return completion
 
-Your task is to review these historical resolutions. If the historical resolutions are strongly relevant, synthesize them into 5 actionable steps.
-HOWEVER, if the historical resolutions are missing, or seem completely irrelevant to the User's Issue, YOU MUST completely ignore them and brainstorm exactly 5 highly relevant, dynamic, and unique troubleshooting steps based on your expert IT knowledge. Provide fresh and specific steps!
+        # The queue span covers waiting for admission plus the call itself
+        with tracing.span("llm.scheduler", priority=str(getattr(priority, "value", priority))):
+            completion = scheduler.run(call_groq, priority=priority)
+        prompt_builder.record_usage(stats, completion)
 
-Return your output STRICTLY as a valid JSON array of 5 plain strings. Do NOT include markdown, metrics, or anything else outside the JSON block.
+        return prompt_builder.parse_steps(completion.choices[0].message.content)
 
-Example output format only:
-[
-  "First unique troubleshooting step",
-  "Second unique troubleshooting step",
-  ...
-]
-"""
-        completion = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.6,
-            max_tokens=1024,
-            stream=False,
-            stop=None,
-        )
-        
-        response_text = completion.choices[0].message.content.strip()
-        response_text = re.sub(r"^```(?:json)?\n?", "", response_text)
-        response_text = re.sub(r"\n?```$", "", response_text)
-        response_text = response_text.strip()
-        
-        try:
-            arr = json.loads(response_text)
-            if isinstance(arr, list):
-                return json.dumps(arr)
-        except:
-            pass
-            
-        return json.dumps([response_text])
-            
+    except DeadlineExceeded as e:
+        print(f"LLM queue timeout: {e}")
+        return json.dumps([FALLBACK_MESSAGE])
     except Exception as e:
         print(f"Groq/NLP System Error: {e}")
-        return json.dumps(["Our automated assistant is temporarily unavailable. A support rep will respond shortly."])
+        return json.dumps([FALLBACK_MESSAGE])
 
 def get_similar_tickets(new_ticket_desc: str, historical_tickets: list, top_n: int = 3):
     return []
@@ -0,0 +1,189 @@
+import functools
+import json
+import math
+import os
+import re
+
+import metrics, fixes
+from retrieval import preprocess_text, is_ai_suggestion
+
+# Builds the chat messages for a suggestion request within a fixed token budget.
+#   - The instructions are a static system message, byte-identical on every request,
+#     so the provider can reuse its cached prefix; its token count is computed once.
+#   - Retrieved resolutions are merged when near-identical (seed data and real history
+#     are full of the same fix pasted on many tickets) and sent once with a count.
+#   - Context is added best match first until PROMPT_INPUT_TOKEN_BUDGET is reached.
+#   - The reply is requested in JSON object mode with an output budget sized for five
+#     short steps instead of the old 1024 tokens.
+# Token counts are estimates from a local heuristic (no tokenizer download); real
+# provider usage is recorded next to them in the metrics.
+
+PROMPT_INPUT_TOKEN_BUDGET = int(os.getenv("PROMPT_INPUT_TOKEN_BUDGET", "600"))
+PROMPT_MAX_OUTPUT_TOKENS = int(os.getenv("PROMPT_MAX_OUTPUT_TOKENS", "256"))
+# Word-set Jaccard similarity at which two resolutions count as the same fix
+PROMPT_MERGE_SIMILARITY = float(os.getenv("PROMPT_MERGE_SIMILARITY", "0.8"))
+
+NUM_STEPS = 5
+MAX_STEP_WORDS = 25
+# Matches below this similarity are unrelated (stops VPN fixes showing up for printer issues)
+MIN_CONTEXT_SCORE = 0.05
+# A huge pasted description shouldn't crowd out all of the context
+MAX_ISSUE_TOKENS = 200
+# Per-message framing tokens added by the chat template
+MESSAGE_OVERHEAD = 4
+
+SYSTEM_PROMPT = f"""You are an expert IT support agent. You receive a new support issue and the most similar historical resolutions from our ticket database, best match first, each with its similarity (0-1) and how many similar tickets it resolved.
+If the historical resolutions are relevant, turn them into actionable steps. If they are missing or irrelevant to the issue, ignore them and use your own IT knowledge instead.
+Reply with a JSON object of the form {{"steps": ["...", "..."]}} holding exactly {NUM_STEPS} distinct, specific troubleshooting steps. Each step is a plain string of at most {MAX_STEP_WORDS} words. No markdown and nothing outside the JSON object."""
+
+RESPONSE_FORMAT = {"type": "json_object"}
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text):
+    # Close to BPE tokenizers on English: short words are one token, longer words about
+    # one per 4 characters, each punctuation mark one
+    return sum(max(1, math.ceil(len(p) / 4)) if p[0].isalnum() or p[0] == "_" else 1
+               for p in _PIECE.findall(text or ""))
+
+@functools.lru_cache(maxsize=1)
+def system_tokens():
+    return estimate_tokens(SYSTEM_PROMPT) + MESSAGE_OVERHEAD
+
+def truncate_to_tokens(text, budget):
+    if estimate_tokens(text) <= budget:
+        return text
+    words, kept = text.split(), []
+    used = 1  # the ellipsis
+    for word in words:
+        cost = estimate_tokens(word)
+        if used + cost > budget:
+            break
+        kept.append(word)
+        used += cost
+    return " ".join(kept) + "…"
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+def merge_resolutions(matches):
+    # matches are (score, record) pairs, best first; score None means unranked.
+    # Returns one entry per distinct fix: its text, best score and number of tickets.
+    merged = []
+    for score, record in matches:
+        if score is not None and score < MIN_CONTEXT_SCORE:
+            continue
+        text = str(record.get("resolution_text") or "").strip()
+        if not text or is_ai_suggestion(text):
+            continue
+        text = fixes.selected_fix(text) or text
+        words = set(preprocess_text(text).split())
+        for entry in merged:
+            if _jaccard(words, entry["words"]) >= PROMPT_MERGE_SIMILARITY:
+                entry["count"] += 1
+                if score is not None and (entry["score"] is None or score > entry["score"]):
+                    entry["score"] = score
+                break
+        else:
+            merged.append({"text": text, "score": score, "count": 1, "words": words})
+    return merged
+
+def _context_line(entry, text):
+    details = []
+    if entry["score"] is not None:
+        details.append(f"{entry['score']:.2f}")
+    if entry["count"] > 1:
+        details.append(f"resolved {entry['count']} tickets")
+    return f"- [{', '.join(details)}] {text}" if details else f"- {text}"
+
+def _verbatim_context_tokens(matches):
+    # What pasting every match the old way would have cost
+    return sum(
+        estimate_tokens(f"- Suggestion (Similarity: {score or 0:.4f}): {record.get('resolution_text')}")
+        for score, record in matches if score is None or score >= MIN_CONTEXT_SCORE
+    )
+
+def build_messages(description, matches):
+    issue = truncate_to_tokens(str(description or "").strip(), MAX_ISSUE_TOKENS)
+    head = f'New user issue: "{issue}"\n\nHistorical resolutions:\n'
+    budget = PROMPT_INPUT_TOKEN_BUDGET - system_tokens() - MESSAGE_OVERHEAD - estimate_tokens(head)
+
+    entries = merge_resolutions(matches)
+    lines = []
+    for entry in entries:
+        line = _context_line(entry, entry["text"])
+        cost = estimate_tokens(line) + 1
+        if cost > budget:
+            # The best match still goes in, shortened, if there is room for a useful part of it
+            room = budget - estimate_tokens(_context_line(entry, "")) - 1
+            if not lines and room >= 16:
+                line = _context_line(entry, truncate_to_tokens(entry["text"], room))
+                lines.append(line)
+                budget -= estimate_tokens(line) + 1
+            break
+        lines.append(line)
+        budget -= cost
+    context = "\n".join(lines) or "None available."
+
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": head + context},
+    ]
+    stats = {
+        "prompt_tokens": system_tokens() + MESSAGE_OVERHEAD + estimate_tokens(head + context),
+        "context_tokens_verbatim": _verbatim_context_tokens(matches),
+        "context_tokens": estimate_tokens(context) if lines else 0,
+        "resolutions_in": len(matches),
+        "resolutions_distinct": len(entries),
+        "resolutions_sent": len(lines),
+    }
+    return messages, stats
+
+def parse_steps(response_text):
+    # JSON mode returns {"steps": [...]}; a bare array is accepted too. Anything else is
+    # passed through as a single suggestion.
+    text = re.sub(r"^```(?:json)?\n?", "", (response_text or "").strip())
+    text = re.sub(r"\n?```$", "", text).strip()
+    try:
+        parsed = json.loads(text)
+    except ValueError:
+        return json.dumps([text])
+    if isinstance(parsed, dict):
+        parsed = parsed.get("steps", next((v for v in parsed.values() if isinstance(v, list)), None))
+    if isinstance(parsed, list):
+        return json.dumps([str(step) for step in parsed])
+    return json.dumps([text])
+
+def record_usage(stats, completion=None):
+    metrics.inc("llm.prompts")
+    metrics.inc("llm.prompt_tokens_estimated", stats["prompt_tokens"])
+    metrics.inc("llm.context_tokens_verbatim", stats["context_tokens_verbatim"])
+    metrics.inc("llm.context_tokens_sent", stats["context_tokens"])
+    usage = getattr(completion, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if isinstance(prompt_tokens, int) and isinstance(completion_tokens, int):
+        metrics.inc("llm.usage_requests")
+        metrics.inc("llm.usage_prompt_tokens", prompt_tokens)
+        metrics.inc("llm.usage_completion_tokens", completion_tokens)
+
+def token_report():
+    # Per-request averages for this worker: context before/after merging and budgeting,
+    # the estimated prompt, and what the provider actually billed
+    counters = metrics.snapshot()["counters"]
+    prompts = counters.get("llm.prompts", 0)
+    billed = counters.get("llm.usage_requests", 0)
+
+    def per(name, n):
+        return round(counters.get(name, 0) / n, 1) if n else None
+
+    return {
+        "requests": prompts,
+        "context_tokens_verbatim": per("llm.context_tokens_verbatim", prompts),
+        "context_tokens_sent": per("llm.context_tokens_sent", prompts),
+        "prompt_tokens_estimated": per("llm.prompt_tokens_estimated", prompts),
+        "prompt_tokens_billed": per("llm.usage_prompt_tokens", billed),
+        "completion_tokens_billed": per("llm.usage_completion_tokens", billed),
+        "input_token_budget": PROMPT_INPUT_TOKEN_BUDGET,
+        "max_output_tokens": PROMPT_MAX_OUTPUT_TOKENS,
+    }
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import threading
+from collections import defaultdict
+
+import orjson
+from sqlalchemy import text
+from sqlalchemy.orm import selectinload
+
+import models, versioning, serialization
+from database import SessionLocal, engine
+
+# Live ticket updates for GET /tickets/stream. Ticket writes publish the ids they
+# touched after committing; every subscribed stream gets the changed tickets (never
+# the full list). Topics are the same scopes as the list ETags: "user:<id>" for a
+# user's own tickets and "global" for admins.
+#
+# PUBSUB_BACKEND=memory (default) fans out inside this worker only. With
+# PUBSUB_BACKEND=postgres the ids go out through NOTIFY and every worker LISTENs,
+# loads the tickets and fans out to its own subscribers.
+
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "memory")
+NOTIFY_CHANNEL = "ticket_updates"
+# Postgres NOTIFY payloads are capped at 8000 bytes
+NOTIFY_IDS_PER_MESSAGE = 500
+SUBSCRIBER_QUEUE_SIZE = 100
+
+class Subscriber:
+    def __init__(self, topics, loop):
+        self.topics = topics
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def offer(self, message):
+        # Runs on the subscriber's event loop. A client that falls this far behind gets
+        # told to refetch its list instead of an unbounded backlog.
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            message = {"type": "resync"}
+        self.queue.put_nowait(message)
+
+class Broker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.topics = defaultdict(set)
+
+    def subscribe(self, topics, loop):
+        sub = Subscriber(topics, loop)
+        with self.lock:
+            for topic in topics:
+                self.topics[topic].add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            for topic in sub.topics:
+                self.topics[topic].discard(sub)
+                if not self.topics[topic]:
+                    del self.topics[topic]
+
+    def has_subscribers(self):
+        return bool(self.topics)
+
+    def deliver(self, topics, message):
+        # Safe to call from any thread (request handlers run in the threadpool)
+        with self.lock:
+            subs = set().union(*(self.topics.get(topic, ()) for topic in topics))
+        for sub in subs:
+            sub.loop.call_soon_threadsafe(sub.offer, message)
+
+broker = Broker()
+
+def topics_for(user):
+    if user.role == models.RoleEnum.admin:
+        return [versioning.GLOBAL_SCOPE]
+    return [versioning.user_scope(user.id)]
+
+def _fan_out(db, ticket_ids):
+    tickets = (
+        db.query(models.Ticket)
+        .options(selectinload(models.Ticket.resolution))
+        .filter(models.Ticket.id.in_(ticket_ids))
+        .all()
+    )
+    for ticket in tickets:
+        broker.deliver(
+            [versioning.user_scope(ticket.user_id), versioning.GLOBAL_SCOPE],
+            {"type": "ticket", "ticket": serialization.ticket_to_dict(ticket)}
+        )
+
+def publish(db, ticket_ids):
+    # Call after the write has committed
+    ticket_ids = sorted(set(ticket_ids))
+    if not ticket_ids:
+        return
+    if PUBSUB_BACKEND == "postgres":
+        for start in range(0, len(ticket_ids), NOTIFY_IDS_PER_MESSAGE):
+            payload = orjson.dumps(ticket_ids[start:start + NOTIFY_IDS_PER_MESSAGE]).decode()
+            db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": NOTIFY_CHANNEL, "payload": payload})
+        db.commit()
+    elif broker.has_subscribers():
+        _fan_out(db, ticket_ids)
+
+# Postgres LISTEN loop, one thread per worker, started with the first subscriber
+
+_listener = None
+_listener_lock = threading.Lock()
+
+def _listen():
+    import select
+
+    conn = engine.raw_connection()
+    try:
+        pg = conn.driver_connection
+        pg.autocommit = True
+        pg.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+        while True:
+            if select.select([pg], [], [], 30) == ([], [], []):
+                continue
+            pg.poll()
+            ticket_ids = []
+            while pg.notifies:
+                ticket_ids.extend(orjson.loads(pg.notifies.pop(0).payload))
+            if ticket_ids and broker.has_subscribers():
+                db = SessionLocal()
+                try:
+                    _fan_out(db, ticket_ids)
+                finally:
+                    db.close()
+    finally:
+        conn.close()
+
+def ensure_listener():
+    global _listener
+    if PUBSUB_BACKEND != "postgres":
+        return
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen, name="pubsub-listener", daemon=True)
+            _listener.start()
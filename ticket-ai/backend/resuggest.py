@@ -0,0 +1,285 @@
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from sqlalchemy import exists, func, insert, literal, or_, select, update
+from sqlalchemy.orm import aliased
+
+import models, jobs, events, versioning, pubsub, retrieval, fixes, metrics
+from database import SessionLocal
+from llm_scheduler import LLM_MAX_CONCURRENCY
+from nlp_engine import generate_ai_resolution, FALLBACK_MESSAGE
+
+# Recomputes the stored AI suggestions of open tickets, e.g. after the knowledge base
+# improved, or for tickets raised by an admin (which never got any). Only tickets
+# whose current resolution is an AI suggestion list, or that have none, are touched;
+# selected fixes and human notes are never overwritten.
+#
+# Pipeline, one chunk of RESUGGEST_CHUNK_SIZE tickets at a time:
+#   1. retrieval, batched per department shard (RetrievalIndex.search_many), in a pool
+#      of RESUGGEST_WORKERS processes that each keep their own shards; a few chunks
+#      are kept in flight ahead of the LLM step
+#   2. the proven-fix fast path, else an LLM call; RESUGGEST_LLM_CONCURRENCY calls run
+#      at once at Low priority, so the LLM scheduler's rate limit applies and
+#      interactive requests go first
+#   3. one transaction per chunk writes the suggestions, the "suggested" events and the
+#      job checkpoint (last ticket id done, plus the tickets the LLM couldn't serve), so
+#      a crashed or stopped run resumes after the last committed chunk, retrying those
+#      tickets first:
+#         python resuggest.py --resume <job id>
+# Run from backend/, e.g. python resuggest.py --category Network --since 2024-06-01
+
+RESUGGEST_CHUNK_SIZE = int(os.getenv("RESUGGEST_CHUNK_SIZE", "200"))
+# 0 runs retrieval in this process
+RESUGGEST_WORKERS = int(os.getenv("RESUGGEST_WORKERS", str(os.cpu_count() or 1)))
+RESUGGEST_LLM_CONCURRENCY = int(os.getenv("RESUGGEST_LLM_CONCURRENCY", str(LLM_MAX_CONCURRENCY)))
+TOP_K = 5
+# A Running job whose checkpoint hasn't moved for this long is assumed dead and may be resumed
+STALLED_AFTER = datetime.timedelta(minutes=10)
+
+OPEN_STATUSES = [models.StatusEnum.Open.value, models.StatusEnum.In_Progress.value]
+
+def make_filters(statuses=None, category=None, department=None, since=None, missing_only=False):
+    # Stored in the checkpoint as plain JSON so a resumed run selects the same tickets
+    return {
+        "statuses": list(statuses or OPEN_STATUSES),
+        "category": category,
+        "department": department,
+        "since": since.isoformat() if isinstance(since, (datetime.date, datetime.datetime)) else since,
+        "missing_only": missing_only,
+    }
+
+def _select(db, filters, after_id, limit, ids=None):
+    # One row per ticket, joined to its newest resolution only, so LIMIT pages on
+    # tickets and the AI-list check applies to what the ticket currently shows
+    t, r = models.Ticket, models.Resolution
+    newest = aliased(r)
+    newest_id = select(func.max(newest.id)).where(newest.ticket_id == t.id).correlate(t).scalar_subquery()
+    query = db.query(
+        t.id, t.user_id, t.description, t.priority, models.User.department,
+        r.id.label("resolution_id"), r.resolution_text
+    ).outerjoin(models.User, models.User.id == t.user_id).outerjoin(r, r.id == newest_id).filter(
+        t.id > after_id,
+        t.status.in_([models.StatusEnum(s) for s in filters["statuses"]]),
+        r.id.is_(None) if filters["missing_only"] else or_(r.id.is_(None), r.resolution_text.like("[%")),
+    )
+    if ids is not None:
+        query = query.filter(t.id.in_(ids))
+    if filters["category"]:
+        query = query.filter(t.category == models.CategoryEnum(filters["category"]))
+    if filters["department"]:
+        query = query.filter(models.User.department == filters["department"])
+    if filters["since"]:
+        query = query.filter(t.created_date >= datetime.datetime.fromisoformat(filters["since"]))
+    return query.order_by(t.id).limit(limit).all()
+
+def _chunks(db, filters, after_id, size):
+    while True:
+        rows = _select(db, filters, after_id, size)
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1].id
+
+def retrieve(items, top_k=TOP_K):
+    # items are (ticket_id, description, department); runs in a pool process
+    db = SessionLocal()
+    try:
+        by_department = {}
+        for ticket_id, description, department in items:
+            by_department.setdefault(retrieval.shard_key(department), []).append((ticket_id, description, department))
+        results = {}
+        for group in by_department.values():
+            index = retrieval.get_index(db, group[0][2])
+            for (ticket_id, _, _), matches in zip(group, index.search_many([d for _, d, _ in group], top_k=top_k)):
+                results[ticket_id] = matches
+        return results
+    finally:
+        db.close()
+
+def _suggest(db, llm_pool, rows, matches):
+    # Returns ticket_id -> (text, path). The fast path runs here (it needs the session);
+    # only the LLM calls go to the thread pool.
+    results, llm_rows = {}, []
+    for row in rows:
+        proven = fixes.proven_fixes(db, matches.get(row.id, []))
+        if proven:
+            results[row.id] = (json.dumps(proven), "fastpath")
+        else:
+            llm_rows.append(row)
+    texts = llm_pool.map(
+        lambda row: generate_ai_resolution(row.description, matches=matches.get(row.id, []), priority="Low"), llm_rows
+    )
+    results.update({row.id: (text, "llm") for row, text in zip(llm_rows, texts)})
+    return results
+
+def _write(db, job, rows, suggestions):
+    # suggestions maps ticket_id -> new text; only changed ones are written. Each write
+    # is guarded so it skips tickets a user changed (e.g. selected a fix) while this
+    # chunk was computed, and runs as its own statement because an executemany
+    # rowcount doesn't say which rows matched. Returns (written ids, skipped count).
+    res = models.Resolution.__table__
+    changed = [row for row in rows if row.id in suggestions and suggestions[row.id] != row.resolution_text]
+    now = datetime.datetime.utcnow()
+    written = []
+    for row in changed:
+        text = suggestions[row.id]
+        if row.resolution_id is not None:
+            stmt = update(res).where(res.c.id == row.resolution_id, res.c.resolution_text == row.resolution_text).values(
+                resolution_text=text, updated_at=now
+            )
+        else:
+            stmt = insert(res).from_select(
+                ["ticket_id", "resolution_text", "resolved_date", "updated_at"],
+                select(literal(row.id), literal(text), literal(now), literal(now)).where(
+                    ~exists().where(res.c.ticket_id == row.id)
+                )
+            )
+        if db.execute(stmt).rowcount:
+            written.append(row)
+    events.record_many(db, models.EventTypeEnum.suggested, None, {
+        row.id: {"text": suggestions[row.id], "job_id": job.id} for row in written
+    })
+    if written:
+        versioning.bump(db, *{row.user_id for row in written})
+    return [row.id for row in written], len(changed) - len(written)
+
+def run_resuggest(db, job, filters=None, workers=RESUGGEST_WORKERS, chunk_size=RESUGGEST_CHUNK_SIZE,
+                  llm_concurrency=RESUGGEST_LLM_CONCURRENCY):
+    checkpoint = dict(job.checkpoint or {})
+    filters = checkpoint.get("filters") or filters or make_filters()
+    stats = dict(checkpoint.get("stats") or {})
+    for name in ("seconds", "retrieval_seconds", "llm_seconds", "write_seconds", "llm", "fastpath", "unchanged", "skipped"):
+        stats.setdefault(name, 0)
+    stats.setdefault("tickets_per_second", None)
+    jobs.start(db, job)
+
+    # Spawned, not forked: the API process has threads (and open connections) of its own
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) if workers > 0 else None
+    llm_pool = ThreadPoolExecutor(max_workers=max(llm_concurrency, 1))
+    last_id = checkpoint.get("last_id", 0)
+    # Tickets the LLM couldn't serve in earlier runs go first (if they still match)
+    retry_rows = _select(db, filters, 0, None, ids=checkpoint["retry_ids"]) if checkpoint.get("retry_ids") else []
+    retry_ids = {row.id for row in retry_rows}
+    chunks = chain(
+        (retry_rows[i:i + chunk_size] for i in range(0, len(retry_rows), chunk_size)),
+        _chunks(db, filters, last_id, chunk_size)
+    )
+    pending = deque()
+
+    def submit():
+        rows = next(chunks, None)
+        if rows is not None:
+            items = [(row.id, row.description, row.department) for row in rows]
+            pending.append((rows, pool.submit(retrieve, items) if pool else items))
+
+    try:
+        # Keeps the pool busy while the LLM step works through the oldest chunk
+        for _ in range(max(workers, 1) + 1):
+            submit()
+        while pending:
+            started = time.perf_counter()
+            rows, retrieval_result = pending.popleft()
+            matches = retrieval_result.result() if pool else retrieve(retrieval_result)
+            submit()
+            stats["retrieval_seconds"] += time.perf_counter() - started
+
+            step = time.perf_counter()
+            results = _suggest(db, llm_pool, rows, matches)
+            stats["llm_seconds"] += time.perf_counter() - step
+
+            step = time.perf_counter()
+            suggestions, errors = {}, []
+            for ticket_id, (text, path) in results.items():
+                if FALLBACK_MESSAGE in text:
+                    # The LLM was unavailable; keep what the ticket has
+                    errors.append({"ticket_id": ticket_id, "error": "LLM unavailable"})
+                    continue
+                suggestions[ticket_id] = text
+                stats[path] += 1
+            written, skipped = _write(db, job, rows, suggestions)
+            stats["unchanged"] += len(suggestions) - len(written) - skipped
+            stats["skipped"] += skipped
+            job.processed += len(rows)
+            job.succeeded += len(suggestions) - skipped
+            job.failed += len(errors)
+            jobs.add_errors(job, errors)
+            stats["write_seconds"] += time.perf_counter() - step
+            stats["seconds"] += time.perf_counter() - started
+            stats["tickets_per_second"] = round(job.processed / stats["seconds"], 2) if stats["seconds"] else None
+            last_id = max([last_id] + [row.id for row in rows])
+            retry_ids = (retry_ids - {row.id for row in rows}) | {e["ticket_id"] for e in errors}
+            job.checkpoint = {"filters": filters, "last_id": last_id, "retry_ids": sorted(retry_ids), "stats": stats}
+            db.commit()
+            pubsub.publish(db, written)
+            metrics.inc("resuggest.tickets", len(rows))
+            metrics.observe("resuggest.chunk", time.perf_counter() - started)
+    finally:
+        llm_pool.shutdown(wait=True)
+        if pool:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    jobs.finish(db, job)
+    return stats
+
+def start_job(db, filters=None):
+    job = jobs.create(db, "resuggest")
+    job.checkpoint = {"filters": filters or make_filters(), "last_id": 0}
+    db.commit()
+    return job
+
+def run_resuggest_job(job_id, workers=RESUGGEST_WORKERS):
+    # Background-task entry point for the admin trigger and resume endpoints
+    db = SessionLocal()
+    try:
+        job = db.query(models.Job).filter(models.Job.id == job_id).first()
+        try:
+            run_resuggest(db, job, workers=workers)
+        except Exception as e:
+            db.rollback()
+            jobs.add_errors(job, [{"error": str(e)}])
+            jobs.finish(db, job, models.JobStatusEnum.Failed)
+            print(f"Resuggest job {job_id} failed: {e}")
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute AI suggestions for open tickets")
+    parser.add_argument("--resume", type=int, metavar="JOB_ID", help="continue a stopped or failed run")
+    parser.add_argument("--status", action="append", choices=[s.value for s in models.StatusEnum])
+    parser.add_argument("--category", choices=[c.value for c in models.CategoryEnum])
+    parser.add_argument("--department")
+    parser.add_argument("--since", help="only tickets created on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--missing-only", action="store_true", help="only tickets without any suggestion")
+    parser.add_argument("--workers", type=int, default=RESUGGEST_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=RESUGGEST_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.resume:
+            job = db.query(models.Job).filter(models.Job.id == args.resume, models.Job.kind == "resuggest").first()
+            if job is None:
+                parser.error(f"no resuggest job {args.resume}")
+        else:
+            job = start_job(db, make_filters(args.status, args.category, args.department, args.since, args.missing_only))
+        print(f"Job {job.id}: starting after ticket {job.checkpoint.get('last_id', 0)}")
+        stats = run_resuggest(db, job, workers=args.workers, chunk_size=args.chunk_size)
+        print(f"Job {job.id}: {job.processed} tickets, {job.succeeded} suggested "
+              f"({stats['llm']} LLM, {stats['fastpath']} fast path, {stats['unchanged']} unchanged, "
+              f"{stats['skipped']} changed by users meanwhile), {job.failed} failed")
+        if job.checkpoint.get("retry_ids"):
+            print(f"{len(job.checkpoint['retry_ids'])} tickets to retry with --resume {job.id}")
+        print(f"{stats['tickets_per_second']} tickets/s; retrieval {stats['retrieval_seconds']:.1f} s, "
+              f"LLM {stats['llm_seconds']:.1f} s, writes {stats['write_seconds']:.1f} s")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
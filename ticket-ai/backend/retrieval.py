@@ -0,0 +1,512 @@
+import datetime
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import and_, not_, or_
+
+import models, versioning, metrics, tracing
+from corpus import CorpusStore
+
+# TF-IDF retrieval over historical resolutions. The corpus is split into shards: one per
+# department (by the submitter's User.department) plus a small "global" shard holding
+# one ticket for each fix users confirmed in several departments. Imported history and
+# tickets without a submitter belong to no department and go to a shared "history"
+# shard instead. A query searches the submitter's department shard, the history shard
+# and the global shard, so its cost follows the size of one department (plus the
+# imported history) rather than the whole company.
+#
+# Each worker process keeps its own copy of the shards it has used and keeps them in
+# line with the others through the database: every corpus-changing write bumps the
+# "retrieval_index" version and logs the touched ticket (and its shard) in
+# index_changes, and before serving a query a shard that hasn't checked for
+# INDEX_MAX_STALENESS_SECONDS compares versions and applies just its own logged delta
+# (or rebuilds from a fresh snapshot when the delta is large). Shards unused for
+# INDEX_SHARD_IDLE_SECONDS, or beyond the INDEX_MAX_SHARDS most recently used, are
+# dropped and rebuilt on their next query.
+#
+# Archived tickets (archive.py) are searched through a separate "<department>.archive"
+# shard per department. The archive only changes when the archival job runs, so these
+# indexes are refit once per run and never touched by live writes.
+
+INDEX_SCOPE = "retrieval_index"
+# Bumped once per archival batch; archive shards refit when it moves
+ARCHIVE_SCOPE = "retrieval_archive"
+INDEX_MAX_STALENESS_SECONDS = float(os.getenv("INDEX_MAX_STALENESS_SECONDS", "5"))
+# Above this many pending changes a full refit is cheaper than patching rows in
+INDEX_MAX_DELTA = int(os.getenv("INDEX_MAX_DELTA", "500"))
+# Rows appended or masked since the last fit, as a fraction of the fitted rows, before
+# a full refit. Appended rows reuse the old vocabulary, so unseen terms only start to
+# count after a refit; small corpora therefore refit on almost every change.
+INDEX_REFIT_DRIFT = float(os.getenv("INDEX_REFIT_DRIFT", "0.1"))
+# Change log rows older than this many versions are trimmed
+CHANGE_LOG_RETENTION = 10 * INDEX_MAX_DELTA
+INDEX_MAX_SHARDS = int(os.getenv("INDEX_MAX_SHARDS", "32"))
+INDEX_SHARD_IDLE_SECONDS = float(os.getenv("INDEX_SHARD_IDLE_SECONDS", "3600"))
+# A selected fix is cross-cutting once users in this many departments confirmed it
+GLOBAL_SHARD_MIN_DEPARTMENTS = int(os.getenv("GLOBAL_SHARD_MIN_DEPARTMENTS", "2"))
+GLOBAL_SHARD_MAX_ROWS = int(os.getenv("GLOBAL_SHARD_MAX_ROWS", "2000"))
+# Rows already in the global shard follow the change log like any shard; newly
+# cross-cutting fixes are picked up by a refit at most this often
+GLOBAL_SHARD_REFRESH_SECONDS = float(os.getenv("GLOBAL_SHARD_REFRESH_SECONDS", "60"))
+
+GLOBAL_SHARD = "_global"
+HISTORY_SHARD = "_history"
+UNASSIGNED_SHARD = "_unassigned"
+ARCHIVE_SUFFIX = ".archive"
+
+# numpy/scipy/scikit-learn are imported inside the methods that need them, so importing
+# this module (and everything that uses preprocess_text) stays cheap for API cold starts.
+
+def preprocess_text(text):
+    if text is None or (isinstance(text, float) and math.isnan(text)):
+        return ""
+    text = str(text).lower()
+    text = re.sub(r'[^\w\s]', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+def is_ai_suggestion(text):
+    # Stored AI suggestion lists are JSON arrays; they are never used as context, which
+    # would feed the model its own output back
+    text = str(text)
+    return text.startswith('[') and text.endswith(']')
+
+def shard_key(department):
+    # Department names are free text: "Finance", "finance " and "FINANCE" share a shard.
+    # Keys are also used in metric names, hence the conservative character set.
+    key = re.sub(r'\W+', '_', str(department or "").strip().lower()).strip('_')
+    return key or UNASSIGNED_SHARD
+
+def _document(record):
+    return preprocess_text(f"{record['description'] or ''} {record['resolution_text'] or ''}")
+
+def _compact_matrix(matrix):
+    # TF-IDF weights don't need float64, and int32 indices cover any shard this side of
+    # 2**31 stored terms; halves the matrix against scikit-learn's defaults
+    import numpy as np
+
+    if matrix.nnz < 2 ** 31:
+        matrix.indices = matrix.indices.astype(np.int32, copy=False)
+        matrix.indptr = matrix.indptr.astype(np.int32, copy=False)
+    return matrix
+
+class RetrievalIndex:
+    def __init__(self):
+        self.vectorizer = None
+        self.matrix = None
+        self.records = CorpusStore()
+        self.alive = None
+        self.fitted_rows = 0
+        self.unseen_rows = 0
+
+    def build(self, records):
+        import numpy as np
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        # Skip AI generated lists to prevent recursive feedback loops
+        records = [r for r in records if not is_ai_suggestion(r["resolution_text"])]
+        vectorizer = TfidfVectorizer(stop_words='english', max_features=10000, dtype=np.float32)
+        matrix = _compact_matrix(vectorizer.fit_transform(_document(r) for r in records)) if records else None
+        # Every term cut by max_features; only kept for introspection and can be huge
+        vectorizer.stop_words_ = None
+
+        self.vectorizer, self.matrix = vectorizer, matrix
+        self.records = CorpusStore.from_records(records)
+        self.alive = np.ones(len(records), dtype=bool)
+        self.fitted_rows = len(records)
+        return self
+
+    def __len__(self):
+        return 0 if self.alive is None else int(self.alive.sum())
+
+    def __contains__(self, ticket_id):
+        return ticket_id in self.records
+
+    def latest(self, n):
+        # The n most recently added live rows, newest first (decodes only those)
+        import numpy as np
+
+        if self.alive is None:
+            return []
+        return [self.records[row] for row in np.flatnonzero(self.alive)[::-1][:n]]
+
+    @property
+    def drift(self):
+        if self.alive is None:
+            return 0.0
+        changed = len(self.records) - self.fitted_rows + int((~self.alive).sum())
+        return changed / max(self.fitted_rows, 1)
+
+    def with_changes(self, records, removed_ids=()):
+        import numpy as np
+        import scipy.sparse as sp
+
+        # Copy-on-write delta: replaced/removed rows are masked out and new rows are
+        # appended using the existing vocabulary, so concurrent searches on the old
+        # object are never disturbed. Vocabulary only moves on a full rebuild.
+        updated = RetrievalIndex()
+        updated.vectorizer = self.vectorizer
+        updated.fitted_rows = self.fitted_rows
+        updated.alive = self.alive.copy()
+        updated.alive[self.records.rows_of(list(removed_ids) + [r["id"] for r in records])] = False
+
+        records = [r for r in records if not is_ai_suggestion(r["resolution_text"])]
+        if records:
+            new_rows = self.vectorizer.transform([_document(r) for r in records])
+            # Rows made only of out-of-vocabulary terms would be unsearchable until a refit
+            updated.unseen_rows = int((new_rows.getnnz(axis=1) == 0).sum())
+            updated.matrix = _compact_matrix(sp.vstack([self.matrix, new_rows], format="csr"))
+            updated.alive = np.concatenate([updated.alive, np.ones(len(records), dtype=bool)])
+        else:
+            updated.matrix = self.matrix
+        updated.records = self.records.extend(records)
+        return updated
+
+    def search(self, text, top_k=5):
+        if self.matrix is None or not len(self):
+            return []
+        from sklearn.metrics.pairwise import cosine_similarity
+
+        new_vector = self.vectorizer.transform([preprocess_text(text)])
+        scores = cosine_similarity(new_vector, self.matrix).flatten()
+        scores[~self.alive] = -1
+        top_indices = scores.argsort()[-top_k:][::-1]
+        return [(float(scores[idx]), self.records[idx]) for idx in top_indices if self.alive[idx]]
+
+    def search_many(self, texts, top_k=5):
+        # Batch variant for offline jobs: one transform and one sparse product for all
+        # the queries (rows are L2-normalized, so the product is the cosine similarity).
+        # Only rows sharing a term with the query come back, unlike search().
+        import numpy as np
+
+        if self.matrix is None or not len(self):
+            return [[] for _ in texts]
+        scores = (self.vectorizer.transform([preprocess_text(t) for t in texts]) @ self.matrix.T).tocsr()
+        results = []
+        for i in range(len(texts)):
+            start, end = scores.indptr[i], scores.indptr[i + 1]
+            rows, values = scores.indices[start:end], scores.data[start:end]
+            keep = self.alive[rows]
+            rows, values = rows[keep], values[keep]
+            top = np.argsort(values)[::-1][:top_k]
+            results.append([(float(values[j]), self.records[rows[j]]) for j in top])
+        return results
+
+def _corpus_query(db):
+    return db.query(
+        models.Ticket.id, models.Ticket.description, models.Resolution.resolution_text
+    ).join(models.Resolution, models.Resolution.ticket_id == models.Ticket.id).filter(
+        # Suggestions on currently escalated tickets didn't work, so don't retrieve them
+        models.Ticket.escalated_at.is_(None)
+    )
+
+def _to_records(rows):
+    return [{"id": r.id, "description": r.description, "resolution_text": r.resolution_text} for r in rows]
+
+def _shared(table):
+    # Rows of the history shard (table is Ticket or TicketArchive). IS comparisons, so
+    # rows from before the imported column existed (NULL) count as not imported.
+    return or_(table.imported.is_(True), table.user_id.is_(None))
+
+def _shard_criteria(db, name, table):
+    if name == HISTORY_SHARD:
+        return _shared(table)
+    # Matches the raw department values that map to this shard key
+    departments = [d for (d,) in db.query(models.User.department).distinct() if d is not None and shard_key(d) == name]
+    criteria = models.User.department.in_(departments)
+    if name == UNASSIGNED_SHARD:
+        # Submitters without a department (outer join below)
+        criteria = or_(models.User.department.is_(None), criteria)
+    return and_(criteria, not_(_shared(table)))
+
+def _shard_query(db, name):
+    return _corpus_query(db).outerjoin(models.User, models.User.id == models.Ticket.user_id).filter(
+        _shard_criteria(db, name, models.Ticket)
+    )
+
+def _archive_shard_query(db, name):
+    a = models.TicketArchive
+    return db.query(a.id, a.description, a.resolution_text).outerjoin(
+        models.User, models.User.id == a.user_id
+    ).filter(a.resolution_text.isnot(None), _shard_criteria(db, name, a))
+
+def load_corpus(db, department=None):
+    return _to_records(_shard_query(db, shard_key(department)).all())
+
+def load_global_corpus(db):
+    # One ticket (the most recent) per selected fix that was confirmed by users in at
+    # least GLOBAL_SHARD_MIN_DEPARTMENTS departments, most widely used fixes first
+    import fixes
+
+    rows = (
+        _corpus_query(db)
+        .add_columns(models.User.department)
+        .outerjoin(models.User, models.User.id == models.Ticket.user_id)
+        .filter(models.Resolution.resolution_text.like(f"{fixes.SELECTED_PREFIX}%"))
+        .order_by(models.Ticket.id.desc())
+    )
+    latest, departments = {}, {}
+    for row in rows:
+        key = fixes.fix_key(fixes.selected_fix(row.resolution_text) or "")
+        latest.setdefault(key, row)
+        departments.setdefault(key, set()).add(shard_key(row.department))
+    shared = [key for key in latest if len(departments[key]) >= GLOBAL_SHARD_MIN_DEPARTMENTS]
+    shared.sort(key=lambda key: len(departments[key]), reverse=True)
+    return _to_records([latest[key] for key in shared[:GLOBAL_SHARD_MAX_ROWS]])
+
+# Writers
+
+def _shards_of(db, ticket_ids):
+    rows = (
+        db.query(models.Ticket.id, models.Ticket.user_id, models.Ticket.imported, models.User.department)
+        .outerjoin(models.User, models.User.id == models.Ticket.user_id)
+        .filter(models.Ticket.id.in_(ticket_ids))
+    )
+    return {
+        row.id: HISTORY_SHARD if row.imported or row.user_id is None else shard_key(row.department)
+        for row in rows
+    }
+
+def record_change(db, ticket_id):
+    # Call inside the writing transaction, for every write that changes what a ticket
+    # contributes to the corpus. ticket_id=None asks every worker for a full rebuild.
+    record_changes(db, [ticket_id])
+
+def record_changes(db, ticket_ids):
+    # Set-based variant for bulk writes: one version bump and one INSERT for the batch
+    ticket_ids = list(ticket_ids)
+    if not ticket_ids:
+        return
+    if len(ticket_ids) > INDEX_MAX_DELTA:
+        ticket_ids = [None]
+    shards = _shards_of(db, [t for t in ticket_ids if t is not None])
+    versioning.bump_scopes(db, [INDEX_SCOPE], amount=len(ticket_ids))
+    version = versioning.current(db, INDEX_SCOPE)
+    first = version - len(ticket_ids) + 1
+    db.execute(models.IndexChange.__table__.insert(), [
+        {
+            "version": first + n, "ticket_id": ticket_id,
+            "shard": shards.get(ticket_id, UNASSIGNED_SHARD) if ticket_id is not None else None,
+            "created_at": datetime.datetime.utcnow(),
+        }
+        for n, ticket_id in enumerate(ticket_ids)
+    ])
+    if version // 1000 != (first - 1) // 1000:
+        db.query(models.IndexChange).filter(
+            models.IndexChange.version <= version - CHANGE_LOG_RETENTION
+        ).delete(synchronize_session=False)
+    # This worker should see its own write on the next query
+    registry.expire()
+
+# Readers
+
+class Shard:
+    scope = INDEX_SCOPE
+
+    def __init__(self, name):
+        self.name = name
+        self.index = None
+        self.version = 0
+        self.built_at = 0.0
+        self.last_check = 0.0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def load(self, db):
+        return _to_records(_shard_query(db, self.name).all())
+
+    def corpus_query(self, db):
+        return _shard_query(db, self.name)
+
+    def changes(self, db, version):
+        # Ticket ids this shard has to patch; None means rebuild
+        return [row.ticket_id for row in db.query(models.IndexChange.ticket_id).filter(
+            models.IndexChange.version > self.version, models.IndexChange.version <= version,
+            or_(models.IndexChange.shard == self.name, models.IndexChange.ticket_id.is_(None))
+        )]
+
+    def rebuild(self, db, version):
+        start = time.perf_counter()
+        index = RetrievalIndex()
+        with tracing.span("retrieval.rebuild", shard=self.name):
+            try:
+                index.build(self.load(db))
+            except ValueError:
+                # Empty vocabulary (no usable resolutions yet): serve an empty index
+                pass
+        self.index, self.version, self.built_at = index, version, time.monotonic()
+        metrics.inc("retrieval.shard_builds")
+        metrics.observe(f"retrieval.shard.{self.name}.build", time.perf_counter() - start)
+        metrics.set_gauge(f"retrieval.shard.{self.name}.rows", len(index))
+
+    def apply(self, db, version, changed):
+        index = self.index
+        if None in changed or index.vectorizer is None or index.matrix is None:
+            return self.rebuild(db, version)
+        changed = set(changed)
+        records = _to_records(self.corpus_query(db).filter(models.Ticket.id.in_(changed)).all())
+        updated = index.with_changes(records, removed_ids=changed - {r["id"] for r in records})
+        if updated.unseen_rows or updated.drift > INDEX_REFIT_DRIFT:
+            return self.rebuild(db, version)
+        self.index, self.version = updated, version
+        metrics.set_gauge(f"retrieval.shard.{self.name}.rows", len(updated))
+
+    def sync(self, db, version):
+        if self.index is None or version - self.version > CHANGE_LOG_RETENTION:
+            return self.rebuild(db, version)
+        if version == self.version:
+            return
+        changed = self.changes(db, version)
+        if len(changed) > INDEX_MAX_DELTA:
+            self.rebuild(db, version)
+        elif changed:
+            self.apply(db, version, changed)
+        else:
+            # Only other shards changed
+            self.version = version
+
+    def get(self, db):
+        self.last_used = time.monotonic()
+        if self.index is not None and time.monotonic() - self.last_check < INDEX_MAX_STALENESS_SECONDS:
+            return self.index
+        with self.lock:
+            # Cheap version check: one primary-key lookup
+            self.sync(db, versioning.current(db, self.scope))
+            self.last_check = time.monotonic()
+            return self.index
+
+class GlobalShard(Shard):
+    def load(self, db):
+        return load_global_corpus(db)
+
+    def corpus_query(self, db):
+        # Rows already in the shard are refreshed wherever their department is
+        return _corpus_query(db)
+
+    def changes(self, db, version):
+        return [row.ticket_id for row in db.query(models.IndexChange.ticket_id).filter(
+            models.IndexChange.version > self.version, models.IndexChange.version <= version
+        )]
+
+    def apply(self, db, version, changed):
+        if None in changed or time.monotonic() - self.built_at > GLOBAL_SHARD_REFRESH_SECONDS:
+            return self.rebuild(db, version)
+        relevant = [ticket_id for ticket_id in changed if ticket_id in self.index]
+        if relevant:
+            return super().apply(db, version, relevant)
+        self.version = version
+
+class ArchiveShard(Shard):
+    scope = ARCHIVE_SCOPE
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.department = name[:-len(ARCHIVE_SUFFIX)]
+
+    def load(self, db):
+        return _to_records(_archive_shard_query(db, self.department).all())
+
+    def sync(self, db, version):
+        # Archived rows are immutable; only an archival run changes the corpus
+        if self.index is None or version != self.version:
+            self.rebuild(db, version)
+
+class ShardRegistry:
+    def __init__(self, max_shards=INDEX_MAX_SHARDS, idle_seconds=INDEX_SHARD_IDLE_SECONDS):
+        self.max_shards = max_shards
+        self.idle_seconds = idle_seconds
+        self.shards = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _evict(self, name):
+        self.shards.pop(name)
+        metrics.inc("retrieval.shard_evictions")
+        metrics.set_gauge(f"retrieval.shard.{name}.rows", 0)
+
+    def shard(self, name):
+        now = time.monotonic()
+        with self.lock:
+            for other in [n for n, s in self.shards.items() if n != name and now - s.last_used > self.idle_seconds]:
+                self._evict(other)
+            shard = self.shards.get(name)
+            if shard is None:
+                if name == GLOBAL_SHARD:
+                    shard = GlobalShard(name)
+                elif name.endswith(ARCHIVE_SUFFIX):
+                    shard = ArchiveShard(name)
+                else:
+                    shard = Shard(name)
+                self.shards[name] = shard
+            self.shards.move_to_end(name)
+            while len(self.shards) > self.max_shards:
+                self._evict(next(iter(self.shards)))
+            metrics.set_gauge("retrieval.shards_loaded", len(self.shards))
+            return shard
+
+    def expire(self):
+        with self.lock:
+            for shard in self.shards.values():
+                shard.last_check = 0.0
+
+    def clear(self):
+        with self.lock:
+            self.shards.clear()
+
+registry = ShardRegistry()
+
+class ShardedIndex:
+    # What one query sees: the submitter's department shard, the history shard, their
+    # archives and the global shard.
+    # Scores come from each shard's own TF-IDF weights, so they are comparable but not
+    # identical to what a single company-wide index would give.
+    def __init__(self, shards):
+        self.shards = shards
+
+    def __len__(self):
+        return sum(len(index) for _, index in self.shards)
+
+    def latest(self, n):
+        return sorted((r for _, index in self.shards for r in index.latest(n)), key=lambda r: r["id"], reverse=True)[:n]
+
+    def search(self, text, top_k=5):
+        best = {}
+        for name, index in self.shards:
+            start = time.perf_counter()
+            matches = index.search(text, top_k=top_k)
+            metrics.observe(f"retrieval.shard.{name}.query", time.perf_counter() - start)
+            for score, record in matches:
+                if record["id"] not in best or score > best[record["id"]][0]:
+                    best[record["id"]] = (score, record)
+        return sorted(best.values(), key=lambda match: match[0], reverse=True)[:top_k]
+
+    def search_many(self, texts, top_k=5):
+        merged = [{} for _ in texts]
+        for name, index in self.shards:
+            start = time.perf_counter()
+            for best, matches in zip(merged, index.search_many(texts, top_k=top_k)):
+                for score, record in matches:
+                    if record["id"] not in best or score > best[record["id"]][0]:
+                        best[record["id"]] = (score, record)
+            metrics.observe(f"retrieval.shard.{name}.query_batch", time.perf_counter() - start)
+        return [sorted(best.values(), key=lambda match: match[0], reverse=True)[:top_k] for best in merged]
+
+def get_index(db, department=None):
+    key = shard_key(department)
+    names = [key, key + ARCHIVE_SUFFIX, HISTORY_SHARD, HISTORY_SHARD + ARCHIVE_SUFFIX, GLOBAL_SHARD]
+    return ShardedIndex([(name, registry.shard(name).get(db)) for name in names])
+
+def warm(db, departments=None):
+    # Builds (or refits) the global and history shards and the given departments' shards,
+    # by default every department with users, up to the shard limit
+    if departments is None:
+        departments = [d for (d,) in db.query(models.User.department).distinct()]
+    keys = sorted({shard_key(d) for d in departments})[:(registry.max_shards - 3) // 2]
+    for name in [GLOBAL_SHARD] + [n for key in [HISTORY_SHARD] + keys for n in (key, key + ARCHIVE_SUFFIX)]:
+        shard = registry.shard(name)
+        with shard.lock:
+            shard.rebuild(db, versioning.current(db, shard.scope))
+            shard.last_check = time.monotonic()
@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, BackgroundTasks, UploadFile, File
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from sqlalchemy import func, case
+from typing import List, Optional, Union, Literal
+from datetime import datetime
+import hashlib
+import os
+import tempfile
 
-import models, schemas, auth
+import models, schemas, auth, versioning, listing, export, retrieval, importer, jobs, dedup, metrics, clustering, suggestions, events, bulk, search, pubsub, list_cache, prompt_builder, archive, resuggest, tracing, idempotency
 from database import get_db
 
-router = APIRouter(prefix="/admin", tags=["Admin"])
+router = APIRouter(prefix="/admin", tags=["Admin"], route_class=tracing.TracedRoute)
 
 @router.get("/users", response_model=List[schemas.UserResponse])
 def get_all_users(
@@ -16,22 +21,106 @@ def get_all_users(
     users = db.query(models.User).all()
     return users
 
-@router.get("/tickets", response_model=List[schemas.TicketResponse])
+@router.get("/tickets", response_model=Union[List[schemas.TicketResponse], List[schemas.TicketSummary]])
 def get_all_tickets(
+    fields: schemas.TicketFields = "full",
+    if_none_match: Optional[str] = Header(None),
+    include_archived: bool = False,
     # Only admins can access
     current_admin=Depends(auth.get_current_active_admin),
     db: Session = Depends(get_db)
 ):
-    tickets = db.query(models.Ticket).all()
-    return tickets
+    return listing.ticket_list(
+        db, versioning.GLOBAL_SCOPE, fields, if_none_match,
+        archived_criteria=[] if include_archived else None
+    )
+
+@router.get("/tickets/search", response_model=List[schemas.TicketSearchResult])
+def search_tickets(
+    q: str = Query(..., min_length=1),
+    status: Optional[models.StatusEnum] = None,
+    category: Optional[models.CategoryEnum] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    current_admin=Depends(auth.get_current_active_admin),
+    db: Session = Depends(get_db)
+):
+    # Words match on stems; end a word with * for a prefix match ("print*")
+    criteria = []
+    if status is not None:
+        criteria.append(models.Ticket.status == status)
+    if category is not None:
+        criteria.append(models.Ticket.category == category)
+    if start is not None:
+        criteria.append(models.Ticket.created_date >= start)
+    if end is not None:
+        criteria.append(models.Ticket.created_date < end)
+    return search.search_tickets(db, q, criteria, limit=limit, offset=offset)
+
+@router.get("/tickets/export")
+def export_tickets(
+    fmt: Literal["csv", "ndjson", "parquet"] = Query("csv", alias="format"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    status: Optional[models.StatusEnum] = None,
+    include_archived: bool = False,
+    current_admin=Depends(auth.get_current_active_admin)
+):
+    if fmt == "parquet" and not export.parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export requires pyarrow to be installed")
+
+    stmt = export.build_query(start=start, end=end, status=status, include_archived=include_archived)
+    return StreamingResponse(
+        export.STREAMERS[fmt](export.iter_batches(stmt)),
+        media_type=export.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="tickets.{fmt}"'}
+    )
+
+@router.post("/tickets/bulk", response_model=schemas.BulkTicketResponse)
+def bulk_update_tickets(
+    request: schemas.BulkTicketRequest,
+    idempotency_key: Optional[str] = Header(None),
+    current_admin=Depends(auth.get_current_active_admin),
+    db: Session = Depends(get_db)
+):
+    return idempotency.run(
+        f"admin:{current_admin.id} POST /admin/tickets/bulk", idempotency_key, request.model_dump(mode="json"),
+        lambda: _bulk_update(db, request, current_admin)
+    )
+
+def _bulk_update(db, request, current_admin):
+    if (request.ids is None) == (request.filter is None):
+        raise HTTPException(status_code=400, detail="Provide either ids or filter")
+    if request.filter is not None and not bulk.filter_criteria(request.filter):
+        # An empty filter would match every ticket
+        raise HTTPException(status_code=400, detail="filter needs at least one field")
+    if request.action == "status" and request.status is None:
+        raise HTTPException(status_code=400, detail="status is required for the status action")
+    if request.action == "resolve" and not request.resolution_text:
+        raise HTTPException(status_code=400, detail="resolution_text is required for the resolve action")
+
+    try:
+        return bulk.run(db, request, current_admin.id)
+    except bulk.TooManyTickets as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/tickets", response_model=dict)
 def admin_raise_ticket(
     user_id: int,
     ticket: schemas.TicketCreate,
+    idempotency_key: Optional[str] = Header(None),
     current_admin=Depends(auth.get_current_active_admin),
     db: Session = Depends(get_db)
 ):
+    return idempotency.run(
+        f"admin:{current_admin.id} POST /admin/tickets", idempotency_key,
+        {"user_id": user_id, **ticket.model_dump(mode="json")},
+        lambda: _admin_create_ticket(db, user_id, ticket)
+    )
+
+def _admin_create_ticket(db, user_id, ticket):
     # Prepare the new ticket for a specific user
     db_ticket = models.Ticket(
         user_id=user_id,
@@ -40,7 +129,9 @@ def admin_raise_ticket(
         priority=ticket.priority
     )
     db.add(db_ticket)
+    versioning.bump(db, user_id)
     db.commit()
+    pubsub.publish(db, [db_ticket.id])
     db.refresh(db_ticket)
     
     return {
@@ -59,8 +150,17 @@ def update_ticket_status(
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
         
+    if ticket.status != status:
+        events.record(db, ticket.id, models.EventTypeEnum.status_changed, current_admin.id, **{"from": ticket.status.value, "to": status.value})
     ticket.status = status
+    if status in (models.StatusEnum.Resolved, models.StatusEnum.Closed) and ticket.escalated_at:
+        ticket.escalated_at = None
+        retrieval.record_change(db, ticket.id)
+    versioning.bump(db, ticket.user_id)
     db.commit()
+    if status in (models.StatusEnum.Resolved, models.StatusEnum.Closed):
+        dedup.get_index(db).remove(ticket.id)
+    pubsub.publish(db, [ticket.id])
     db.refresh(ticket)
     return ticket
 
@@ -83,39 +183,222 @@ def add_resolution(
     )
     db.add(db_res)
     ticket.status = models.StatusEnum.Resolved
+    ticket.escalated_at = None
+    events.record(db, ticket.id, models.EventTypeEnum.resolved, current_admin.id, text=resolution.resolution_text)
+    versioning.bump(db, ticket.user_id)
+    retrieval.record_change(db, ticket.id)
     db.commit()
+    dedup.get_index(db).remove(ticket.id)
+    pubsub.publish(db, [ticket.id])
     db.refresh(db_res)
     return db_res
 
+@router.post("/import", response_model=schemas.JobResponse, status_code=202)
+def import_history(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    fmt: Optional[Literal["csv", "ndjson"]] = Query(None, alias="format"),
+    user_id: Optional[int] = None,
+    idempotency_key: Optional[str] = Header(None),
+    current_admin=Depends(auth.get_current_active_admin),
+    db: Session = Depends(get_db)
+):
+    fmt = fmt or importer.guess_format(file.filename or "")
+
+    # Spool the upload to disk in chunks; the background job then streams it row by row.
+    # The hash identifies the upload for Idempotency-Key checks.
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{fmt}") as tmp:
+        while chunk := file.file.read(1024 * 1024):
+            digest.update(chunk)
+            tmp.write(chunk)
+
+    started = []
+
+    def start():
+        job = jobs.create(db, "import")
+        background_tasks.add_task(importer.run_import_file, tmp.name, fmt, job.id, user_id or current_admin.id)
+        started.append(job.id)
+        return job
+
+    try:
+        return idempotency.run(
+            f"admin:{current_admin.id} POST /admin/import", idempotency_key,
+            {"sha256": digest.hexdigest(), "format": fmt, "user_id": user_id},
+            start, status_code=202, response_model=schemas.JobResponse
+        )
+    finally:
+        # A replayed (or failed) request doesn't hand its spooled copy to a job
+        if not started:
+            os.remove(tmp.name)
+
+@router.get("/jobs/{job_id}", response_model=schemas.JobResponse)
+def get_job(
+    job_id: int,
+    current_admin=Depends(auth.get_current_active_admin),
+    db: Session = Depends(get_db)
+):
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/tickets/resuggest", response_model=schemas.JobResponse, status_code=202)
+def resuggest_tickets(
+    background_tasks: BackgroundTasks,
+    status: Optional[List[models.StatusEnum]] = Query(None),
+    category: Optional[models.CategoryEnum] = None,
+    department: Optional[str] = None,
+    since: Optional[datetime] = None,
+    missing_only: bool = False,
+    idempotency_key: Optional[str] = Header(None),
+    current_admin=Depends(auth.get_current_active_admin),
+    db: Session = Depends(get_db)
+):
+    # Recomputes the AI suggestions of matching open tickets; poll the job for progress
+    filters = resuggest.make_filters(
+        [s.value for s in status] if status else None, category.value if category else None, department, since, missing_only
+    )
+
+    def start():
+        job = resuggest.start_job(db, filters)
+        background_tasks.add_task(resuggest.run_resuggest_job, job.id)
+        return job
+
+    return idempotency.run(
+        f"admin:{current_admin.id} POST /admin/tickets/resuggest", idempotency_key, filters,
+        start, status_code=202, response_model=schemas.JobResponse
+    )
+
+@router.post("/jobs/{job_id}/resume", response_model=schemas.JobResponse, status_code=202)
+def resume_job(
+    job_id: int,
+    background_tasks: BackgroundTasks,
+    current_admin=Depends(auth.get_current_active_admin),
+    db: Session = Depends(get_db)
+):
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # A finished run can still be resumed to retry the tickets the LLM couldn't serve
+    retry = (job.checkpoint or {}).get("retry_ids")
+    if job.kind != "resuggest" or (job.status == models.JobStatusEnum.Finished and not retry):
+        raise HTTPException(status_code=400, detail="Only unfinished resuggest jobs can be resumed")
+    last_progress = job.updated_at or job.created_at
+    if job.status == models.JobStatusEnum.Running and last_progress and datetime.utcnow() - last_progress < resuggest.STALLED_AFTER:
+        raise HTTPException(status_code=409, detail="Job is still running")
+    background_tasks.add_task(resuggest.run_resuggest_job, job.id)
+    return job
+
+@router.get("/incidents", response_model=List[schemas.IncidentGroup])
+def get_incidents(
+    limit: int = 50,
+    current_admin=Depends(auth.get_current_active_admin),
+    db: Session = Depends(get_db)
+):
+    # Groups of near-duplicate tickets, largest first. The incident's first ticket
+    # isn't linked to itself, so it is added to the counts here.
+    open_states = [models.StatusEnum.Open, models.StatusEnum.In_Progress]
+    groups = db.query(
+        models.Ticket.incident_id,
+        func.count(models.Ticket.id).label("linked"),
+        func.sum(case((models.Ticket.status.in_(open_states), 1), else_=0)).label("linked_open"),
+        func.max(models.Ticket.created_date).label("last_seen")
+    ).filter(models.Ticket.incident_id.isnot(None)).group_by(models.Ticket.incident_id).order_by(
+        func.count(models.Ticket.id).desc()
+    ).limit(limit).all()
+
+    roots = {t.id: t for t in db.query(models.Ticket).filter(models.Ticket.id.in_([g.incident_id for g in groups]))}
+    result = []
+    for g in groups:
+        root = roots.get(g.incident_id)
+        if not root:
+            continue
+        result.append({
+            "incident_id": g.incident_id,
+            "description": root.description,
+            "status": root.status,
+            "ticket_count": g.linked + 1,
+            "open_count": (g.linked_open or 0) + (1 if root.status in open_states else 0),
+            "first_seen": root.created_date,
+            "last_seen": g.last_seen
+        })
+    return result
+
+@router.get("/metrics")
+def get_metrics(
+    current_admin=Depends(auth.get_current_active_admin)
+):
+    return {
+        **metrics.snapshot(),
+        "suggestion_paths": suggestions.path_report(),
+        "list_cache": list_cache.report(),
+        "llm_tokens": prompt_builder.token_report(),
+    }
+
+@router.get("/analytics/clusters", response_model=schemas.ClusterReport)
+def get_clusters(
+    current_admin=Depends(auth.get_current_active_admin),
+    db: Session = Depends(get_db)
+):
+    # Reads the precomputed output of the latest clustering run; no clustering happens here
+    return clustering.latest_report(db)
+
+@router.post("/analytics/clusters/run", response_model=schemas.JobResponse, status_code=202)
+def run_clusters(
+    background_tasks: BackgroundTasks,
+    days: int = clustering.CLUSTER_WINDOW_DAYS,
+    current_admin=Depends(auth.get_current_active_admin),
+    db: Session = Depends(get_db)
+):
+    job = jobs.create(db, "clustering")
+    background_tasks.add_task(clustering.run_clustering_job, job.id, days)
+    return job
+
+@router.post("/archive/run", response_model=schemas.JobResponse, status_code=202)
+def run_archive(
+    background_tasks: BackgroundTasks,
+    days: int = Query(archive.ARCHIVE_AFTER_DAYS, ge=1),
+    current_admin=Depends(auth.get_current_active_admin),
+    db: Session = Depends(get_db)
+):
+    # Moves Closed/Resolved tickets untouched for `days` into the archive tier
+    job = jobs.create(db, "archive")
+    background_tasks.add_task(archive.run_archive_job, job.id, days)
+    return job
+
 @router.get("/analytics")
 def get_analytics(
+    include_archived: bool = False,
     current_admin=Depends(auth.get_current_active_admin),
     db: Session = Depends(get_db)
 ):
-    total_tickets = db.query(models.Ticket).count()
-    
-    # Most common category
-    common_category = db.query(
-        models.Ticket.category, 
-        func.count(models.Ticket.category).label("count")
-    ).group_by(models.Ticket.category).order_by(func.count(models.Ticket.category).desc()).first()
-    
-    category_name = common_category.category.value if common_category else None
-    
-    # Average resolution time
-    # Needs a join to get resolution_date - created_date
-    resolved_tickets = db.query(models.Ticket, models.Resolution).join(
-        models.Resolution, models.Ticket.id == models.Resolution.ticket_id
-    ).all()
-    
-    avg_hours = 0
-    if resolved_tickets:
-        total_time = sum(
-            (res.resolved_date - tkt.created_date).total_seconds() 
-            for tkt, res in resolved_tickets
-        )
-        avg_hours = (total_time / len(resolved_tickets)) / 3600
-        
+    tiers = [(models.Ticket, models.Ticket.category, models.Ticket.created_date, models.Resolution.resolved_date,
+              lambda q: q.join(models.Resolution, models.Ticket.id == models.Resolution.ticket_id))]
+    if include_archived:
+        a = models.TicketArchive
+        tiers.append((a, a.category, a.created_date, a.resolved_date, lambda q: q.filter(a.resolution_id.isnot(None))))
+
+    total_tickets = 0
+    category_counts = {}
+    total_time, resolved_count = 0.0, 0
+    for model, category, created, resolved, with_resolution in tiers:
+        total_tickets += db.query(func.count()).select_from(model).scalar()
+
+        # Most common category
+        for cat, count in db.query(category, func.count(category)).group_by(category):
+            if cat is not None:
+                category_counts[cat] = category_counts.get(cat, 0) + count
+
+        # Average resolution time
+        # Needs a join to get resolution_date - created_date
+        for created_date, resolved_date in with_resolution(db.query(created, resolved)):
+            total_time += (resolved_date - created_date).total_seconds()
+            resolved_count += 1
+
+    category_name = max(category_counts, key=category_counts.get).value if category_counts else None
+    avg_hours = (total_time / resolved_count) / 3600 if resolved_count else 0
+
     return {
         "total_tickets": total_tickets,
         "most_common_category": category_name,
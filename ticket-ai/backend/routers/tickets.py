@@ -1,19 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import datetime
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional, Union
 
-import models, schemas, auth
+import models, schemas, auth, versioning, listing, retrieval, dedup, fixes, events, pubsub, serialization, tracing, idempotency
 from database import get_db
-from nlp_engine import generate_ai_resolution
+from suggestions import suggest_for_ticket
 
-router = APIRouter(prefix="/tickets", tags=["Tickets"])
+router = APIRouter(prefix="/tickets", tags=["Tickets"], route_class=tracing.TracedRoute)
 
 @router.post("/", response_model=dict)
 def raise_ticket(
     ticket: schemas.TicketCreate,
+    idempotency_key: Optional[str] = Header(None),
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
+    # A retry with the same Idempotency-Key gets the first response back (idempotency.py)
+    return idempotency.run(
+        f"user:{current_user.id} POST /tickets/", idempotency_key, ticket.model_dump(mode="json"),
+        lambda: _create_ticket(db, ticket, current_user)
+    )
+
+def _create_ticket(db, ticket, current_user):
     # Prepare the new ticket
     db_ticket = models.Ticket(
         user_id=current_user.id,
@@ -22,28 +35,13 @@ def raise_ticket(
         priority=ticket.priority
     )
     db.add(db_ticket)
+    versioning.bump(db, current_user.id)
     db.commit()
     db.refresh(db_ticket)
     
-    # NLP Engine Processing
-    historical_resolutions = db.query(models.Resolution).all()
-    
-    historical_tickets_data = []
-    # Join tickets and resolutions where ticket is resolved
-    for res in historical_resolutions:
-        ticket_ref = db.query(models.Ticket).filter(models.Ticket.id == res.ticket_id).first()
-        if ticket_ref:
-            historical_tickets_data.append({
-                "id": ticket_ref.id,
-                "description": ticket_ref.description,
-                "resolution_text": res.resolution_text
-            })
-            
-    # Generate an AI-provided resolution right away
-    ai_resolution_text = generate_ai_resolution(
-        ticket.description,
-        historical_tickets_data
-    )
+    # NLP Engine Processing: reuse an open incident's suggestions for near duplicates,
+    # otherwise retrieve from the shared index and generate an AI-provided resolution right away
+    ai_resolution_text = suggest_for_ticket(db, db_ticket)
     
     # Save the AI resolution so it permanently appears in the ticket history!
     new_res = models.Resolution(
@@ -51,8 +49,11 @@ def raise_ticket(
         resolution_text=ai_resolution_text
     )
     db.add(new_res)
+    events.record(db, db_ticket.id, models.EventTypeEnum.suggested, text=ai_resolution_text)
+    versioning.bump(db, current_user.id)
     # the ticket is kept Open intentionally so it's tracked, but they have an AI suggestion applied
     db.commit()
+    pubsub.publish(db, [db_ticket.id])
     db.refresh(db_ticket)
     
     return {
@@ -60,17 +61,91 @@ def raise_ticket(
         "ai_resolution": ai_resolution_text
     }
 
-@router.get("/user/{user_id}", response_model=List[schemas.TicketResponse])
+@router.get("/user/{user_id}", response_model=Union[List[schemas.TicketResponse], List[schemas.TicketSummary]])
 def get_user_tickets(
     user_id: int, 
+    fields: schemas.TicketFields = "full",
+    if_none_match: Optional[str] = Header(None),
+    include_archived: bool = False,
     current_user: models.User = Depends(auth.get_current_user),
     db: Session = Depends(get_db)
 ):
     if current_user.id != user_id and current_user.role != models.RoleEnum.admin:
         raise HTTPException(status_code=403, detail="Not authorized to view these tickets")
-        
-    tickets = db.query(models.Ticket).filter(models.Ticket.user_id == user_id).all()
-    return tickets
+
+    # Unchanged polls are answered from the version counter alone, before touching the tickets table
+    return listing.ticket_list(
+        db, versioning.user_scope(user_id), fields, if_none_match,
+        models.Ticket.user_id == user_id,
+        archived_criteria=[models.TicketArchive.user_id == user_id] if include_archived else None
+    )
+
+# Server-sent events: an SSE comment is sent every HEARTBEAT_SECONDS so proxies keep
+# the connection open and disconnected clients are noticed
+HEARTBEAT_SECONDS = 15
+
+@router.get("/stream")
+async def stream_ticket_updates(
+    request: Request,
+    current_user: models.User = Depends(auth.get_stream_user)
+):
+    # Pushes each changed ticket of this user (every ticket, for admins) as it is written.
+    # Clients fetch the list once per connection and apply the deltas on top of it.
+    pubsub.ensure_listener()
+    sub = pubsub.broker.subscribe(pubsub.topics_for(current_user), asyncio.get_running_loop())
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(sub.queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {message['type']}\ndata: {orjson.dumps(message).decode()}\n\n"
+        finally:
+            pubsub.broker.unsubscribe(sub)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/{id}", response_model=schemas.TicketResponse)
+def get_ticket(
+    id: int,
+    include_archived: bool = False,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    ticket = db.query(models.Ticket).filter(models.Ticket.id == id).first()
+    if not ticket and include_archived:
+        ticket = db.query(models.TicketArchive).filter(models.TicketArchive.id == id).first()
+    if not ticket:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+
+    if ticket.user_id != current_user.id and current_user.role != models.RoleEnum.admin:
+        raise HTTPException(status_code=403, detail="Not authorized to view this ticket")
+    if isinstance(ticket, models.TicketArchive):
+        return serialization.archived_ticket_to_dict(ticket)
+    return ticket
+
+@router.get("/{id}/events", response_model=List[schemas.TicketEventResponse])
+def get_ticket_events(
+    id: int,
+    limit: int = Query(events.HISTORY_PAGE_SIZE, ge=1, le=200),
+    before: Optional[int] = None,
+    include_archived: bool = False,
+    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    ticket = db.query(models.Ticket).filter(models.Ticket.id == id).first()
+    if not ticket and include_archived:
+        ticket = db.query(models.TicketArchive).filter(models.TicketArchive.id == id).first()
+    if not ticket:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+
+    if ticket.user_id != current_user.id and current_user.role != models.RoleEnum.admin:
+        raise HTTPException(status_code=403, detail="Not authorized to view this ticket")
+    return events.history(db, id, limit=limit, before=before, archived=isinstance(ticket, models.TicketArchive))
 
 @router.put("/{id}/resolve", response_model=schemas.TicketResponse)
 def resolve_ticket(
@@ -90,6 +165,10 @@ def resolve_ticket(
         raise HTTPException(status_code=400, detail="Ticket already resolved")
 
     ticket.status = models.StatusEnum.Resolved
+    ticket.escalated_at = None
+    events.record(db, ticket.id, models.EventTypeEnum.resolved, current_user.id, text=resolution_text)
+    # Count which suggestion actually fixed it, for the proven-fix fast path
+    fixes.record_selection(db, resolution_text)
     
     # Check if a resolution exists, if not create one OR update current AI one with user one
     if not ticket.resolution:
@@ -101,7 +180,11 @@ def resolve_ticket(
     else:
         ticket.resolution.resolution_text = resolution_text
         
+    versioning.bump(db, ticket.user_id)
+    retrieval.record_change(db, ticket.id)
     db.commit()
+    dedup.get_index(db).remove(ticket.id)
+    pubsub.publish(db, [ticket.id])
     db.refresh(ticket)
     return ticket
 
@@ -120,17 +203,20 @@ def escalate_ticket(
 
     ticket.priority = models.PriorityEnum.High
     ticket.status = models.StatusEnum.Open
-    
-    escalation_message = "🚧 [ESCALATED] User issue is not resolved. Send this ticket to Data Engineer."
-    if not ticket.resolution:
-        new_res = models.Resolution(
-            ticket_id=ticket.id,
-            resolution_text=escalation_message
-        )
-        db.add(new_res)
-    else:
-        ticket.resolution.resolution_text = escalation_message + "\n\nPrevious notes: " + ticket.resolution.resolution_text
-        
+
+    # The suggestions stay as they are; the escalation is appended to the ticket history
+    if ticket.resolution and not ticket.escalation_count:
+        fixes.record_escalation(db, ticket.resolution.resolution_text)
+    ticket.escalation_count = (ticket.escalation_count or 0) + 1
+    ticket.escalated_at = datetime.datetime.utcnow()
+    events.record(db, ticket.id, models.EventTypeEnum.escalated, current_user.id, count=ticket.escalation_count)
+
+    versioning.bump(db, ticket.user_id)
+    # Escalated tickets leave the retrieval corpus until they are resolved again
+    retrieval.record_change(db, ticket.id)
     db.commit()
+    # The incident's shared suggestions didn't help, so stop handing them to new duplicates
+    dedup.get_index(db).remove_incident(ticket.incident_id or ticket.id)
+    pubsub.publish(db, [ticket.id])
     db.refresh(ticket)
     return ticket
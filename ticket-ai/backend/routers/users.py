@@ -4,10 +4,10 @@ from fastapi.security import OAuth2PasswordRequestForm
 from typing import List
 from datetime import datetime, timedelta
 
-import models, schemas, auth
+import models, schemas, auth, tracing
 from database import get_db
 
-router = APIRouter(tags=["Users"])
+router = APIRouter(tags=["Users"], route_class=tracing.TracedRoute)
 
 @router.post("/signup", response_model=schemas.UserResponse)
 def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
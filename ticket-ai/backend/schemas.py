@@ -1,7 +1,7 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
-from datetime import datetime
-from models import RoleEnum, CategoryEnum, PriorityEnum, StatusEnum
+from typing import Optional, List, Literal, Any
+from datetime import datetime, date
+from models import RoleEnum, CategoryEnum, PriorityEnum, StatusEnum, JobStatusEnum, EventTypeEnum
 
 # Users
 class UserCreate(BaseModel):
@@ -26,6 +26,9 @@ class UserResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# Which columns a ticket list returns: everything, or just the dashboard table columns
+TicketFields = Literal["full", "summary"]
+
 # Token
 class Token(BaseModel):
     access_token: str
@@ -62,14 +65,128 @@ class TicketResponse(BaseModel):
     priority: PriorityEnum
     status: StatusEnum
     created_date: datetime
+    incident_id: Optional[int] = None
+    escalation_count: int = 0
+    escalated_at: Optional[datetime] = None
     resolution: Optional[ResolutionResponse] = None
+    # Read from the archive tier (only with include_archived=true)
+    archived: bool = False
+
+    class Config:
+        from_attributes = True
+
+# Lean projection for dashboard tables (GET ...?fields=summary)
+class TicketSummary(BaseModel):
+    id: int
+    user_id: int
+    category: CategoryEnum
+    priority: PriorityEnum
+    status: StatusEnum
+    created_date: datetime
 
     class Config:
         from_attributes = True
 
+# Ticket history
+class TicketEventResponse(BaseModel):
+    id: int
+    ticket_id: int
+    type: EventTypeEnum
+    actor_id: Optional[int] = None
+    payload: dict = {}
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+# Full-text search hits (GET /admin/tickets/search)
+class TicketSearchResult(BaseModel):
+    id: int
+    user_id: int
+    description: str
+    category: CategoryEnum
+    priority: PriorityEnum
+    status: StatusEnum
+    created_date: datetime
+    rank: float
+
+# Bulk admin operations
+class BulkTicketFilter(BaseModel):
+    status: Optional[StatusEnum] = None
+    category: Optional[CategoryEnum] = None
+    priority: Optional[PriorityEnum] = None
+    user_id: Optional[int] = None
+    incident_id: Optional[int] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
+class BulkTicketRequest(BaseModel):
+    action: Literal["status", "resolve", "escalate"]
+    # Target either explicit ids or every ticket matching the filter
+    ids: Optional[List[int]] = None
+    filter: Optional[BulkTicketFilter] = None
+    status: Optional[StatusEnum] = None
+    resolution_text: Optional[str] = None
+    dry_run: bool = False
+
+class BulkOutcome(BaseModel):
+    id: int
+    outcome: Literal["updated", "would_update", "skipped", "not_found"]
+    detail: Optional[str] = None
+
+class BulkTicketResponse(BaseModel):
+    action: str
+    dry_run: bool
+    matched: int
+    updated: int
+    outcomes: List[BulkOutcome]
+
+# Near-duplicate incident groups
+class IncidentGroup(BaseModel):
+    incident_id: int
+    description: str
+    status: StatusEnum
+    ticket_count: int
+    open_count: int
+    first_seen: datetime
+    last_seen: datetime
+
 # NLP similarity response
 class NLPSimilarityResponse(BaseModel):
     ticket_id: int
     similarity_score: float
     description: str
     resolution_text: str
+
+# Background jobs
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    status: JobStatusEnum
+    processed: int
+    succeeded: int
+    failed: int
+    errors: List[Any] = []
+    checkpoint: Optional[dict] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# Trending-issue clusters
+class ClusterDay(BaseModel):
+    day: date
+    count: int
+
+class ClusterInfo(BaseModel):
+    cluster: int
+    size: int
+    top_terms: List[str]
+    daily_counts: List[ClusterDay]
+
+class ClusterReport(BaseModel):
+    job_id: Optional[int] = None
+    computed_at: Optional[datetime] = None
+    clusters: List[ClusterInfo] = []
@@ -0,0 +1,170 @@
+import re
+
+from sqlalchemy import event, text, func, literal_column, table, column, or_, select, union
+
+import models
+from database import Base
+
+# Full-text search over ticket descriptions and resolutions, backed by the database's
+# own index so a query never scans the tickets table:
+#   - SQLite: an FTS5 table (rowid = ticket id) kept in sync by triggers
+#   - Postgres: STORED tsvector generated columns with GIN indexes
+# install() is idempotent; it runs after every create_all and from migrate.py.
+
+FTS_TABLE = "ticket_fts"
+
+# Description matches count double in the ranking
+DESCRIPTION_WEIGHT = 2.0
+RESOLUTION_WEIGHT = 1.0
+
+_SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}
+        USING fts5(description, resolution_text, tokenize = 'porter unicode61')""",
+    f"""CREATE TRIGGER IF NOT EXISTS tickets_fts_insert AFTER INSERT ON tickets BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, description, resolution_text) VALUES (new.id, new.description, '');
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tickets_fts_update AFTER UPDATE OF description ON tickets BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE}(rowid, description, resolution_text) VALUES (
+            new.id, new.description,
+            coalesce((SELECT resolution_text FROM resolutions WHERE ticket_id = new.id), ''));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS tickets_fts_delete AFTER DELETE ON tickets BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS resolutions_fts_insert AFTER INSERT ON resolutions BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = new.ticket_id;
+        INSERT INTO {FTS_TABLE}(rowid, description, resolution_text) VALUES (
+            new.ticket_id, (SELECT description FROM tickets WHERE id = new.ticket_id), new.resolution_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS resolutions_fts_update AFTER UPDATE OF resolution_text ON resolutions BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = new.ticket_id;
+        INSERT INTO {FTS_TABLE}(rowid, description, resolution_text) VALUES (
+            new.ticket_id, (SELECT description FROM tickets WHERE id = new.ticket_id), new.resolution_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS resolutions_fts_delete AFTER DELETE ON resolutions BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.ticket_id;
+        INSERT INTO {FTS_TABLE}(rowid, description, resolution_text)
+            SELECT id, description, '' FROM tickets WHERE id = old.ticket_id;
+    END""",
+]
+
+_SQLITE_BACKFILL = f"""
+    INSERT INTO {FTS_TABLE}(rowid, description, resolution_text)
+    SELECT t.id, t.description, coalesce(r.resolution_text, '')
+    FROM tickets t LEFT JOIN resolutions r ON r.ticket_id = t.id
+"""
+
+_POSTGRES_DDL = [
+    """ALTER TABLE tickets ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (setweight(to_tsvector('english', coalesce(description, '')), 'A')) STORED""",
+    """ALTER TABLE resolutions ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (setweight(to_tsvector('english', coalesce(resolution_text, '')), 'B')) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_tickets_search_vector ON tickets USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_resolutions_search_vector ON resolutions USING GIN (search_vector)",
+]
+
+def install(conn):
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+        ).first()
+        for ddl in _SQLITE_DDL:
+            conn.execute(text(ddl))
+        # Persist the weighted ranking in the FTS config so queries can ORDER BY the
+        # hidden rank column, which FTS5 optimizes for ORDER BY rank LIMIT n
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('rank', :rank)"),
+                     {"rank": f"bm25({DESCRIPTION_WEIGHT}, {RESOLUTION_WEIGHT})"})
+        if not exists:
+            # First install on an existing database: index what's already there
+            conn.execute(text(_SQLITE_BACKFILL))
+    elif dialect == "postgresql":
+        for ddl in _POSTGRES_DDL:
+            conn.execute(text(ddl))
+
+@event.listens_for(Base.metadata, "after_create")
+def _install_after_create(target, connection, **kw):
+    install(connection)
+
+# Queries
+
+_TERM = re.compile(r"\w+\*?")
+
+def parse_terms(q):
+    # Plain words, each optionally ending in * for a prefix match. Anything else is
+    # dropped so user input can't inject query syntax.
+    return [(t.rstrip("*").lower(), t.endswith("*")) for t in _TERM.findall(q or "") if t.rstrip("*")]
+
+def _fts5_query(terms):
+    return " ".join(f'"{word}"' + ("*" if prefix else "") for word, prefix in terms)
+
+def _tsquery(terms):
+    return " & ".join(word + (":*" if prefix else "") for word, prefix in terms)
+
+RESULT_COLUMNS = (
+    models.Ticket.id,
+    models.Ticket.user_id,
+    models.Ticket.description,
+    models.Ticket.category,
+    models.Ticket.priority,
+    models.Ticket.status,
+    models.Ticket.created_date,
+)
+
+def _postgres_query(db, terms):
+    # Each side is matched against its own GIN index and the ticket ids are unioned
+    # first; a condition on the joined rows (an OR, or the two vectors concatenated)
+    # can't use either index and scans the whole join. The trade-off: all terms have
+    # to match within the description or within the resolution.
+    tsquery = func.to_tsquery("english", _tsquery(terms))
+    ticket_vector = literal_column("tickets.search_vector")
+    resolution_vector = literal_column("resolutions.search_vector")
+    matching = union(
+        select(models.Ticket.id).where(ticket_vector.op("@@")(tsquery)),
+        select(models.Resolution.ticket_id).where(resolution_vector.op("@@")(tsquery)),
+    )
+    # Ranked per side; the A/B weights of the two vectors favour description matches
+    rank = func.ts_rank(ticket_vector, tsquery) + func.coalesce(func.ts_rank(resolution_vector, tsquery), 0)
+    return (
+        db.query(*RESULT_COLUMNS, rank.label("rank"))
+        .outerjoin(models.Resolution, models.Resolution.ticket_id == models.Ticket.id)
+        .filter(models.Ticket.id.in_(matching))
+        .order_by(rank.desc())
+    )
+
+def search_tickets(db, q, criteria=(), limit=50, offset=0):
+    terms = parse_terms(q)
+    if not terms:
+        return []
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "sqlite":
+        fts = table(FTS_TABLE, column("rowid"))
+        rank = literal_column(f"{FTS_TABLE}.rank")
+        query = (
+            db.query(*RESULT_COLUMNS, rank.label("rank"))
+            .select_from(fts)
+            .join(models.Ticket, models.Ticket.id == fts.c.rowid)
+            .filter(literal_column(FTS_TABLE).op("MATCH")(_fts5_query(terms)))
+            # bm25 is lower-is-better; negate so higher rank means a better match everywhere
+            .order_by(rank)
+        )
+        rows = query.filter(*criteria).offset(offset).limit(limit).all()
+        return [{**row._asdict(), "rank": -row.rank} for row in rows]
+
+    if dialect == "postgresql":
+        return [row._asdict() for row in _postgres_query(db, terms).filter(*criteria).offset(offset).limit(limit).all()]
+
+    # No native full-text index: fall back to a LIKE scan (unranked)
+    like = [
+        or_(models.Ticket.description.ilike(f"%{word}%"), models.Resolution.resolution_text.ilike(f"%{word}%"))
+        for word, _ in terms
+    ]
+    query = (
+        db.query(*RESULT_COLUMNS)
+        .outerjoin(models.Resolution, models.Resolution.ticket_id == models.Ticket.id)
+        .filter(*like, *criteria)
+        .order_by(models.Ticket.id.desc())
+    )
+    return [{**row._asdict(), "rank": 0.0} for row in query.offset(offset).limit(limit).all()]
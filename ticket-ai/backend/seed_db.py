@@ -1,9 +1,9 @@
-import os
 import random
 from datetime import datetime, timedelta
-from database import engine, SessionLocal
+from database import SessionLocal
 import models
 import auth
+import migrate
 
 # Sample data
 categories = [models.CategoryEnum.Login, models.CategoryEnum.Network, models.CategoryEnum.Application, models.CategoryEnum.Access]
@@ -45,7 +45,7 @@ for i in range(30):
 historical_data.extend(extended_data)
 
 def seed():
-    models.Base.metadata.create_all(bind=engine)
+    migrate.migrate()
     db = SessionLocal()
     
     try:
@@ -90,7 +90,8 @@ def seed():
                     category=cat,
                     priority=random.choice(priorities),
                     status=models.StatusEnum.Resolved,
-                    created_date=created_date
+                    created_date=created_date,
+                    imported=True
                 )
                 db.add(ticket)
                 db.flush() # To get ticket.id
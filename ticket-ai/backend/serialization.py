@@ -0,0 +1,85 @@
+import os
+
+import orjson
+from fastapi.responses import JSONResponse
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+# Responses smaller than this are sent uncompressed; compressing a tiny JSON body costs
+# more CPU than it saves on the wire
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+
+class ORJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content):
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+def add_compression(app):
+    # Brotli (with gzip fallback) when brotli-asgi is installed, plain gzip otherwise
+    if BrotliMiddleware is not None:
+        app.add_middleware(BrotliMiddleware, minimum_size=COMPRESS_MIN_BYTES, gzip_fallback=True)
+    else:
+        app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_BYTES, compresslevel=6)
+
+# Validation-free serialization for trusted ORM reads. These mirror schemas.TicketResponse
+# and schemas.ResolutionResponse field for field (test_api checks they stay in sync), and
+# skip building a Pydantic model per row on the list endpoints.
+
+def resolution_to_dict(res):
+    if res is None:
+        return None
+    return {
+        "id": res.id,
+        "ticket_id": res.ticket_id,
+        "resolution_text": res.resolution_text,
+        "resolved_date": res.resolved_date,
+    }
+
+def ticket_to_dict(ticket):
+    return {
+        "id": ticket.id,
+        "user_id": ticket.user_id,
+        "description": ticket.description,
+        "category": ticket.category,
+        "priority": ticket.priority,
+        "status": ticket.status,
+        "created_date": ticket.created_date,
+        "incident_id": ticket.incident_id,
+        "escalation_count": ticket.escalation_count or 0,
+        "escalated_at": ticket.escalated_at,
+        "resolution": resolution_to_dict(ticket.resolution),
+        "archived": False,
+    }
+
+def archived_ticket_to_dict(row):
+    # Same shape for a ticket_archive row, which has its resolution inlined
+    resolution = None
+    if row.resolution_id is not None:
+        resolution = {
+            "id": row.resolution_id,
+            "ticket_id": row.id,
+            "resolution_text": row.resolution_text,
+            "resolved_date": row.resolved_date,
+        }
+    return {
+        "id": row.id,
+        "user_id": row.user_id,
+        "description": row.description,
+        "category": row.category,
+        "priority": row.priority,
+        "status": row.status,
+        "created_date": row.created_date,
+        "incident_id": row.incident_id,
+        "escalation_count": row.escalation_count or 0,
+        "escalated_at": None,
+        "resolution": resolution,
+        "archived": True,
+    }
+
+def tickets_response(tickets, headers=None):
+    return ORJSONResponse([ticket_to_dict(t) for t in tickets], headers=headers)
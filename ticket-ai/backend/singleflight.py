@@ -0,0 +1,143 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+import models, metrics, tracing
+from database import SessionLocal, insert_ignore
+from llm_scheduler import LLM_QUEUE_TIMEOUT_SECONDS
+from nlp_engine import LLM_MAX_CALL_SECONDS
+from retrieval import preprocess_text
+
+# Single flight for suggestion generation. During an incident many users submit the
+# same description within seconds; the first request for a key computes and identical
+# requests that arrive while it runs wait for its result instead of running retrieval
+# and an LLM call of their own.
+#
+# Within a worker, waiters block on the leader's call. With SINGLEFLIGHT_BACKEND=db the
+# leader also takes a lease row in suggestion_leases, so the first request across all
+# workers computes; the others poll the row. A finished result stays readable for
+# SINGLEFLIGHT_RESULT_SECONDS. Waiters give up after SINGLEFLIGHT_WAIT_SECONDS (or
+# when the leader fails) and compute independently.
+
+SINGLEFLIGHT_BACKEND = os.getenv("SINGLEFLIGHT_BACKEND", "memory")
+# Both the lease TTL and how long waiters wait. It has to outlast a leader that waited
+# its full turn in the LLM scheduler and then used up every attempt of the call, or a
+# second worker takes the lease (or a waiter gives up) and makes a duplicate LLM call.
+# Retrieval and the fast path get LEADER_MARGIN_SECONDS on top.
+LEADER_MARGIN_SECONDS = 10
+SINGLEFLIGHT_WAIT_SECONDS = float(os.getenv(
+    "SINGLEFLIGHT_WAIT_SECONDS", str(LLM_QUEUE_TIMEOUT_SECONDS + LLM_MAX_CALL_SECONDS + LEADER_MARGIN_SECONDS)
+))
+SINGLEFLIGHT_RESULT_SECONDS = float(os.getenv("SINGLEFLIGHT_RESULT_SECONDS", "5"))
+POLL_SECONDS = 0.1
+
+def key(*parts):
+    # Descriptions are compared after the same normalization retrieval uses
+    return hashlib.sha1("\x1f".join(preprocess_text(p) for p in parts).encode("utf-8")).hexdigest()
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn, timeout, alone=None):
+        # Returns (result, waited). Waiters that time out or whose leader failed call
+        # `alone` (default fn) themselves.
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+        if not leader:
+            if call.done.wait(timeout) and not call.failed:
+                return call.result, True
+            metrics.inc("singleflight.fallbacks")
+            return (alone or fn)(), False
+        try:
+            call.result = fn()
+        except BaseException:
+            call.failed = True
+            raise
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+local = SingleFlight()
+
+def _acquire(db, key, owner):
+    now = datetime.datetime.utcnow()
+    lease = models.SuggestionLease
+    db.query(lease).filter(lease.expires_at < now).delete(synchronize_session=False)
+    insert_ignore(db, lease.__table__, [{
+        "key": key, "owner": owner, "created_at": now,
+        "expires_at": now + datetime.timedelta(seconds=SINGLEFLIGHT_WAIT_SECONDS),
+    }])
+    db.commit()
+    return db.query(lease.owner).filter(lease.key == key).scalar() == owner
+
+def _wait(db, key, deadline):
+    lease = models.SuggestionLease
+    while time.monotonic() < deadline:
+        row = db.query(lease.result, lease.expires_at).filter(lease.key == key).first()
+        db.rollback()
+        if row is None or row.expires_at < datetime.datetime.utcnow():
+            # The leader failed or its lease ran out
+            return None
+        if row.result is not None:
+            return json.loads(row.result)
+        time.sleep(POLL_SECONDS)
+    return None
+
+def _db_flight(key, fn):
+    lease = models.SuggestionLease
+    owner = uuid.uuid4().hex
+    db = SessionLocal()
+    try:
+        if not _acquire(db, key, owner):
+            result = _wait(db, key, time.monotonic() + SINGLEFLIGHT_WAIT_SECONDS)
+            if result is not None:
+                return result, True
+            metrics.inc("singleflight.fallbacks")
+            return fn(), False
+
+        try:
+            result = fn()
+        except BaseException:
+            db.query(lease).filter(lease.key == key, lease.owner == owner).delete(synchronize_session=False)
+            db.commit()
+            raise
+        db.query(lease).filter(lease.key == key, lease.owner == owner).update({
+            lease.result: json.dumps(result),
+            lease.expires_at: datetime.datetime.utcnow() + datetime.timedelta(seconds=SINGLEFLIGHT_RESULT_SECONDS),
+        }, synchronize_session=False)
+        db.commit()
+        return result, False
+    finally:
+        db.close()
+
+def run(key, fn):
+    # Returns (result, coalesced). With the db backend the result goes through JSON, so
+    # fn should return JSON-friendly values (tuples come back as lists).
+    with tracing.span("singleflight", backend=SINGLEFLIGHT_BACKEND) as span:
+        if SINGLEFLIGHT_BACKEND == "db":
+            (result, shared), waited = local.do(key, lambda: _db_flight(key, fn), SINGLEFLIGHT_WAIT_SECONDS, alone=lambda: (fn(), False))
+        else:
+            result, waited = local.do(key, fn, SINGLEFLIGHT_WAIT_SECONDS)
+            shared = False
+        coalesced = waited or shared
+        if span:
+            span.set(coalesced=coalesced)
+    metrics.inc("singleflight.coalesced" if coalesced else "singleflight.computed")
+    return result, coalesced
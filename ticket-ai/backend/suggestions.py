@@ -0,0 +1,74 @@
+import json
+import time
+
+import metrics, retrieval, dedup, fixes, singleflight, tracing
+from nlp_engine import generate_ai_resolution
+
+# Computes the stored suggestion list for a newly raised ticket. This is the one place
+# that decides whether a ticket needs a fresh LLM call at all:
+#   1. near duplicate of an open incident -> reuse that incident's suggestions
+#   2. closest resolved tickets used well-confirmed fixes -> return those fixes
+#   3. otherwise retrieval + LLM
+# Steps 2 and 3 go through singleflight: identical descriptions (same category and
+# department) submitted while one is being computed share that one computation.
+
+PATHS = ("dedup", "fastpath", "llm", "coalesced")
+
+def _served(path, start, avoided=None):
+    metrics.inc(f"suggestions.{path}")
+    if avoided is None:
+        avoided = path != "llm"
+    if avoided:
+        metrics.inc("suggestions.llm_calls_avoided")
+    metrics.observe(f"suggestions.{path}_latency", time.perf_counter() - start)
+
+def _compute(db, ticket, department):
+    # The submitter's department shard plus cross-cutting fixes
+    with tracing.span("retrieval.search", shard=retrieval.shard_key(department)):
+        index = retrieval.get_index(db, department)
+        matches = index.search(ticket.description, top_k=5)
+    with tracing.span("suggest.fastpath"):
+        proven = fixes.proven_fixes(db, matches)
+    if proven:
+        return json.dumps(proven), "fastpath"
+    return generate_ai_resolution(ticket.description, index=index, matches=matches, priority=ticket.priority), "llm"
+
+def suggest_for_ticket(db, ticket):
+    start = time.perf_counter()
+    with tracing.span("suggest.dedup"):
+        near_dups = dedup.get_index(db)
+        match = dedup.find_open(db, near_dups, ticket.description)
+    if match:
+        ticket.incident_id = match.incident_id
+        suggestion_text = match.suggestions
+        _served("dedup", start)
+    else:
+        department = ticket.user.department if ticket.user else None
+        category = getattr(ticket.category, "value", ticket.category) or ""
+        (suggestion_text, path), coalesced = singleflight.run(
+            singleflight.key(ticket.description, category, retrieval.shard_key(department)),
+            lambda: _compute(db, ticket, department)
+        )
+        if coalesced:
+            _served("coalesced", start, avoided=path == "llm")
+        else:
+            _served(path, start)
+
+    # Never hand the outage placeholder on to later duplicates
+    if dedup.is_reusable(suggestion_text):
+        near_dups.add(ticket.id, ticket.description, ticket.incident_id or ticket.id, suggestion_text, ticket.created_date)
+    return suggestion_text
+
+def path_report():
+    # Share of tickets served by each path and their mean latency, for this worker
+    snap = metrics.snapshot()
+    counts = {path: snap["counters"].get(f"suggestions.{path}", 0) for path in PATHS}
+    total = sum(counts.values())
+    return {
+        path: {
+            "count": counts[path],
+            "share": round(counts[path] / total, 4) if total else 0.0,
+            "mean_latency_ms": snap["timings"].get(f"suggestions.{path}_latency", {}).get("mean_ms"),
+        }
+        for path in PATHS
+    }
@@ -0,0 +1,894 @@
+import json
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from jose import jwt
+
+from main import app
+
+client = TestClient(app)
+
+def login(email, role="user", password="secret123"):
+    """Sign up (if needed) and log in, returning auth headers and the user's id."""
+    client.post("/signup", json={
+        "name": email.split("@")[0], "email": email, "password": password,
+        "role": role, "department": "IT"
+    })
+    token = client.post("/login", data={"username": email, "password": password}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}, jwt.get_unverified_claims(token)["id"]
+
+def raise_ticket(headers, description="VPN down", category="Network", priority="Low"):
+    with patch("suggestions.generate_ai_resolution", return_value=json.dumps(["Fix one"])):
+        res = client.post("/tickets/", json={"description": description, "category": category, "priority": priority}, headers=headers)
+    return res.json()["ticket"]
+
+def test_user_ticket_list_etag():
+    """Test that unchanged polls get a 304 and any write moves the ETag."""
+    headers, user_id = login("etag@example.com")
+    ticket = raise_ticket(headers)
+
+    first = client.get(f"/tickets/user/{user_id}", headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    again = client.get(f"/tickets/user/{user_id}", headers={**headers, "If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+
+    client.put(f"/tickets/{ticket['id']}/escalate", headers=headers)
+    changed = client.get(f"/tickets/user/{user_id}", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+def test_admin_ticket_list_etag():
+    """Test that the admin list honours If-None-Match against the global counter."""
+    headers, _ = login("admin-etag@example.com", role="admin")
+    etag = client.get("/admin/tickets", headers=headers).headers["ETag"]
+    assert client.get("/admin/tickets", headers={**headers, "If-None-Match": etag}).status_code == 304
+
+def test_fast_serialization_matches_schema():
+    """Test that the validation-free list path emits exactly what TicketResponse would."""
+    import orjson
+    import models, schemas, serialization
+    from database import SessionLocal
+
+    headers, _ = login("serialize@example.com")
+    raise_ticket(headers, description="Printer jammed")
+
+    db = SessionLocal()
+    try:
+        for ticket in db.query(models.Ticket).all():
+            expected = schemas.TicketResponse.model_validate(ticket).model_dump(mode="json")
+            assert orjson.loads(orjson.dumps(serialization.ticket_to_dict(ticket))) == expected
+    finally:
+        db.close()
+
+def test_summary_fields_and_detail_endpoint():
+    """Test that fields=summary returns only the table columns and the detail endpoint the rest."""
+    headers, user_id = login("summary@example.com")
+    ticket = raise_ticket(headers, description="Outlook crashes on launch", category="Application")
+
+    rows = client.get(f"/tickets/user/{user_id}?fields=summary", headers=headers).json()
+    assert set(rows[0]) == {"id", "user_id", "category", "priority", "status", "created_date"}
+
+    detail = client.get(f"/tickets/{ticket['id']}", headers=headers).json()
+    assert detail["description"] == "Outlook crashes on launch"
+    assert detail["resolution"]["resolution_text"] == '["Fix one"]'
+
+    other_headers, _ = login("someone-else@example.com")
+    assert client.get(f"/tickets/{ticket['id']}", headers=other_headers).status_code == 403
+
+def test_streaming_export_formats():
+    """Test that the admin export streams every ticket in each format and honours filters."""
+    import csv, io
+    import orjson
+
+    headers, _ = login("export-admin@example.com", role="admin")
+    user_headers, _ = login("export-user@example.com")
+    raise_ticket(user_headers, description="Export me")
+    total = len(client.get("/admin/tickets?fields=summary", headers=headers).json())
+
+    res = client.get("/admin/tickets/export?format=csv", headers=headers)
+    assert res.headers["content-type"].startswith("text/csv")
+    assert len(list(csv.DictReader(io.StringIO(res.text)))) == total
+
+    res = client.get("/admin/tickets/export?format=ndjson&status=Closed", headers=headers)
+    assert [orjson.loads(line) for line in res.content.splitlines()] == []
+
+    res = client.get("/admin/tickets/export?format=parquet", headers=headers)
+    if res.status_code == 200:
+        import pyarrow.parquet as pq
+        assert pq.read_table(io.BytesIO(res.content)).num_rows == total
+
+def test_bulk_import_reports_rejects_and_rebuilds_index():
+    """Test that a CSV import inserts valid rows, reports bad ones (including undecodable lines) and refreshes retrieval."""
+    import retrieval
+    from database import SessionLocal
+
+    headers, _ = login("import-admin@example.com", role="admin")
+    upload = (
+        "description,category,resolution_text\n"
+        "Scanner not detected on floor 3,Application,Reinstalled TWAIN scanner driver\n"
+        "Badge reader rejects card,Nonsense,Re-encoded badge\n"
+        ",Access,No description here\n"
+    ).encode() + b"Printer \xff offline,Application,Bad byte\n" + b"x" * 200_000 + b",Network,Oversized field\n"
+    upload += b"Monitor flickers at 60Hz,Application,Replaced DisplayPort cable\n"
+    res = client.post("/admin/import", files={"file": ("history.csv", upload, "text/csv")}, headers=headers)
+    assert res.status_code == 202
+
+    job = client.get(f"/admin/jobs/{res.json()['id']}", headers=headers).json()
+    assert job["status"] == "Finished"
+    assert (job["processed"], job["succeeded"], job["failed"]) == (6, 2, 4)
+    assert [e["row"] for e in job["errors"]] == [3, 4, 5, 6]
+    assert [e["error"].split(":")[0] for e in job["errors"][2:]] == ["invalid UTF-8", "invalid CSV"]
+
+    db = SessionLocal()
+    try:
+        _, top = retrieval.get_index(db).search("scanner not detected", top_k=1)[0]
+        # Imported history isn't tied to the importing admin's department
+        _, finance_top = retrieval.get_index(db, "Finance").search("scanner not detected", top_k=1)[0]
+    finally:
+        db.close()
+    assert top["resolution_text"] == "Reinstalled TWAIN scanner driver"
+    assert finance_top["id"] == top["id"]
+
+def test_import_batches_are_searchable_as_they_commit():
+    """Test that each committed import batch reaches the list version and the index before the next one runs."""
+    import importer, jobs, models, retrieval, versioning
+    from database import SessionLocal
+
+    _, admin_id = login("batch-import-admin@example.com", role="admin")
+    seen = []
+
+    def rows(stream, fmt):
+        yield 1, {"description": "Plotter jams on A0 paper", "category": "Application", "resolution_text": "Cleared the plotter feed rollers"}, None
+        # The first batch is committed by now; look at it from another session
+        other = SessionLocal()
+        try:
+            seen.append(versioning.current(other, versioning.user_scope(admin_id)))
+            _, top = retrieval.get_index(other).search("plotter jams", top_k=1)[0]
+            seen.append(top["resolution_text"])
+        finally:
+            other.close()
+        raise RuntimeError("connection to the old system lost")
+
+    db = SessionLocal()
+    try:
+        before = versioning.current(db, versioning.user_scope(admin_id))
+        job = jobs.create(db, "import")
+        with patch("importer.iter_rows", rows):
+            try:
+                importer.run_import(db, None, "ndjson", job, admin_id, batch_size=1)
+            except RuntimeError:
+                pass
+        assert (job.status, job.succeeded) == (models.JobStatusEnum.Failed, 1)
+    finally:
+        db.close()
+    assert seen == [before + 1, "Cleared the plotter feed rollers"]
+
+def test_near_duplicate_joins_incident_without_llm_call():
+    """Test that a near-identical description reuses the open incident's suggestions."""
+    headers, _ = login("outage@example.com")
+    admin_headers, _ = login("outage-admin@example.com", role="admin")
+    first = raise_ticket(headers, description="Cannot connect to the corporate VPN from home office")
+
+    with patch("suggestions.generate_ai_resolution") as mock_generate:
+        res = client.post("/tickets/", json={"description": "Cannot connect to corporate VPN from my home office!", "category": "Network"}, headers=headers)
+    mock_generate.assert_not_called()
+    assert res.json()["ticket"]["incident_id"] == first["id"]
+    assert res.json()["ai_resolution"] == '["Fix one"]'
+
+    groups = client.get("/admin/incidents", headers=admin_headers).json()
+    assert any(g["incident_id"] == first["id"] and g["ticket_count"] == 2 for g in groups)
+    counters = client.get("/admin/metrics", headers=admin_headers).json()["counters"]
+    assert counters["suggestions.llm_calls_avoided"] >= 1
+
+def test_near_duplicates_skip_placeholders_and_stale_incidents():
+    """Test that outage placeholders are never reused and incidents escalated by another worker are skipped."""
+    import datetime
+    import dedup, models
+    from database import SessionLocal
+    from nlp_engine import FALLBACK_MESSAGE
+
+    headers, _ = login("stale-dup@example.com")
+    description = "Payroll portal shows a blank page after SSO login"
+    with patch("suggestions.generate_ai_resolution", return_value=json.dumps([FALLBACK_MESSAGE])):
+        client.post("/tickets/", json={"description": description, "category": "Application"}, headers=headers)
+
+    # A restarted worker warms its index from the database
+    dedup.reset()
+    with patch("suggestions.generate_ai_resolution", return_value=json.dumps(["Clear the SSO cookie"])) as mock_generate:
+        second = client.post("/tickets/", json={"description": description, "category": "Application"}, headers=headers).json()
+    mock_generate.assert_called_once()
+    assert second["ai_resolution"] == '["Clear the SSO cookie"]'
+
+    # Escalated by another worker: this worker's index still holds the incident
+    db = SessionLocal()
+    try:
+        db.query(models.Ticket).filter(models.Ticket.id == second["ticket"]["id"]).update(
+            {models.Ticket.escalated_at: datetime.datetime.utcnow()}
+        )
+        db.commit()
+    finally:
+        db.close()
+    with patch("suggestions.generate_ai_resolution", return_value=json.dumps(["Fix three"])) as mock_generate:
+        third = client.post("/tickets/", json={"description": description, "category": "Application"}, headers=headers).json()
+    mock_generate.assert_called_once()
+    assert third["ticket"]["incident_id"] != second["ticket"]["id"]
+
+def test_clustering_job_populates_trending_clusters():
+    """Test that a clustering run stores clusters with top terms and daily counts."""
+    headers, _ = login("cluster-admin@example.com", role="admin")
+    user_headers, _ = login("cluster-user@example.com")
+    for text in ["Printer toner empty on floor 2", "Printer toner low floor 3", "Excel macro crashes", "Excel macro freezes"]:
+        raise_ticket(user_headers, description=text, category="Application")
+
+    job = client.post("/admin/analytics/clusters/run", headers=headers).json()
+    assert client.get(f"/admin/jobs/{job['id']}", headers=headers).json()["status"] == "Finished"
+
+    report = client.get("/admin/analytics/clusters", headers=headers).json()
+    assert report["job_id"] == job["id"]
+    total = len(client.get("/admin/tickets?fields=summary", headers=headers).json())
+    assert sum(c["size"] for c in report["clusters"]) == total
+    assert all(c["top_terms"] and c["daily_counts"] for c in report["clusters"])
+
+def test_confirmed_fixes_skip_the_llm():
+    """Test that repeatedly selected fixes for similar tickets are served without an LLM call."""
+    import fixes
+
+    headers, _ = login("proven@example.com")
+    admin_headers, _ = login("proven-admin@example.com", role="admin")
+    fix = "Repair the Office installation from Programs and Features"
+    for text in ["Outlook keeps crashing when opening attachments", "Outlook crashing whenever I open attachments"]:
+        with patch("suggestions.generate_ai_resolution", return_value=json.dumps([fix, "Reboot"])):
+            ticket = client.post("/tickets/", json={"description": text, "category": "Application"}, headers=headers).json()["ticket"]
+        client.put(f"/tickets/{ticket['id']}/resolve", params={"resolution_text": f"Selected AI Fix: {fix}"}, headers=headers)
+
+    with patch.object(fixes, "FASTPATH_MIN_SCORE", 0.3), patch("suggestions.generate_ai_resolution") as mock_generate:
+        res = client.post("/tickets/", json={"description": "Outlook crashes opening attachments", "category": "Application"}, headers=headers)
+    mock_generate.assert_not_called()
+    assert json.loads(res.json()["ai_resolution"]) == [fix]
+
+    paths = client.get("/admin/metrics", headers=admin_headers).json()["suggestion_paths"]
+    assert paths["fastpath"]["count"] >= 1
+
+def test_escalations_are_appended_as_events():
+    """Test that escalating keeps the suggestions intact and records paginated history instead."""
+    headers, _ = login("events@example.com")
+    ticket = raise_ticket(headers, description="Laptop fan is loud")
+
+    client.put(f"/tickets/{ticket['id']}/escalate", headers=headers)
+    escalated = client.put(f"/tickets/{ticket['id']}/escalate", headers=headers).json()
+    assert escalated["escalation_count"] == 2
+    assert escalated["escalated_at"] is not None
+    assert escalated["resolution"]["resolution_text"] == json.dumps(["Fix one"])
+
+    newest = client.get(f"/tickets/{ticket['id']}/events?limit=2", headers=headers).json()
+    assert [e["type"] for e in newest] == ["escalated", "escalated"]
+    assert newest[0]["payload"]["count"] == 2
+    older = client.get(f"/tickets/{ticket['id']}/events?limit=2&before={newest[-1]['id']}", headers=headers).json()
+    assert [e["type"] for e in older] == ["suggested"]
+
+    resolved = client.put(f"/tickets/{ticket['id']}/resolve?resolution_text=Cleaned the fan", headers=headers).json()
+    assert resolved["escalated_at"] is None and resolved["escalation_count"] == 2
+
+def test_migrate_splits_legacy_escalation_blobs():
+    """Test that old prepended escalation blobs become events plus structured state."""
+    import datetime
+    import migrate, models
+    from database import SessionLocal
+
+    blob = migrate.LEGACY_ESCALATION_MESSAGE + migrate.LEGACY_NOTES_SEPARATOR
+    assert migrate.split_escalation_blob(blob * 2 + '["Fix one"]') == (2, '["Fix one"]')
+    assert migrate.split_escalation_blob(migrate.LEGACY_ESCALATION_MESSAGE) == (1, "")
+
+    headers, _ = login("legacy-blob@example.com")
+    ticket = raise_ticket(headers, description="Old escalated ticket")
+    opened = datetime.datetime(2024, 3, 1, 9, 30)
+    db = SessionLocal()
+    try:
+        # Legacy rows: no updated_at, and the suggestion was written days after the ticket
+        db.query(models.Ticket).filter(models.Ticket.id == ticket["id"]).update(
+            {models.Ticket.created_date: opened, models.Ticket.updated_at: None},
+            synchronize_session=False
+        )
+        res = db.query(models.Resolution).filter(models.Resolution.ticket_id == ticket["id"]).one()
+        res.resolution_text = blob * 3 + "Restarted the router"
+        res.resolved_date, res.updated_at = opened + datetime.timedelta(days=5), None
+        db.commit()
+    finally:
+        db.close()
+
+    migrate.migrate_escalation_blobs()
+    detail = client.get(f"/tickets/{ticket['id']}", headers=headers).json()
+    assert detail["escalation_count"] == 3
+    assert detail["resolution"]["resolution_text"] == "Restarted the router"
+    history = client.get(f"/tickets/{ticket['id']}/events", headers=headers).json()
+    assert [e["type"] for e in history].count("escalated") == 3
+    assert detail["escalated_at"] == opened.isoformat()
+    db = SessionLocal()
+    try:
+        # Migrating doesn't count as a change to the ticket itself
+        assert db.get(models.Ticket, ticket["id"]).updated_at is None
+    finally:
+        db.close()
+
+def test_bulk_admin_operations():
+    """Test bulk status/resolve in one call, with dry runs and per-id outcomes."""
+    admin_headers, _ = login("bulk-admin@example.com", role="admin")
+    headers, user_id = login("bulk-user@example.com")
+    ids = [raise_ticket(headers, description=f"Outage ticket {n}")["id"] for n in range(3)]
+    client.put(f"/tickets/{ids[0]}/resolve?resolution_text=Already fixed", headers=headers)
+
+    body = {"action": "resolve", "ids": ids + [999999], "resolution_text": "Outage over", "dry_run": True}
+    dry = client.post("/admin/tickets/bulk", json=body, headers=admin_headers).json()
+    assert dry["matched"] == 3 and dry["updated"] == 0
+    assert {o["id"]: o["outcome"] for o in dry["outcomes"]} == {
+        ids[0]: "skipped", ids[1]: "would_update", ids[2]: "would_update", 999999: "not_found"
+    }
+    assert client.get(f"/tickets/{ids[1]}", headers=headers).json()["status"] == "Open"
+
+    done = client.post("/admin/tickets/bulk", json={**body, "dry_run": False}, headers=admin_headers).json()
+    assert done["updated"] == 2
+    detail = client.get(f"/tickets/{ids[1]}", headers=headers).json()
+    assert detail["status"] == "Resolved"
+    assert detail["resolution"]["resolution_text"] == "Outage over"
+    assert client.get(f"/tickets/{ids[2]}/events", headers=headers).json()[0]["type"] == "resolved"
+
+    closed = client.post("/admin/tickets/bulk", json={
+        "action": "status", "status": "Closed", "filter": {"user_id": user_id, "status": "Resolved"}
+    }, headers=admin_headers).json()
+    assert closed["updated"] == 3
+    assert client.post("/admin/tickets/bulk", json={"action": "escalate"}, headers=admin_headers).status_code == 400
+    assert client.post("/admin/tickets/bulk", json={"action": "escalate", "filter": {}}, headers=admin_headers).status_code == 400
+
+    # Each escalated ticket counts against the suggestions it was shown
+    import fixes, models
+    from database import SessionLocal
+    shown = [raise_ticket(headers, description=f"Badge reader {n} offline")["id"] for n in range(2)]
+    db = SessionLocal()
+    try:
+        before = db.get(models.ConfirmedFix, fixes.fix_key("Fix one"))
+        before = before.escalated_count if before else 0
+        client.post("/admin/tickets/bulk", json={"action": "escalate", "ids": shown}, headers=admin_headers)
+        db.expire_all()
+        assert db.get(models.ConfirmedFix, fixes.fix_key("Fix one")).escalated_count == before + 2
+    finally:
+        db.close()
+
+def test_full_text_search_ranks_and_filters():
+    """Test the admin search endpoint: stemming, prefix queries, ranking and filters."""
+    admin_headers, _ = login("search-admin@example.com", role="admin")
+    headers, _ = login("search-user@example.com")
+    jam = raise_ticket(headers, description="Quillprinter jammed again on floor 3", category="Application")
+    raise_ticket(headers, description="Cannot reach the shared quillprinters", category="Network")
+    raise_ticket(headers, description="Aquarium pump noisy", category="Network")
+
+    hits = client.get("/admin/tickets/search?q=quillprinter jam", headers=admin_headers).json()
+    assert [h["id"] for h in hits] == [jam["id"]]
+
+    prefix = client.get("/admin/tickets/search?q=quill*", headers=admin_headers).json()
+    assert len(prefix) >= 2
+    assert prefix == sorted(prefix, key=lambda h: h["rank"], reverse=True)
+
+    network = client.get("/admin/tickets/search?q=quill*&category=Network", headers=admin_headers).json()
+    assert network and all(h["category"] == "Network" for h in network)
+
+    # Resolution text is indexed too, and kept in sync by triggers
+    client.put(f"/tickets/{jam['id']}/resolve?resolution_text=Replaced the zebrafish fuser", headers=headers)
+    found = client.get("/admin/tickets/search?q=zebrafish&status=Resolved", headers=admin_headers).json()
+    assert [h["id"] for h in found] == [jam["id"]]
+
+def test_postgres_search_matches_each_indexed_vector_on_its_own():
+    """Test that the Postgres search query filters each tsvector by itself, so both GIN indexes can be used."""
+    from sqlalchemy.dialects import postgresql
+    import search
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        query = search._postgres_query(db, search.parse_terms("printer jam*"))
+        sql = str(query.statement.compile(dialect=postgresql.dialect()))
+    finally:
+        db.close()
+    assert "tickets.search_vector @@ to_tsquery" in sql
+    assert "resolutions.search_vector @@ to_tsquery" in sql
+    assert "UNION" in sql and "||" not in sql
+
+def test_ready_endpoint_and_lazy_imports():
+    """Test that /ready reports readiness and that importing the API loads no ML libraries."""
+    import subprocess, sys
+
+    with TestClient(app) as started:
+        res = started.get("/ready")
+    assert res.status_code == 200
+    assert res.json() == {"ready": True, "database": True, "warm": True}
+
+    check = "import sys, main; print(','.join(m for m in ('numpy', 'pandas', 'sklearn', 'scipy', 'groq', 'pyarrow') if m in sys.modules))"
+    loaded = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, check=True).stdout.strip()
+    assert loaded == ""
+
+def test_ticket_updates_are_pushed_to_subscribers():
+    """Test that ticket writes push the changed ticket to that user's stream only."""
+    import asyncio
+    import pubsub, versioning
+
+    headers, user_id = login("stream@example.com")
+    ticket = raise_ticket(headers, description="Docking station not detected")
+    assert client.get("/tickets/stream").status_code == 401
+
+    loop = asyncio.new_event_loop()
+    mine = pubsub.broker.subscribe([versioning.user_scope(user_id)], loop)
+    admins = pubsub.broker.subscribe([versioning.GLOBAL_SCOPE], loop)
+    someone_else = pubsub.broker.subscribe([versioning.user_scope(user_id + 1000)], loop)
+    try:
+        client.put(f"/tickets/{ticket['id']}/escalate", headers=headers)
+        # Deliveries are scheduled onto the subscriber's loop from the request thread
+        loop.run_until_complete(asyncio.sleep(0))
+
+        pushed = mine.queue.get_nowait()
+        assert pushed["type"] == "ticket"
+        assert pushed["ticket"]["id"] == ticket["id"]
+        assert pushed["ticket"]["escalation_count"] == 1
+        assert admins.queue.get_nowait()["ticket"]["id"] == ticket["id"]
+        assert someone_else.queue.empty()
+    finally:
+        for sub in (mine, admins, someone_else):
+            pubsub.broker.unsubscribe(sub)
+        loop.close()
+
+def test_retrieval_routes_to_department_and_global_shards():
+    """Test that queries see their own department's fixes plus cross-department ones only."""
+    import metrics, models, retrieval
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        def resolved(department, description, resolution_text):
+            user = models.User(name=department, email=f"{description[:12]}@{department}.example.com", department=department)
+            db.add(user)
+            db.flush()
+            ticket = models.Ticket(user_id=user.id, description=description, category=models.CategoryEnum.Application, status=models.StatusEnum.Resolved)
+            db.add(ticket)
+            db.flush()
+            db.add(models.Resolution(ticket_id=ticket.id, resolution_text=resolution_text))
+            retrieval.record_change(db, ticket.id)
+            return ticket.id
+
+        sap = resolved("Finance", "SAP posting period locked", "Reopened the SAP posting period")
+        github = resolved("Engineering", "GitHub org access denied", "Added user to the GitHub org team")
+        shared_fix = "Selected AI Fix: Cleared the zoltar browser cache"
+        resolved("Finance", "Zoltar portal blank page", shared_fix)
+        latest = resolved(" engineering", "Zoltar portal blank page again", shared_fix)
+        db.commit()
+
+        with patch.object(retrieval, "GLOBAL_SHARD_REFRESH_SECONDS", 0):
+            finance = retrieval.get_index(db, "finance")
+            legal = retrieval.get_index(db, "Legal")
+        def hits(index, text):
+            return [r["id"] for score, r in index.search(text) if score > 0]
+
+        assert hits(finance, "SAP posting period GitHub org access") == [sap]
+        assert github in hits(retrieval.get_index(db, "Engineering"), "GitHub org access")
+        # Used in two departments, so it's a cross-cutting fix every shard sees (once)
+        assert hits(legal, "zoltar portal blank") == [latest]
+    finally:
+        db.close()
+
+    snap = metrics.snapshot()
+    assert snap["gauges"]["retrieval.shard.finance.rows"] >= 2
+    assert "retrieval.shard._global.query" in snap["timings"]
+
+def test_ticket_list_cache_serves_repeat_reads_until_a_write():
+    """Test that repeat list reads come from the cache and a write is visible on the next read."""
+    import list_cache, metrics, models, versioning
+    from database import SessionLocal
+
+    headers, user_id = login("listcache@example.com")
+    ticket = raise_ticket(headers, description="Headset crackles on calls")
+
+    def hits():
+        return metrics.snapshot()["counters"].get("list_cache.hits", 0)
+
+    first = client.get(f"/tickets/user/{user_id}", headers=headers)
+    before = hits()
+    again = client.get(f"/tickets/user/{user_id}", headers=headers)
+    assert hits() == before + 1
+    assert again.content == first.content
+    assert again.headers["ETag"] == first.headers["ETag"]
+
+    # A write from another worker only shows up through the shared version counter
+    db = SessionLocal()
+    try:
+        db.query(models.Ticket).filter(models.Ticket.id == ticket["id"]).update({models.Ticket.status: models.StatusEnum.Closed})
+        versioning.bump(db, user_id)
+        db.commit()
+    finally:
+        db.close()
+    after = client.get(f"/tickets/user/{user_id}", headers=headers)
+    assert after.headers["ETag"] != first.headers["ETag"]
+    assert after.json()[0]["status"] == "Closed"
+
+    report = client.get("/admin/metrics", headers=login("listcache-admin@example.com", role="admin")[0]).json()["list_cache"]
+    assert report["hits"] >= 1 and 0 < report["bytes"] <= list_cache.LIST_CACHE_MAX_BYTES
+
+def test_archive_moves_old_closed_tickets_out_of_live_reads():
+    """Test that archived tickets leave the live lists but stay readable and retrievable on request."""
+    import archive, datetime, models, retrieval, versioning
+    from database import SessionLocal
+
+    headers, user_id = login("archive@example.com")
+    old = raise_ticket(headers, description="Plotter firmware wedged after qwertyuiop update")
+    fresh = raise_ticket(headers, description="Plotter jams on A1 paper")
+
+    db = SessionLocal()
+    try:
+        long_ago = datetime.datetime.utcnow() - datetime.timedelta(days=400)
+        db.add(models.Resolution(ticket_id=old["id"], resolution_text="Reflashed the qwertyuiop plotter firmware"))
+        db.query(models.Ticket).filter(models.Ticket.id == old["id"]).update({
+            models.Ticket.status: models.StatusEnum.Closed, models.Ticket.updated_at: long_ago
+        })
+        retrieval.record_change(db, old["id"])
+        versioning.bump(db, user_id)
+        db.commit()
+
+        assert archive.run_archive(db, days=90) >= 1
+        assert db.query(models.Ticket).filter(models.Ticket.id == old["id"]).count() == 0
+        matches = retrieval.get_index(db, "IT").search("qwertyuiop plotter firmware")
+        assert any(r["id"] == old["id"] and score > 0 for score, r in matches)
+    finally:
+        db.close()
+
+    live = client.get(f"/tickets/user/{user_id}", headers=headers).json()
+    assert [t["id"] for t in live] == [fresh["id"]]
+    both = client.get(f"/tickets/user/{user_id}?include_archived=true", headers=headers).json()
+    assert [(t["id"], t["archived"]) for t in both] == [(old["id"], True), (fresh["id"], False)]
+
+    assert client.get(f"/tickets/{old['id']}", headers=headers).status_code == 404
+    detail = client.get(f"/tickets/{old['id']}?include_archived=true", headers=headers).json()
+    assert detail["resolution"]["resolution_text"] == "Reflashed the qwertyuiop plotter firmware"
+    history = client.get(f"/tickets/{old['id']}/events?include_archived=true", headers=headers)
+    assert history.status_code == 200 and history.json()
+
+def test_archiving_the_newest_tickets_never_frees_their_ids(tmp_path):
+    """Test that tickets raised after the newest ones were archived get new ids, also on a migrated legacy SQLite file."""
+    import archive, datetime, migrate, models
+    from sqlalchemy import MetaData, create_engine, insert, select
+    from database import Base, SessionLocal
+
+    headers, _ = login("archive-ids@example.com")
+    newest = raise_ticket(headers, description="Docking station drops both monitors")
+    db = SessionLocal()
+    try:
+        long_ago = datetime.datetime.utcnow() - datetime.timedelta(days=400)
+        db.query(models.Ticket).filter(models.Ticket.id >= newest["id"]).update({
+            models.Ticket.status: models.StatusEnum.Closed, models.Ticket.updated_at: long_ago
+        })
+        db.commit()
+        archive.run_archive(db, days=90)
+        assert db.query(models.Ticket).filter(models.Ticket.id >= newest["id"]).count() == 0
+        archived_event = db.query(models.TicketEventArchive.id).order_by(models.TicketEventArchive.id.desc()).first()
+    finally:
+        db.close()
+    ticket = raise_ticket(headers, description="Docking station drops both monitors again")
+    assert ticket["id"] > newest["id"]
+    events = client.get(f"/tickets/{ticket['id']}/events", headers=headers).json()
+    assert events and min(e["id"] for e in events) > archived_event.id
+
+    # A database created before AUTOINCREMENT: rebuilt once, sequences start above the archive
+    legacy_engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    legacy = MetaData()
+    for name in ("users", "tickets", "ticket_events"):
+        Base.metadata.tables[name].to_metadata(legacy).dialect_options["sqlite"]["autoincrement"] = False
+    legacy.create_all(legacy_engine)
+    Base.metadata.create_all(legacy_engine)
+    with legacy_engine.begin() as conn:
+        conn.execute(insert(models.Ticket.__table__).values(id=3, description="Live", escalation_count=0))
+        conn.execute(insert(models.TicketArchive.__table__).values(id=9, created_date=long_ago, description="Archived"))
+    with patch("migrate.engine", legacy_engine):
+        migrate.use_sqlite_autoincrement()
+        migrate.use_sqlite_autoincrement()
+    with legacy_engine.begin() as conn:
+        conn.execute(insert(models.Ticket.__table__).values(description="New", escalation_count=0))
+        assert conn.execute(select(models.Ticket.id).order_by(models.Ticket.id)).scalars().all() == [3, 10]
+    legacy_engine.dispose()
+
+def test_identical_suggestions_are_computed_once():
+    """Test that concurrent identical requests share one computation, in-process and across workers."""
+    import datetime, threading, time
+    import models, singleflight
+    from database import SessionLocal
+
+    assert singleflight.key("VPN down!!", "Network", "it") == singleflight.key("vpn  down", "Network", "it")
+    # A lease outlives a leader that queued for the LLM and used every attempt of the call
+    from llm_scheduler import LLM_QUEUE_TIMEOUT_SECONDS
+    from nlp_engine import LLM_MAX_CALL_SECONDS
+    assert singleflight.SINGLEFLIGHT_WAIT_SECONDS > LLM_QUEUE_TIMEOUT_SECONDS + LLM_MAX_CALL_SECONDS
+
+    calls, results = [], []
+    def slow():
+        calls.append(1)
+        time.sleep(0.3)
+        return ["Restart the VPN client", "llm"]
+    threads = [threading.Thread(target=lambda: results.append(singleflight.run("same-vpn", slow))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert len(calls) == 1
+    assert sorted(coalesced for _, coalesced in results) == [False, True, True, True, True]
+
+    def leased_elsewhere(key):
+        db = SessionLocal()
+        try:
+            expires = datetime.datetime.utcnow() + datetime.timedelta(seconds=30)
+            db.add(models.SuggestionLease(key=key, owner="other-worker", expires_at=expires))
+            db.commit()
+        finally:
+            db.close()
+
+    def finish_elsewhere(key, result):
+        time.sleep(0.3)
+        db = SessionLocal()
+        try:
+            db.query(models.SuggestionLease).filter(models.SuggestionLease.key == key).update(
+                {models.SuggestionLease.result: json.dumps(result)}
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def never_called():
+        raise AssertionError("should have waited for the other worker")
+
+    with patch.object(singleflight, "SINGLEFLIGHT_BACKEND", "db"):
+        # Another worker holds the lease and finishes: its result is used
+        leased_elsewhere("printer-jam")
+        threading.Thread(target=finish_elsewhere, args=("printer-jam", ["Clear the tray", "fastpath"])).start()
+        assert singleflight.run("printer-jam", never_called) == (["Clear the tray", "fastpath"], True)
+
+        # The holder never finishes: compute independently once the wait runs out
+        leased_elsewhere("stuck")
+        with patch.object(singleflight, "SINGLEFLIGHT_WAIT_SECONDS", 0.3):
+            assert singleflight.run("stuck", lambda: ["Own fix", "llm"]) == (["Own fix", "llm"], False)
+
+        # Leading here publishes the result for the other workers
+        assert singleflight.run("fresh", lambda: ["Led here", "llm"]) == (["Led here", "llm"], False)
+        db = SessionLocal()
+        try:
+            assert json.loads(db.get(models.SuggestionLease, "fresh").result) == ["Led here", "llm"]
+        finally:
+            db.close()
+
+def test_resuggest_job_refreshes_open_tickets_and_resumes():
+    """Test that the batch job rewrites stale AI suggestions, fills missing ones and resumes from its checkpoint."""
+    import pytest
+    import models, resuggest
+    from database import SessionLocal
+
+    headers, user_id = login("resuggest@example.com")
+    admin_headers, _ = login("resuggest-admin@example.com", role="admin")
+    stale = raise_ticket(headers, description="Outlook search returns nothing")
+    unsuggested = client.post(f"/admin/tickets?user_id={user_id}", json={
+        "description": "Outlook calendar not syncing", "category": "Application"
+    }, headers=admin_headers).json()["ticket"]
+    picked = raise_ticket(headers, description="Outlook crashes on start")
+    noted = raise_ticket(headers, description="Outlook add-in missing")
+
+    db = SessionLocal()
+    try:
+        db.query(models.User).filter(models.User.id == user_id).update({models.User.department: "Resuggest Lab"})
+        # An older AI list with a newer human note: the note is what the ticket shows
+        db.add(models.Resolution(ticket_id=noted["id"], resolution_text="Support re-deployed the add-in"))
+        db.query(models.Resolution).filter(models.Resolution.ticket_id == picked["id"]).update(
+            {models.Resolution.resolution_text: "Selected AI Fix: Started Outlook in safe mode"}
+        )
+        db.commit()
+
+        job = resuggest.start_job(db, resuggest.make_filters(department="Resuggest Lab"))
+        # The run dies on the second ticket, after the first chunk was committed
+        with patch("resuggest.generate_ai_resolution", side_effect=['["Rebuild the search index"]', RuntimeError("worker killed")]):
+            with pytest.raises(RuntimeError):
+                resuggest.run_resuggest(db, job, workers=0, chunk_size=1)
+        db.rollback()
+        assert job.checkpoint["last_id"] == stale["id"]
+
+        with patch("resuggest.generate_ai_resolution", return_value='["Re-add the shared calendar"]') as generate:
+            stats = resuggest.run_resuggest(db, job, workers=0, chunk_size=1)
+        assert generate.call_count == 1
+        assert job.status == models.JobStatusEnum.Finished and job.processed == 2 and stats["llm"] == 2
+        assert stats["tickets_per_second"] > 0
+    finally:
+        db.close()
+
+    def suggestion(ticket_id):
+        return client.get(f"/tickets/{ticket_id}", headers=headers).json()["resolution"]["resolution_text"]
+    assert suggestion(stale["id"]) == '["Rebuild the search index"]'
+    assert suggestion(unsuggested["id"]) == '["Re-add the shared calendar"]'
+    assert suggestion(picked["id"]) == "Selected AI Fix: Started Outlook in safe mode"
+    db = SessionLocal()
+    try:
+        # Not selected at all, so neither of its rows was rewritten
+        texts = [r.resolution_text for r in db.query(models.Resolution).filter(models.Resolution.ticket_id == noted["id"]).order_by(models.Resolution.id)]
+    finally:
+        db.close()
+    assert texts == ['["Fix one"]', "Support re-deployed the add-in"]
+    history = client.get(f"/tickets/{unsuggested['id']}/events", headers=headers).json()
+    assert history[0]["type"] == "suggested"
+    assert client.post(f"/admin/jobs/{job.id}/resume", headers=admin_headers).status_code == 400
+
+def test_resuggest_skips_concurrent_edits_and_retries_llm_failures():
+    """Test that tickets changed mid-chunk aren't counted or published and LLM failures are retried on resume."""
+    import datetime
+    import models, resuggest
+    from sqlalchemy import update
+    from database import SessionLocal
+    from nlp_engine import FALLBACK_MESSAGE
+
+    headers, user_id = login("resuggest-retry@example.com")
+    admin_headers, _ = login("resuggest-retry-admin@example.com", role="admin")
+    outage = raise_ticket(headers, description="Jira board won't load")
+    edited = raise_ticket(headers, description="Jira notifications stopped")
+
+    def generate(description, matches=None, priority=None):
+        if description == edited["description"]:
+            # The user selects a fix while the job computes a new list
+            other = SessionLocal()
+            try:
+                other.query(models.Resolution).filter(models.Resolution.ticket_id == edited["id"]).update(
+                    {models.Resolution.resolution_text: "Selected AI Fix: Re-subscribed to the board"}
+                )
+                other.commit()
+            finally:
+                other.close()
+            return '["Check the notification scheme"]'
+        return json.dumps([FALLBACK_MESSAGE])
+
+    db = SessionLocal()
+    try:
+        db.query(models.User).filter(models.User.id == user_id).update({models.User.department: "Retry Lab"})
+        db.commit()
+        job = resuggest.start_job(db, resuggest.make_filters(department="Retry Lab"))
+        with patch("resuggest.generate_ai_resolution", side_effect=generate), patch("pubsub.publish") as publish:
+            stats = resuggest.run_resuggest(db, job, workers=0, chunk_size=1)
+        assert publish.call_args_list[-1].args[1] == []
+        assert (job.succeeded, job.failed, stats["skipped"]) == (0, 1, 1)
+        assert job.checkpoint["retry_ids"] == [outage["id"]]
+        assert [e["type"] for e in client.get(f"/tickets/{edited['id']}/events", headers=headers).json()].count("suggested") == 1
+
+        # Finished with a retry left, so it can still be resumed
+        with patch("resuggest.run_resuggest_job"):
+            assert client.post(f"/admin/jobs/{job.id}/resume", headers=admin_headers).status_code == 202
+        with patch("resuggest.generate_ai_resolution", return_value='["Clear the Jira cache"]') as retried:
+            resuggest.run_resuggest(db, job, workers=0, chunk_size=1)
+        assert retried.call_count == 1 and job.checkpoint["retry_ids"] == []
+        assert client.post(f"/admin/jobs/{job.id}/resume", headers=admin_headers).status_code == 400
+
+        # A Running job without an update time is judged by when it was created
+        db.execute(update(models.Job).where(models.Job.id == job.id).values(
+            status=models.JobStatusEnum.Running, updated_at=None
+        ))
+        db.commit()
+        assert client.post(f"/admin/jobs/{job.id}/resume", headers=admin_headers).status_code == 409
+        db.execute(update(models.Job).where(models.Job.id == job.id).values(
+            created_at=datetime.datetime.utcnow() - resuggest.STALLED_AFTER, updated_at=None
+        ))
+        db.commit()
+        with patch("resuggest.run_resuggest_job"):
+            assert client.post(f"/admin/jobs/{job.id}/resume", headers=admin_headers).status_code == 202
+    finally:
+        db.close()
+    assert client.get(f"/tickets/{outage['id']}", headers=headers).json()["resolution"]["resolution_text"] == '["Clear the Jira cache"]'
+    assert client.get(f"/tickets/{edited['id']}", headers=headers).json()["resolution"]["resolution_text"] == "Selected AI Fix: Re-subscribed to the board"
+
+def test_traced_request_records_spans_for_each_stage(tmp_path):
+    """Test that a sampled traceparent is continued through the handler, auth, SQL, retrieval and LLM spans."""
+    from unittest.mock import MagicMock
+    import tracing
+
+    headers, _ = login("tracing@example.com")
+    parent = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    completion = MagicMock()
+    completion.choices[0].message.content = '{"steps": ["Reseat the dock cable"]}'
+
+    with patch.object(tracing, "TRACE_EXPORT", f"file:{tmp_path / 'spans.jsonl'}"):
+        # Tracing is off: a client can't force spans with a sampled header
+        client.get("/", headers={"traceparent": parent})
+        tracing.flush()
+    assert not (tmp_path / "spans.jsonl").exists()
+
+    with patch.object(tracing, "TRACE_EXPORT", f"file:{tmp_path / 'spans.jsonl'}"), \
+            patch.object(tracing, "TRACE_TRUST_PARENT", True), \
+            patch("nlp_engine.client.chat.completions.create", return_value=completion):
+        res = client.post("/tickets/", json={"description": "Thunderbolt dock flickers zxqv", "category": "Application"},
+                          headers={**headers, "traceparent": parent})
+        unsampled = client.get("/", headers={"traceparent": parent[:-2] + "00"})
+        tracing.flush()
+    spans = [json.loads(line) for line in (tmp_path / "spans.jsonl").read_text().splitlines()]
+
+    assert res.headers["x-trace-id"] == "4bf92f3577b34da6a3ce929d0e0e4736"
+    assert "x-trace-id" not in unsampled.headers
+    assert {s["trace_id"] for s in spans} == {"4bf92f3577b34da6a3ce929d0e0e4736"}
+    by_name = {s["name"]: s for s in spans}
+    root = by_name["POST /tickets/"]
+    assert root["parent_id"] == "00f067aa0ba902b7" and root["attributes"]["http.status_code"] == 200
+    for name in ("handler tickets.raise_ticket", "auth.get_current_user", "suggest.dedup", "retrieval.search",
+                 "nlp.prompt", "llm.scheduler", "llm.groq"):
+        assert name in by_name, name
+    assert by_name["llm.groq"]["parent_id"] == by_name["llm.scheduler"]["span_id"]
+    assert any(s["name"] == "sql" and s["attributes"]["statement"].startswith("INSERT INTO tickets") for s in spans)
+
+    summary = tracing.summarize(spans)[0]
+    assert summary["root"] == "POST /tickets/" and summary["spans"] == len(spans)
+
+    # The span file is moved aside once it reaches the size limit
+    with patch.object(tracing, "TRACE_EXPORT", f"file:{tmp_path / 'spans.jsonl'}"), \
+            patch.object(tracing, "TRACE_TRUST_PARENT", True), patch.object(tracing, "TRACE_FILE_MAX_BYTES", 1):
+        client.get("/", headers={"traceparent": parent})
+        tracing.flush()
+    assert len((tmp_path / "spans.jsonl.1").read_text().splitlines()) == len(spans)
+    assert len((tmp_path / "spans.jsonl").read_text().splitlines()) == 1
+
+def test_idempotency_key_replays_ticket_submission():
+    """Test that a retried submission with the same Idempotency-Key returns the first ticket without re-running anything."""
+    import datetime
+    import threading
+    import time
+    import pytest
+    import idempotency, models
+    from database import SessionLocal
+
+    headers, user_id = login("idempotent@example.com")
+    body = {"description": "Laptop will not boot after update", "category": "Application", "priority": "High"}
+    keyed = {**headers, "Idempotency-Key": "submit-1"}
+
+    with patch("suggestions.generate_ai_resolution", return_value=json.dumps(["Roll back the update"])) as llm:
+        first = client.post("/tickets/", json=body, headers=keyed)
+        retry = client.post("/tickets/", json=body, headers=keyed)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert llm.call_count == 1
+    tickets = client.get(f"/tickets/user/{user_id}", headers=headers).json()
+    assert [t["id"] for t in tickets] == [first.json()["ticket"]["id"]]
+
+    # Same key, different body
+    changed = client.post("/tickets/", json={**body, "priority": "Low"}, headers=keyed)
+    assert changed.status_code == 422
+
+    # A failed request releases its key, so the retry runs
+    with patch("routers.tickets._create_ticket", side_effect=RuntimeError("db went away")), pytest.raises(RuntimeError):
+        client.post("/tickets/", json=body, headers={**headers, "Idempotency-Key": "submit-2"})
+    second = raise_ticket({**headers, "Idempotency-Key": "submit-2"}, body["description"], body["category"], body["priority"])
+    assert second["id"] != first.json()["ticket"]["id"]
+
+    # A duplicate of a request that is still running waits for its response
+    scope_key = idempotency.record_key(f"user:{user_id} POST /tickets/", "submit-3")
+    db = SessionLocal()
+    try:
+        db.add(models.IdempotencyKey(
+            key=scope_key, owner="other-worker", request_hash=idempotency.fingerprint(body),
+            expires_at=datetime.datetime.utcnow() + datetime.timedelta(seconds=30)
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+    def finish_elsewhere():
+        time.sleep(0.3)
+        db = SessionLocal()
+        try:
+            db.query(models.IdempotencyKey).filter(models.IdempotencyKey.key == scope_key).update({
+                models.IdempotencyKey.status_code: 200,
+                models.IdempotencyKey.response: json.dumps({"ticket": {"id": 12345}, "ai_resolution": ""}),
+            })
+            db.commit()
+        finally:
+            db.close()
+
+    threading.Thread(target=finish_elsewhere).start()
+    with patch("routers.tickets._create_ticket", side_effect=AssertionError("should have waited")):
+        waited = client.post("/tickets/", json=body, headers={**headers, "Idempotency-Key": "submit-3"})
+    assert waited.status_code == 200
+    assert waited.json()["ticket"]["id"] == 12345
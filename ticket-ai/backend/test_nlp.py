@@ -53,3 +53,115 @@ def test_generate_ai_resolution_fallback(mock_create):
     
     assert isinstance(result_list, list)
     assert "Our automated assistant is temporarily unavailable." in result_list[0]
+
+def test_llm_scheduler_orders_by_priority_and_drops_expired():
+    """Test that queued LLM calls run High before Low, and work past its deadline is dropped."""
+    import threading, time
+    from llm_scheduler import LLMScheduler, DeadlineExceeded
+
+    sched = LLMScheduler(max_concurrency=1, rate_per_minute=6000, burst=10)
+    release, order = threading.Event(), []
+
+    holder = threading.Thread(target=sched.run, args=(release.wait,))
+    holder.start()
+    time.sleep(0.05)
+
+    # Low queues first, High arrives later but should still be admitted first
+    waiters = []
+    for priority in ("Low", "High"):
+        thread = threading.Thread(target=sched.run, args=(lambda p=priority: order.append(p),), kwargs={"priority": priority})
+        thread.start()
+        waiters.append(thread)
+        time.sleep(0.05)
+
+    with pytest.raises(DeadlineExceeded):
+        sched.run(lambda: None, priority="High", timeout=0.1)
+
+    release.set()
+    for thread in [holder] + waiters:
+        thread.join(timeout=5)
+    assert order == ["High", "Low"]
+
+def test_llm_scheduler_rejects_callers_beyond_the_queue_cap():
+    """Test that once LLM_MAX_QUEUED calls are waiting, further calls fail fast instead of blocking a thread."""
+    import threading, time
+    from llm_scheduler import LLMScheduler, QueueFull
+
+    sched = LLMScheduler(max_concurrency=1, rate_per_minute=6000, burst=10, max_queued=1)
+    release = threading.Event()
+    threads = [threading.Thread(target=sched.run, args=(release.wait,)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+
+    started = time.monotonic()
+    with pytest.raises(QueueFull):
+        sched.run(lambda: None, timeout=5)
+    assert time.monotonic() - started < 1
+
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert sched.run(lambda: "admitted") == "admitted"
+
+@patch("nlp_engine.scheduler.run", side_effect=nlp_engine.DeadlineExceeded("queue full"))
+def test_generate_ai_resolution_queue_timeout(mock_run):
+    """Test that a call dropped by the scheduler falls back instead of waiting on Groq."""
+    result_list = json.loads(nlp_engine.generate_ai_resolution("VPN is down.", [], priority="Low"))
+    assert result_list == [nlp_engine.FALLBACK_MESSAGE]
+
+def test_fake_groq_server_speaks_the_chat_completions_api():
+    """Test that the load-test stand-in answers the real Groq client, including injected errors."""
+    from fastapi.testclient import TestClient
+    from groq import Groq, InternalServerError
+    from benchmarks import fake_groq
+
+    ok = Groq(api_key="fake", base_url="http://testserver", max_retries=0,
+              http_client=TestClient(fake_groq.create_app(latency="fixed:1")))
+    completion = ok.chat.completions.create(model="llama-3.1-8b-instant", messages=[{"role": "user", "content": "VPN down"}])
+    assert len(json.loads(completion.choices[0].message.content)) == 5
+    assert completion.usage.total_tokens > 0
+
+    failing = Groq(api_key="fake", base_url="http://testserver", max_retries=0,
+                   http_client=TestClient(fake_groq.create_app(latency="fixed:1", error_rate=1.0)))
+    with pytest.raises(InternalServerError):
+        failing.chat.completions.create(model="llama-3.1-8b-instant", messages=[{"role": "user", "content": "VPN down"}])
+
+def test_prompt_builder_merges_duplicates_and_respects_budget():
+    """Test that cloned resolutions are sent once and context stops at the token budget."""
+    import prompt_builder
+
+    clones = [(0.9 - i * 0.01, {"resolution_text": "Changed VPN protocol from UDP to TCP."}) for i in range(4)]
+    selected = [(0.7, {"resolution_text": "Selected AI Fix: Changed the VPN protocol from UDP to TCP"})]
+    other = [(0.6, {"resolution_text": "Reinstalled the VPN client " + "and rebooted " * 200})]
+    unrelated = [(0.01, {"resolution_text": "Replaced printer toner"})]
+
+    messages, stats = prompt_builder.build_messages("VPN disconnects every 5 minutes", clones + selected + other + unrelated)
+    context = messages[1]["content"]
+    assert messages[0]["content"] == prompt_builder.SYSTEM_PROMPT
+    assert context.count("UDP to TCP") == 1
+    assert "resolved 5 tickets" in context
+    assert "toner" not in context
+    assert stats["resolutions_distinct"] == 2
+    assert stats["prompt_tokens"] <= prompt_builder.PROMPT_INPUT_TOKEN_BUDGET
+    assert stats["context_tokens"] < stats["context_tokens_verbatim"]
+
+    assert json.loads(prompt_builder.parse_steps('{"steps": ["a", "b"]}')) == ["a", "b"]
+    assert json.loads(prompt_builder.parse_steps('```json\n["a"]\n```')) == ["a"]
+
+@patch("nlp_engine.client.chat.completions.create")
+def test_generate_ai_resolution_uses_json_mode_and_output_budget(mock_create):
+    """Test that the Groq request asks for a JSON object within the tight output budget."""
+    import prompt_builder
+
+    mock_response = MagicMock()
+    mock_response.choices[0].message.content = json.dumps({"steps": ["One", "Two", "Three", "Four", "Five"]})
+    mock_create.return_value = mock_response
+
+    result = json.loads(nlp_engine.generate_ai_resolution("Screen is totally off.", [
+        {"description": "My screen is black", "resolution_text": "Check monitor power"}
+    ]))
+    kwargs = mock_create.call_args.kwargs
+    assert result == ["One", "Two", "Three", "Four", "Five"]
+    assert kwargs["response_format"] == {"type": "json_object"}
+    assert kwargs["max_tokens"] == prompt_builder.PROMPT_MAX_OUTPUT_TOKENS < 1024
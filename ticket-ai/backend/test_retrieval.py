@@ -0,0 +1,127 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+MAX_STALENESS = 1.0
+
+def test_index_delta_replaces_and_removes_rows():
+    """Test that applying a delta masks replaced rows and appends the new version."""
+    # Imported here so spawned workers can configure the environment before the app modules load
+    import retrieval
+
+    index = retrieval.RetrievalIndex().build([
+        {"id": 1, "description": "VPN keeps dropping", "resolution_text": "Switched VPN protocol to TCP"},
+        {"id": 2, "description": "Printer offline", "resolution_text": "Restarted print spooler"},
+    ])
+    updated = index.with_changes(
+        [{"id": 1, "description": "VPN keeps dropping", "resolution_text": "Reinstalled the VPN client"}],
+        removed_ids=[2]
+    )
+
+    assert len(index) == 2
+    assert len(updated) == 1
+    assert updated.search("vpn dropping")[0][1]["resolution_text"] == "Reinstalled the VPN client"
+    assert updated.search("printer spooler") == [] or updated.search("printer spooler")[0][1]["id"] == 1
+
+def test_index_keeps_a_compact_corpus():
+    """Test that the index stores text in packed blocks and a float32/int32 matrix, and still returns plain records."""
+    import numpy as np
+    import corpus, retrieval
+
+    index = retrieval.RetrievalIndex().build([
+        {"id": 7, "description": "Écran noir après mise à jour", "resolution_text": "Rolled back the display driver"},
+        {"id": 8, "description": None, "resolution_text": "Restarted print spooler"},
+    ])
+    assert isinstance(index.records, corpus.CorpusStore)
+    assert index.matrix.dtype == np.float32 and index.matrix.indices.dtype == np.int32
+    assert index.vectorizer.stop_words_ is None
+    assert index.search("display driver")[0][1] == {
+        "id": 7, "description": "Écran noir après mise à jour", "resolution_text": "Rolled back the display driver"
+    }
+    assert index.records[1]["description"] == ""
+
+    # Enough deltas to force the blocks to be merged
+    for ticket_id in range(9, 9 + corpus.MAX_BLOCKS + 1):
+        index = index.with_changes([{"id": ticket_id, "description": "Printer offline", "resolution_text": f"Fix {ticket_id}"}])
+    assert len(index.records.blocks) < corpus.MAX_BLOCKS
+    assert [r["id"] for r in index.latest(2)] == [25, 24]
+    index = index.with_changes([], removed_ids=[7])
+    assert 7 in index and len(index) == len(index.records) - 1
+    assert index.search("display driver") == [] or index.search("display driver")[0][1]["id"] != 7
+
+def _configure(db_path):
+    # Runs in a fresh (spawned) process before anything touches the database module
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["INDEX_MAX_STALENESS_SECONDS"] = str(MAX_STALENESS)
+    os.environ.setdefault("GROQ_API_KEY", "test-key")
+
+def _add_resolved_tickets(db_path, pairs):
+    _configure(db_path)
+    import models, retrieval
+    from database import SessionLocal, Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        for description, resolution_text in pairs:
+            ticket = models.Ticket(description=description, category=models.CategoryEnum.Application, status=models.StatusEnum.Resolved)
+            db.add(ticket)
+            db.flush()
+            db.add(models.Resolution(ticket_id=ticket.id, resolution_text=resolution_text))
+            retrieval.record_change(db, ticket.id)
+            db.commit()
+    finally:
+        db.close()
+
+def _reader(db_path, ready, results):
+    # A separate "worker": builds its own index, then polls until another process's write shows up
+    _configure(db_path)
+    import retrieval
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        retrieval.get_index(db)
+        ready.put(True)
+        deadline = time.monotonic() + 10 * MAX_STALENESS
+        while time.monotonic() < deadline:
+            matches = retrieval.get_index(db).search("flux capacitor overheating")
+            if matches and matches[0][1]["resolution_text"] == "Recalibrated the flux capacitor":
+                results.put(time.monotonic())
+                return
+            db.rollback()
+            time.sleep(0.05)
+        results.put(None)
+    finally:
+        db.close()
+
+def test_workers_pick_up_other_workers_writes():
+    """Test that separate processes converge on another process's write within the staleness bound."""
+    ctx = multiprocessing.get_context("spawn")
+    db_path = os.path.join(tempfile.mkdtemp(prefix="ticket-ai-index-"), "index.db")
+    seed = [("Outlook crashes at launch", "Repaired the Office installation"), ("VPN drops every hour", "Switched VPN protocol to TCP")]
+    setup = ctx.Process(target=_add_resolved_tickets, args=(db_path, seed * 10))
+    setup.start()
+    setup.join()
+    assert setup.exitcode == 0
+
+    ready, results = ctx.Queue(), ctx.Queue()
+    readers = [ctx.Process(target=_reader, args=(db_path, ready, results)) for _ in range(2)]
+    for proc in readers:
+        proc.start()
+    for _ in readers:
+        ready.get(timeout=60)
+
+    writer = ctx.Process(target=_add_resolved_tickets, args=(db_path, [("Flux capacitor overheating", "Recalibrated the flux capacitor")]))
+    writer.start()
+    writer.join()
+    written_at = time.monotonic()
+
+    seen_at = [results.get(timeout=60) for _ in readers]
+    for proc in readers:
+        proc.join()
+
+    assert all(t is not None for t in seen_at), seen_at
+    # Allow some slack for the reader's own poll interval and query time
+    assert all(t - written_at <= MAX_STALENESS + 1.0 for t in seen_at), [t - written_at for t in seen_at]
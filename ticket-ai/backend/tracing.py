@@ -0,0 +1,296 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+
+from fastapi.routing import APIRoute
+
+import metrics
+
+# Request tracing with W3C trace context. The Streamlit frontend starts a trace per user
+# action and sends a `traceparent` header; the API continues that trace (or starts one,
+# for TRACE_SAMPLE_RATE of requests without a header) and records spans for the
+# request, the route handler, auth, each SQL statement (engine events in database.py),
+# retrieval, prompt building, the LLM queue and the Groq call.
+#
+# Sampling is decided once, at the root, and follows the traceparent flags downstream,
+# so a trace is either complete or absent. Unsampled requests create no span objects.
+# Inbound sampled flags are only honored while tracing is on (TRACE_SAMPLE_RATE > 0,
+# or TRACE_TRUST_PARENT=1 to trace just what the frontend samples); otherwise any
+# client could make the API write spans for every statement it runs.
+# Finished spans are exported as JSON objects, one per line, by a background thread:
+#   TRACE_EXPORT=file:traces.jsonl           append to a local file (default), moved
+#                                            to traces.jsonl.1 at TRACE_FILE_MAX_BYTES
+#   TRACE_EXPORT=http://127.0.0.1:4319/spans POST batches to a collector, e.g.
+#                                            benchmarks/trace_collector.py
+# See summarize() / benchmarks/trace_collector.py for a per-request breakdown.
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_TRUST_PARENT = os.getenv("TRACE_TRUST_PARENT", "0") == "1"
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "file:traces.jsonl")
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(100 * 1024 * 1024)))
+EXPORT_QUEUE_SIZE = 10000
+EXPORT_BATCH_SIZE = 512
+# SQL text is kept short and never includes parameters
+MAX_STATEMENT_CHARS = 300
+
+_current = contextvars.ContextVar("trace_span", default=None)
+
+def _new_id(nbytes):
+    return f"{random.getrandbits(nbytes * 8):0{nbytes * 2}x}"
+
+def parse_traceparent(header):
+    # "00-<32 hex trace id>-<16 hex parent id>-<2 hex flags>"; None when malformed
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start_ns", "_t0", "status")
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self._t0 = time.perf_counter_ns()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error):
+        self.status = "error"
+        self.attributes["error"] = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        _exporter.submit({
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "name": self.name, "start_ns": self.start_ns,
+            "duration_ms": round((time.perf_counter_ns() - self._t0) / 1e6, 3),
+            "status": self.status, "attributes": self.attributes,
+        })
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+def current():
+    return _current.get()
+
+def start_trace(name, traceparent=None, **attributes):
+    # Root span for a request or a background run; None when this trace isn't sampled
+    parent = parse_traceparent(traceparent) if TRACE_SAMPLE_RATE > 0 or TRACE_TRUST_PARENT else None
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id, sampled = _new_id(16), None, random.random() < TRACE_SAMPLE_RATE
+    if not sampled:
+        return None
+    return Span(name, trace_id, parent_id, attributes)
+
+def start_span(name, **attributes):
+    # Child of the current span, without making it current (for leaf spans such as SQL
+    # statements that start and end in different callbacks); None when not tracing
+    parent = _current.get()
+    if parent is None:
+        return None
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    # Yields the span (or None when the request isn't traced) so callers can add attributes
+    child = start_span(name, **attributes)
+    if child is None:
+        yield None
+        return
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.fail(e)
+        raise
+    finally:
+        _current.reset(token)
+        child.end()
+
+class TracingMiddleware:
+    # Plain ASGI middleware (not BaseHTTPMiddleware) so streamed responses pass through
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        root = start_trace(
+            f"{scope['method']} {scope['path']}", headers.get(b"traceparent", b"").decode("latin-1"),
+            **{"http.method": scope["method"], "http.target": scope["path"]}
+        )
+        if root is None:
+            return await self.app(scope, receive, send)
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                root.set(**{"http.status_code": message["status"]})
+                message["headers"] = list(message.get("headers") or []) + [(b"x-trace-id", root.trace_id.encode())]
+            await send(message)
+
+        token = _current.set(root)
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        except BaseException as e:
+            root.fail(e)
+            raise
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            if route is not None and getattr(route, "path", None):
+                root.name = f"{scope['method']} {route.path}"
+            root.end()
+
+class TracedRoute(APIRoute):
+    # route_class for the routers: a span around each handler, below the request span
+    # (so dependency and serialization time show up as the difference)
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _traced_handler(endpoint), **kwargs)
+
+def _traced_handler(endpoint):
+    name = f"handler {endpoint.__module__.rsplit('.', 1)[-1]}.{endpoint.__name__}"
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await endpoint(*args, **kwargs)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return endpoint(*args, **kwargs)
+    return wrapper
+
+# SQLAlchemy engine event handlers, registered in database.py
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is None or context is None:
+        return
+    context._trace_span = start_span("sql", statement=" ".join(statement.split())[:MAX_STATEMENT_CHARS], executemany=executemany)
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    sql_span = getattr(context, "_trace_span", None)
+    if sql_span is not None:
+        context._trace_span = None
+        if cursor.rowcount is not None and cursor.rowcount >= 0:
+            sql_span.set(rows=cursor.rowcount)
+        sql_span.end()
+
+def handle_error(exception_context):
+    sql_span = getattr(exception_context.execution_context, "_trace_span", None)
+    if sql_span is not None:
+        exception_context.execution_context._trace_span = None
+        sql_span.fail(exception_context.original_exception)
+        sql_span.end()
+
+class _Exporter:
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=EXPORT_QUEUE_SIZE)
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, record):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+                    self.thread.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("tracing.spans_dropped")
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < EXPORT_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+                metrics.inc("tracing.spans_exported", len(batch))
+            except Exception as e:
+                metrics.inc("tracing.export_errors")
+                print(f"Trace export failed: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write(self, batch):
+        if TRACE_EXPORT.startswith(("http://", "https://")):
+            request = urllib.request.Request(
+                TRACE_EXPORT, data=json.dumps(batch).encode(), headers={"Content-Type": "application/json"}
+            )
+            urllib.request.urlopen(request, timeout=5).close()
+        else:
+            path = TRACE_EXPORT[len("file:"):] if TRACE_EXPORT.startswith("file:") else TRACE_EXPORT
+            if os.path.exists(path) and os.path.getsize(path) >= TRACE_FILE_MAX_BYTES:
+                # Keep one previous file, so at most about twice the limit is on disk
+                os.replace(path, path + ".1")
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(record) + "\n" for record in batch))
+
+    def flush(self):
+        self.queue.join()
+
+_exporter = _Exporter()
+
+def flush():
+    # Blocks until every finished span has been written (tests, CLI tools)
+    _exporter.flush()
+
+def summarize(spans):
+    # Per trace: root span, total duration, and the time spent in each kind of span
+    # (self time: a span's duration minus its children's), slowest traces first
+    by_trace = defaultdict(list)
+    for s in spans:
+        by_trace[s["trace_id"]].append(s)
+    traces = []
+    for trace_id, members in by_trace.items():
+        ids = {s["span_id"] for s in members}
+        child_time = defaultdict(float)
+        for s in members:
+            if s["parent_id"] in ids:
+                child_time[s["parent_id"]] += s["duration_ms"]
+        roots = [s for s in members if s["parent_id"] not in ids]
+        root = max(roots, key=lambda s: s["duration_ms"])
+        breakdown = defaultdict(float)
+        for s in members:
+            kind = s["name"].split(" ", 1)[0] if s["name"].startswith(("handler ", "sql")) else s["name"]
+            breakdown[kind] += max(s["duration_ms"] - child_time[s["span_id"]], 0.0)
+        traces.append({
+            "trace_id": trace_id,
+            "root": root["name"],
+            "duration_ms": round(root["duration_ms"], 2),
+            "spans": len(members),
+            "self_time_ms": {k: round(v, 2) for k, v in sorted(breakdown.items(), key=lambda kv: -kv[1])},
+        })
+    return sorted(traces, key=lambda t: -t["duration_ms"])
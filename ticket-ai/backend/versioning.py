@@ -0,0 +1,48 @@
+from fastapi import Response
+
+import models
+from database import insert_ignore
+
+# Cheap change detection for the ticket list endpoints. Every write that touches a
+# ticket or its resolution bumps the global counter and the owner's counter in the
+# same transaction, so a list ETag can be computed from a single primary-key lookup
+# without loading any ticket rows.
+
+GLOBAL_SCOPE = "global"
+
+def user_scope(user_id):
+    return f"user:{user_id}"
+
+def bump(db, *user_ids):
+    bump_scopes(db, [GLOBAL_SCOPE] + sorted({user_scope(uid) for uid in user_ids if uid is not None}))
+
+def bump_scopes(db, scopes, amount=1):
+    table = models.ListVersion.__table__
+    insert_ignore(db, table, [{"scope": scope, "version": 0} for scope in scopes])
+    db.query(models.ListVersion).filter(models.ListVersion.scope.in_(scopes)).update(
+        {models.ListVersion.version: models.ListVersion.version + amount},
+        synchronize_session=False
+    )
+
+def current(db, scope):
+    version = db.query(models.ListVersion.version).filter(models.ListVersion.scope == scope).scalar()
+    return version or 0
+
+def etag(scope, variant, version):
+    # Strong validator: the version only moves when the serialized list can change
+    return f'"{scope}:{variant}:v{version}"'
+
+def etag_for(db, scope, variant="full"):
+    return etag(scope, variant, current(db, scope))
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so ignore any W/ prefix the client sends back
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+def not_modified(etag):
+    return Response(status_code=304, headers={"ETag": etag})
@@ -0,0 +1,56 @@
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+import metrics
+from database import SessionLocal
+
+# Optional startup warm-up and the readiness check behind GET /ready. The API imports
+# no ML libraries at startup, so a new worker can answer /login right away; with
+# WARMUP_ON_STARTUP=1 it loads them in the background, builds the retrieval and
+# near-duplicate indexes and creates the Groq client, and only reports ready once that
+# is done, so the first ticket raised on a fresh worker doesn't pay for it.
+# GET / stays the liveness check.
+
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "0") == "1"
+
+_warm = threading.Event()
+
+def warm_up():
+    import retrieval, dedup, nlp_engine
+
+    db = SessionLocal()
+    try:
+        retrieval.warm(db)
+        dedup.get_index(db)
+        nlp_engine.get_client()
+    finally:
+        db.close()
+
+def _run():
+    start = time.perf_counter()
+    try:
+        warm_up()
+    except Exception as e:
+        # Indexes are still built lazily on first use, so don't keep the worker out of rotation
+        print(f"Warm-up failed: {e}")
+    finally:
+        metrics.observe("startup.warmup", time.perf_counter() - start)
+        _warm.set()
+
+def start():
+    if not WARMUP_ON_STARTUP:
+        _warm.set()
+        return
+    threading.Thread(target=_run, name="warmup", daemon=True).start()
+
+def readiness(db):
+    # Schema is managed by migrate.py, so "database" also means "migrated"
+    try:
+        db.execute(text("SELECT 1 FROM tickets LIMIT 1"))
+        database_ok = True
+    except Exception:
+        database_ok = False
+    return {"database": database_ok, "warm": _warm.is_set()}
@@ -5,8 +5,21 @@ import datetime
 from datetime import timedelta
 import plotly.express as px
 import os
+import json
+import threading
+import time
+import random
+import uuid
+from contextlib import contextmanager
 
 API_URL = os.environ.get("BACKEND_URL", "http://127.0.0.1:8000")
+# Same settings as the API's tracing (backend/tracing.py): share of user actions traced,
+# and where finished spans go (file:<path> or a collector URL)
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))
+TRACE_EXPORT = os.environ.get("TRACE_EXPORT", "file:traces.jsonl")
+# Ticket submission can wait for an LLM call; retries reuse the same Idempotency-Key
+SUBMIT_TIMEOUT_SECONDS = 90
+SUBMIT_ATTEMPTS = 3
 
 # Initialize session state
 if "token" not in st.session_state:
@@ -19,7 +32,136 @@ if "new_ticket_data" not in st.session_state:
     st.session_state.new_ticket_data = None
 
 def get_headers():
-    return {"Authorization": f"Bearer {st.session_state.token}"}
+    headers = {"Authorization": f"Bearer {st.session_state.token}"}
+    span = st.session_state.get("trace")
+    if span:
+        # W3C trace context: the API continues this trace
+        headers["traceparent"] = f"00-{span['trace_id']}-{span['span_id']}-01"
+    return headers
+
+def post_once(url, payload):
+    # POST with an Idempotency-Key that stays the same for this url and payload until a
+    # response arrives, so timeouts, connection errors and a second click on the same
+    # form get the first request's result instead of creating another ticket
+    keys = st.session_state.setdefault("idempotency_keys", {})
+    marker = json.dumps([url, payload], sort_keys=True)
+    key = keys.setdefault(marker, str(uuid.uuid4()))
+    headers = {**get_headers(), "Idempotency-Key": key}
+    for attempt in range(SUBMIT_ATTEMPTS):
+        last = attempt == SUBMIT_ATTEMPTS - 1
+        try:
+            res = requests.post(url, json=payload, headers=headers, timeout=SUBMIT_TIMEOUT_SECONDS)
+        except (requests.ConnectionError, requests.Timeout):
+            if last:
+                raise
+            time.sleep(2 ** attempt)
+            continue
+        if res.status_code == 409 and not last:
+            # The first attempt is still running on the server
+            time.sleep(int(res.headers.get("Retry-After", "1")))
+            continue
+        if res.status_code < 500:
+            keys.pop(marker, None)
+        return res
+
+def export_span(span):
+    line = json.dumps(span)
+    try:
+        if TRACE_EXPORT.startswith(("http://", "https://")):
+            requests.post(TRACE_EXPORT, data=f"[{line}]", headers={"Content-Type": "application/json"}, timeout=2)
+        else:
+            with open(TRACE_EXPORT.removeprefix("file:"), "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except (OSError, requests.RequestException):
+        pass
+
+@contextmanager
+def traced(action):
+    # One trace per user action; the API calls made inside it carry its traceparent, so
+    # the time spent here, on the network and in each backend stage lines up in one trace
+    if random.random() >= TRACE_SAMPLE_RATE:
+        yield
+        return
+    span = {
+        "trace_id": f"{random.getrandbits(128):032x}", "span_id": f"{random.getrandbits(64):016x}",
+        "parent_id": None, "name": f"frontend {action}", "start_ns": time.time_ns(),
+        "status": "ok", "attributes": {"user_id": st.session_state.user_id},
+    }
+    st.session_state.trace = span
+    start = time.perf_counter()
+    try:
+        yield
+    except requests.RequestException as e:
+        span["status"] = "error"
+        span["attributes"]["error"] = str(e)
+        raise
+    finally:
+        # Also reached through st.rerun(), which unwinds with an exception of its own
+        st.session_state.trace = None
+        span["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        export_span(span)
+
+def get_json_cached(url):
+    # Conditional GET: send back the ETag from the last poll so an unchanged list
+    # comes back as an empty 304 and we reuse the copy kept in session state.
+    cache = st.session_state.setdefault("etag_cache", {})
+    headers = get_headers()
+    if url in cache:
+        headers["If-None-Match"] = cache[url][0]
+    res = requests.get(url, headers=headers)
+    if res.status_code == 304 and url in cache:
+        return 200, cache[url][1]
+    if res.status_code != 200:
+        return res.status_code, None
+    data = res.json()
+    if res.headers.get("ETag"):
+        cache[url] = (res.headers["ETag"], data)
+    return 200, data
+
+def live_tickets():
+    # One background reader per session on GET /tickets/stream. Pushed tickets are merged
+    # into a plain dict (threads can't touch st.session_state); the ticket list itself is
+    # only fetched again after a (re)connect or when the server asks for a resync.
+    live = st.session_state.get("live")
+    if live and live["token"] == st.session_state.token and live["thread"].is_alive():
+        return live
+
+    live = {"token": st.session_state.token, "tickets": None, "resync": True, "dirty": False, "stop": False, "lock": threading.Lock()}
+
+    def read_stream():
+        while not live["stop"]:
+            try:
+                with requests.get(f"{API_URL}/tickets/stream", headers={"Authorization": f"Bearer {live['token']}"}, stream=True, timeout=(5, 60)) as r:
+                    if r.status_code != 200:
+                        return
+                    live["resync"] = True
+                    for line in r.iter_lines(decode_unicode=True):
+                        if live["stop"]:
+                            return
+                        if not line or not line.startswith("data: "):
+                            continue
+                        msg = json.loads(line[len("data: "):])
+                        with live["lock"]:
+                            if msg["type"] == "ticket" and live["tickets"] is not None:
+                                live["tickets"][msg["ticket"]["id"]] = msg["ticket"]
+                            else:
+                                live["resync"] = True
+                            live["dirty"] = True
+            except requests.RequestException:
+                time.sleep(3)
+
+    live["thread"] = threading.Thread(target=read_stream, daemon=True)
+    live["thread"].start()
+    st.session_state.live = live
+    return live
+
+@st.fragment(run_every=3)
+def rerun_on_push():
+    # Cheap local check: reruns the page only when the stream delivered something
+    live = st.session_state.get("live")
+    if live and live["dirty"]:
+        live["dirty"] = False
+        st.rerun()
 
 # --- PAGE FUNCTIONS ---
 
@@ -81,6 +223,10 @@ def logout_page():
         st.session_state.role = None
         st.session_state.user_id = None
         st.session_state.email = None
+        st.session_state.etag_cache = {}
+        if st.session_state.get("live"):
+            st.session_state.live["stop"] = True
+            st.session_state.pop("live")
         st.rerun()
 
 def raise_ticket_page():
@@ -97,13 +243,18 @@ def raise_ticket_page():
                 return
                 
             payload = {"description": desc, "category": cat, "priority": prio}
-            res = requests.post(f"{API_URL}/tickets/", json=payload, headers=get_headers())
-            
-            if res.status_code == 200:
-                st.session_state.new_ticket_data = res.json()
-                st.rerun()
-            else:
-                st.error("Error creating ticket.")
+            with traced("submit_ticket"):
+                try:
+                    res = post_once(f"{API_URL}/tickets/", payload)
+                except requests.RequestException:
+                    st.error("Could not reach the server. Submit again to retry; no duplicate ticket will be created.")
+                    return
+
+                if res.status_code == 200:
+                    st.session_state.new_ticket_data = res.json()
+                    st.rerun()
+                else:
+                    st.error("Error creating ticket.")
     
     else:
         # Display the AI suggestions for the newly created ticket
@@ -131,7 +282,8 @@ def raise_ticket_page():
             with col1:
                 if st.button(f"✅ Yes, mark ticket #{data['ticket']['id']} as Resolved!", key=f"resolve_ai"):
                     if selected_fix != "None yet":
-                        requests.put(f"{API_URL}/tickets/{data['ticket']['id']}/resolve?resolution_text=Selected AI Fix: {selected_fix}", headers=get_headers())
+                        with traced("resolve_with_ai_fix"):
+                            requests.put(f"{API_URL}/tickets/{data['ticket']['id']}/resolve?resolution_text=Selected AI Fix: {selected_fix}", headers=get_headers())
                         st.success("Ticket resolved successfully using AI suggestion! View it in Track Tickets.")
                         st.session_state.new_ticket_data = None
                         st.rerun()
@@ -139,7 +291,8 @@ def raise_ticket_page():
                         st.warning("Please select a specific point before resolving, or hit escalate.")
             with col2:
                 if st.button(f"🚨 No, Escalate Issue", key=f"esc_ai"):
-                    requests.put(f"{API_URL}/tickets/{data['ticket']['id']}/escalate", headers=get_headers())
+                    with traced("escalate"):
+                        requests.put(f"{API_URL}/tickets/{data['ticket']['id']}/escalate", headers=get_headers())
                     st.success("Ticket escalated to Admin & Data Engineer. View it in Track Tickets.")
                     st.session_state.new_ticket_data = None
                     st.rerun()
@@ -150,9 +303,20 @@ def raise_ticket_page():
 
 def track_tickets_page():
     st.subheader("Ticket History")
-    res = requests.get(f"{API_URL}/tickets/user/{st.session_state.user_id}", headers=get_headers())
-    if res.status_code == 200:
-        tickets = res.json()
+    # Status changes and new resolutions are pushed over the event stream instead of
+    # refetching the whole list on every rerun
+    live = live_tickets()
+    status_code = 200
+    if live["resync"] or live["tickets"] is None:
+        status_code, fetched = get_json_cached(f"{API_URL}/tickets/user/{st.session_state.user_id}")
+        if status_code == 200:
+            with live["lock"]:
+                live["tickets"] = {t["id"]: t for t in fetched}
+                live["resync"] = False
+    with live["lock"]:
+        tickets = sorted((live["tickets"] or {}).values(), key=lambda t: t["id"])
+    rerun_on_push()
+    if status_code == 200:
         if not tickets:
             st.write("No tickets requested.")
         else:
@@ -185,31 +349,32 @@ def track_tickets_page():
                             if st.button("Mark as Resolved", key=f"mark_{tkt['id']}"):
                                 if final_res and final_res != "Selected AI Fix: Other (Type Below)":
                                     requests.put(f"{API_URL}/tickets/{tkt['id']}/resolve?resolution_text={final_res}", headers=get_headers())
+                                    live["resync"] = True
                                     st.rerun()
                         with colB:
                             st.write("")
                             st.write("")
                             if st.button("🚨 Escalate Issue (Not Resolved)", key=f"esc_{tkt['id']}"):
                                 requests.put(f"{API_URL}/tickets/{tkt['id']}/escalate", headers=get_headers())
+                                live["resync"] = True
                                 st.success("Ticket escalated successfully. An admin/data engineer will review it shortly.")
                                 st.rerun()
                     
+                    if tkt.get("escalated_at"):
+                        st.error(f"**Escalated** ({tkt['escalation_count']}x, last on {tkt['escalated_at'][:16].replace('T', ' ')}): an admin/data engineer will review this ticket.")
                     if tkt.get("resolution"):
                         res_txt = tkt['resolution']['resolution_text']
-                        if "[ESCALATED]" in res_txt:
-                            st.error(f"**Action Required / Escalation Notes:**\n\n {res_txt}")
-                        else:
-                            try:
-                                import json
-                                parsed = json.loads(res_txt)
-                                if isinstance(parsed, list):
-                                    st.info("**AI Suggested Fixes (Awaiting Resolution):**")
-                                    for i, s in enumerate(parsed):
-                                        st.write(f"{i+1}. {s}")
-                                else:
-                                    st.success(f"**Resolution Notes:** {res_txt}")
-                            except:
+                        try:
+                            import json
+                            parsed = json.loads(res_txt)
+                            if isinstance(parsed, list):
+                                st.info("**AI Suggested Fixes (Awaiting Resolution):**")
+                                for i, s in enumerate(parsed):
+                                    st.write(f"{i+1}. {s}")
+                            else:
                                 st.success(f"**Resolution Notes:** {res_txt}")
+                        except:
+                            st.success(f"**Resolution Notes:** {res_txt}")
     else:
         st.error("Error fetching tickets.")
 
@@ -235,6 +400,8 @@ def admin_dashboard_page():
             
         with f_col2:
             time_filter = st.selectbox("Time Range", ["All Time", "Last Hour", "Last 24 Hours", "Last 30 Days"])
+
+        search_q = st.text_input("Search descriptions & resolutions", placeholder="e.g. printer jam, vpn*")
             
     with colB:
         st.write("#### ➕ Quick Actions")
@@ -249,15 +416,15 @@ def admin_dashboard_page():
                 if st.button("Create Ticket", use_container_width=True):
                     uid = int(sel_u.split(":")[0])
                     payload = {"description": desc, "category": cat, "priority": prio}
-                    requests.post(f"{API_URL}/admin/tickets?user_id={uid}", json=payload, headers=get_headers())
+                    post_once(f"{API_URL}/admin/tickets?user_id={uid}", payload)
                     st.success("Ticket generated!")
                     st.rerun()
 
     st.divider()
 
-    res = requests.get(f"{API_URL}/admin/tickets", headers=get_headers())
-    if res.status_code == 200:
-        tickets = res.json()
+    # The table only needs the summary columns; full text is fetched per selected ticket
+    status_code, tickets = get_json_cached(f"{API_URL}/admin/tickets?fields=summary")
+    if status_code == 200:
         if tickets:
             df = pd.DataFrame(tickets)
             df['created_date'] = pd.to_datetime(df['created_date'])
@@ -267,6 +434,12 @@ def admin_dashboard_page():
                 sel_id = int(selected_user.split(":")[0])
                 df = df[df['user_id'] == sel_id]
                 
+            # Apply full-text search (ranked server-side)
+            if search_q:
+                search_r = requests.get(f"{API_URL}/admin/tickets/search", params={"q": search_q, "limit": 500}, headers=get_headers())
+                hit_ids = [h['id'] for h in search_r.json()] if search_r.status_code == 200 else []
+                df = df[df['id'].isin(hit_ids)]
+
             # Apply time filter
             now = pd.to_datetime(datetime.datetime.utcnow())
             if time_filter == "Last Hour":
@@ -286,6 +459,40 @@ def admin_dashboard_page():
                     use_container_width=True
                 )
             
+            st.write("---")
+            st.write("### 📦 Bulk Actions")
+            bulk_ids = st.multiselect("Select Tickets", sorted(df['id'].tolist(), reverse=True), key="bulk_ids")
+            b_col1, b_col2 = st.columns(2)
+            with b_col1:
+                bulk_action = st.selectbox("Action", ["Change Status", "Resolve", "Escalate"], key="bulk_action")
+            bulk_body = {"ids": bulk_ids}
+            with b_col2:
+                if bulk_action == "Change Status":
+                    bulk_body.update(action="status", status=st.selectbox("New Status", ["Open", "In Progress", "Resolved", "Closed"], key="bulk_status"))
+                elif bulk_action == "Resolve":
+                    bulk_body.update(action="resolve", resolution_text=st.text_input("Resolution Notes", key="bulk_res"))
+                else:
+                    bulk_body.update(action="escalate")
+
+            p_col, a_col = st.columns([1, 4])
+            with p_col:
+                preview = st.button("Preview", disabled=not bulk_ids)
+            with a_col:
+                apply_bulk = st.button(f"Apply to {len(bulk_ids)} Tickets", disabled=not bulk_ids)
+            if preview or apply_bulk:
+                bulk_r = requests.post(f"{API_URL}/admin/tickets/bulk", json={**bulk_body, "dry_run": preview}, headers=get_headers())
+                if bulk_r.status_code == 200:
+                    result = bulk_r.json()
+                    skipped = [o for o in result['outcomes'] if o['outcome'] in ("skipped", "not_found")]
+                    if preview:
+                        st.info(f"{result['matched'] - len(skipped)} of {len(bulk_ids)} tickets would be updated.")
+                    else:
+                        st.success(f"Updated {result['updated']} tickets.")
+                    if skipped:
+                        st.dataframe(pd.DataFrame(skipped), use_container_width=True)
+                else:
+                    st.error(bulk_r.json().get('detail', 'Bulk update failed'))
+
             st.write("---")
             st.write("### 🛠️ Manage Specific Ticket")
             
@@ -296,8 +503,9 @@ def admin_dashboard_page():
             if selected_ticket_str:
                 selected_id = int(selected_ticket_str.replace("#", "").split(" - ")[0])
                 
-                # Find the ticket object
-                tkt = next((t for t in tickets if t['id'] == selected_id), None)
+                # Load the full ticket (description + resolution) on demand
+                detail_r = requests.get(f"{API_URL}/tickets/{selected_id}", headers=get_headers())
+                tkt = detail_r.json() if detail_r.status_code == 200 else None
                 if tkt:
                     st.write(f"**Description:** {tkt['description']}")
                     
@@ -314,15 +522,32 @@ def admin_dashboard_page():
                         except:
                             pass
                             
-                    if "[ESCALATED]" in current_res_text:
-                        st.error(f"**Escalation Notes:**\n\n {current_res_text}")
-                    elif options:
+                    if tkt.get("escalated_at"):
+                        st.error(f"**Escalated {tkt['escalation_count']}x** by the user, last on {tkt['escalated_at'][:16].replace('T', ' ')}.")
+                    if options:
                         st.info("**AI Suggested Fixes Available:**")
                         for i, s in enumerate(options):
                             st.write(f"{i+1}. {s}")
                     elif current_res_text:
                         st.success(f"**Current Resolution Notes:** {current_res_text}")
                     
+                    with st.expander("Ticket History"):
+                        # Newest first, one page at a time
+                        before_key = f"history_before_{selected_id}"
+                        params = {"limit": 20}
+                        if st.session_state.get(before_key):
+                            params["before"] = st.session_state[before_key]
+                        events_r = requests.get(f"{API_URL}/tickets/{selected_id}/events", params=params, headers=get_headers())
+                        page = events_r.json() if events_r.status_code == 200 else []
+                        for ev in page:
+                            st.write(f"`{ev['created_at'][:16].replace('T', ' ')}` **{ev['type']}** {ev['payload'].get('text', '') or ''}")
+                        if len(page) == params["limit"] and st.button("Older events"):
+                            st.session_state[before_key] = page[-1]["id"]
+                            st.rerun()
+                        if st.session_state.get(before_key) and st.button("Back to latest"):
+                            st.session_state.pop(before_key)
+                            st.rerun()
+
                     st.write("#### Update Status & Resolution")
                     new_status = st.selectbox("Update Status", ["Open", "In Progress", "Resolved", "Closed"], index=["Open", "In Progress", "Resolved", "Closed"].index(tkt['status']) if tkt['status'] in ["Open", "In Progress", "Resolved", "Closed"] else 0)
                     
@@ -368,7 +593,7 @@ def admin_dashboard_page():
 
 def admin_analytics_page():
     st.subheader("Admin Analytics Dashboard")
-    res = requests.get(f"{API_URL}/admin/tickets", headers=get_headers())
+    status_code, all_tickets = get_json_cached(f"{API_URL}/admin/tickets?fields=summary")
     res_analytics = requests.get(f"{API_URL}/admin/analytics", headers=get_headers())
     
     st.markdown("""
@@ -399,8 +624,8 @@ def admin_analytics_page():
     # Defaults
     escalation_rate = "0.0%"
     total_tickets_month = 0
-    if res.status_code == 200 and res.json():
-        df_all = pd.DataFrame(res.json())
+    if status_code == 200 and all_tickets:
+        df_all = pd.DataFrame(all_tickets)
         df_all['created_date'] = pd.to_datetime(df_all['created_date'])
         
         # Calculate escalated
@@ -425,8 +650,8 @@ def admin_analytics_page():
             
     st.write("---")
     
-    if res.status_code == 200 and res.json():
-        df = pd.DataFrame(res.json())
+    if status_code == 200 and all_tickets:
+        df = pd.DataFrame(all_tickets)
         
         c_left, c_right = st.columns([1,1])
         with c_left:
@@ -456,6 +681,46 @@ def admin_analytics_page():
     else:
         st.info("Not enough data to graph.")
 
+    st.write("### Trending Issues")
+    res_clusters = requests.get(f"{API_URL}/admin/analytics/clusters", headers=get_headers())
+    clusters = res_clusters.json().get("clusters", []) if res_clusters.status_code == 200 else []
+    if clusters:
+        st.caption(f"Computed at {res_clusters.json().get('computed_at')}")
+        st.dataframe(
+            pd.DataFrame([{"Cluster": c["cluster"], "Tickets": c["size"], "Top Terms": ", ".join(c["top_terms"])} for c in clusters]),
+            use_container_width=True
+        )
+        trend_rows = [
+            {"Date": d["day"], "Tickets": d["count"], "Cluster": ", ".join(c["top_terms"][:3])}
+            for c in clusters[:5] for d in c["daily_counts"]
+        ]
+        if trend_rows:
+            fig_trend = px.line(pd.DataFrame(trend_rows), x="Date", y="Tickets", color="Cluster", markers=True)
+            fig_trend.update_layout(plot_bgcolor='rgba(0,0,0,0)', paper_bgcolor='rgba(0,0,0,0)')
+            st.plotly_chart(fig_trend, use_container_width=True)
+    else:
+        st.info("No clustering results yet.")
+    if st.button("Recompute Trending Clusters"):
+        requests.post(f"{API_URL}/admin/analytics/clusters/run", headers=get_headers())
+        st.success("Clustering job started.")
+
+    st.write("### Incident Groups")
+    res_incidents = requests.get(f"{API_URL}/admin/incidents", headers=get_headers())
+    res_metrics = requests.get(f"{API_URL}/admin/metrics", headers=get_headers())
+    if res_metrics.status_code == 200:
+        counters = res_metrics.json().get("counters", {})
+        st.caption(f"LLM calls avoided (this worker): {counters.get('suggestions.llm_calls_avoided', 0)}")
+        paths = res_metrics.json().get("suggestion_paths", {})
+        if paths:
+            st.dataframe(
+                pd.DataFrame([{"Path": name, **stats} for name, stats in paths.items()]),
+                use_container_width=True
+            )
+    if res_incidents.status_code == 200 and res_incidents.json():
+        st.dataframe(pd.DataFrame(res_incidents.json()), use_container_width=True)
+    else:
+        st.info("No near-duplicate incidents detected.")
+
 def manage_resolutions_page():
     st.subheader("Add Official Resolutions")
     res_ticket_id = st.number_input("Enter Ticket ID to Add Resolution", min_value=1, step=1)